@@ -0,0 +1,2 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/api/__init__.py
+"""API route blueprints registered by app.py."""
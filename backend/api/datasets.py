@@ -0,0 +1,430 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/api/datasets.py
+import json
+import os
+import re
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+
+import datastore
+from datastore import DatasetError, DatasetNotFound, Overloaded
+
+datasets_bp = Blueprint('datasets', __name__, url_prefix='/api/datasets')
+
+
+@datasets_bp.errorhandler(DatasetNotFound)
+def handle_not_found(error):
+    return jsonify({"error": str(error)}), 404
+
+
+@datasets_bp.errorhandler(Overloaded)
+def handle_overloaded(error):
+    return jsonify({"error": str(error)}), 503, {"Retry-After": "2"}
+
+
+@datasets_bp.errorhandler(DatasetError)
+def handle_dataset_error(error):
+    return jsonify({"error": str(error)}), 400
+
+
+@datasets_bp.route('', methods=['GET'])
+def list_datasets():
+    return jsonify([
+        {"id": dataset.id, "name": dataset.name, "rows": dataset.row_count, "version": dataset.version}
+        for dataset in datastore.store.list()
+    ])
+
+
+@datasets_bp.route('', methods=['POST'])
+def upload_dataset():
+    """Ingest a CSV, Parquet or Excel upload (multipart ``file``) or a JSON body of ``rows``.
+
+    CSV uploads are content-addressed: re-uploading an unchanged file returns
+    the existing dataset (200, ``"reused": "content"``) without parsing it,
+    and a file that extends an earlier upload only has its new rows parsed
+    (``"reused": "prefix"``).  Parquet (``.parquet``) and Excel (``.xlsx``)
+    uploads take form fields ``columns=date,revenue`` to read only those
+    columns, ``range=date&from=2023-01&to=2024-01`` to keep a half-open range
+    and ``sheet``.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        name = request.form.get('name') or os.path.splitext(upload.filename or 'dataset')[0]
+        if os.path.splitext(upload.filename or '')[1].lower() in datastore.FILE_FORMATS:
+            dataset = datastore.read_file(upload.stream, upload.filename, name, request.form)
+            datastore.store.add(dataset)
+            return jsonify({**dataset.describe(), "reused": None}), 201
+        dataset, reused = datastore.import_csv(datastore.store, upload.stream, name)
+        return jsonify({**dataset.describe(), "reused": reused}), 200 if reused == 'content' else 201
+
+    body = request.get_json(silent=True) or {}
+    dataset = datastore.read_records(body.get('rows'), body.get('name') or 'dataset')
+    datastore.store.add(dataset)
+    return jsonify(dataset.describe()), 201
+
+
+@datasets_bp.route('/content/<digest>', methods=['GET'])
+def find_by_content(digest):
+    """Dataset holding the upload with this SHA-256, so clients can skip the upload."""
+    dataset = datastore.store.find_content(digest.lower())
+    if dataset is None:
+        raise DatasetNotFound(f"No dataset holds content '{digest}'")
+    return jsonify(dataset.describe())
+
+
+@datasets_bp.route('/query', methods=['POST'])
+def query_series():
+    """Fetch several series in one round trip.
+
+    Body: ``{"align": "x" | "index", "series": [{"dataset": id, "column":
+    "revenue", "x": "date", "transforms": {...}, "filter": "...", "start": 0,
+    "end": 100, "label": "2023"}, ...]}``.  ``transforms`` has the same shape
+    as the useChartData ``transforms`` state.
+    """
+    body = request.get_json(silent=True) or {}
+    series = body.get('series')
+    dataset_ids = {
+        spec['dataset'] for spec in series if isinstance(spec, dict) and isinstance(spec.get('dataset'), str)
+    } if isinstance(series, list) else ()
+    return _shared_json(
+        'query', dataset_ids,
+        lambda: datastore.run_batch(datastore.store, series, body.get('align', 'x')),
+        body,
+    )
+
+
+@datasets_bp.route('/thumbnails', methods=['POST'])
+def thumbnails():
+    """Gallery previews of many charts in one round trip.
+
+    Body: ``{"format": "svg" | "png", "charts": [{"id": "c1", "dataset": id,
+    "type": "line", "y": ["Rev", "COGS"], "transforms": {...}, "filter":
+    "...", "width": 160, "height": 90}, ...]}``.  Each thumbnail is cached by
+    its definition and the dataset version and comes back with a ``key``
+    that changes only when the picture does.
+    """
+    body = request.get_json(silent=True) or {}
+    charts = body.get('charts')
+    # Deleted datasets are reported per chart rather than failing the batch
+    dataset_ids = {
+        chart['dataset'] for chart in charts
+        if isinstance(chart, dict) and isinstance(chart.get('dataset'), str) and chart['dataset'] in datastore.store
+    } if isinstance(charts, list) else ()
+    return _shared_json(
+        'thumbnails', dataset_ids,
+        lambda: datastore.render_thumbnails(datastore.store, charts, body.get('format', 'svg')),
+        body,
+    )
+
+
+@datasets_bp.route('/<dataset_id>', methods=['GET'])
+def get_dataset(dataset_id):
+    return jsonify(datastore.store.get(dataset_id).describe())
+
+
+@datasets_bp.route('/<dataset_id>', methods=['DELETE'])
+def delete_dataset(dataset_id):
+    datastore.store.remove(dataset_id)
+    datastore.hub.close_dataset(dataset_id)
+    return '', 204
+
+
+@datasets_bp.route('/<dataset_id>/stats', methods=['GET'])
+def dataset_stats(dataset_id):
+    """Per-column profile; ``?columns=a,b`` limits the response."""
+    dataset = datastore.store.get(dataset_id)
+    names = _column_list(request.args.get('columns')) or list(dataset.columns)
+    return jsonify({
+        "version": dataset.version,
+        "columns": {name: dataset.column(name).stats.to_dict() for name in names},
+    })
+
+
+@datasets_bp.route('/<dataset_id>/rows', methods=['GET'])
+def dataset_rows(dataset_id):
+    """Rows ``start:end`` as records (chartData shape) or ``?orient=columns``.
+
+    ``?sort=<column>&order=ascending|descending`` mirrors the sort dropdown;
+    ``?encoding=dictionary`` sends text columns as codes plus a dictionary;
+    ``?time=<column>&from=2023-03&to=2023-07`` keeps a half-open date range
+    and ``?filter=revenue > 50000`` applies a filter expression.
+    """
+    dataset = datastore.store.get(dataset_id)
+
+    def compute():
+        start = request.args.get('start', 0, type=int)
+        end = request.args.get('end', dataset.row_count, type=int)
+        mask = _row_mask(dataset)
+        if request.args.get('time'):
+            time_mask = dataset.time_range(request.args['time'], request.args.get('from'), request.args.get('to'))
+            mask = time_mask if mask is None else mask & time_mask
+        return {
+            "version": dataset.version,
+            "start": start,
+            "data": dataset.rows(
+                start,
+                end,
+                orient=request.args.get('orient', 'records'),
+                sort_by=request.args.get('sort') or None,
+                descending=request.args.get('order') == 'descending',
+                encoding=request.args.get('encoding'),
+                mask=mask,
+            ),
+        }
+
+    return _shared_json('rows', [dataset_id], compute)
+
+
+@datasets_bp.route('/<dataset_id>/rows', methods=['POST'])
+def append_rows(dataset_id):
+    """Append ``{"rows": [{...}, ...]}`` and wake any live streams."""
+    dataset = datastore.store.get(dataset_id)
+    body = request.get_json(silent=True) or {}
+    start = dataset.append_rows(body.get('rows'))
+    datastore.hub.publish(dataset_id)
+    return jsonify({"start": start, "rows": dataset.row_count, "version": dataset.version})
+
+
+@datasets_bp.route('/<dataset_id>/stream', methods=['GET'])
+def stream_rows(dataset_id):
+    """Server-Sent Events feed of appended rows.
+
+    ``?columns=Rev,COGS&x=date&cumulative=true&window=3``; resumes after
+    ``?since=<row>`` or the browser's ``Last-Event-ID``, else starts with the
+    last ``?tail=<rows>`` rows (none by default).  Each open stream holds a
+    worker thread, so run gunicorn with threaded or async workers.
+    """
+    dataset = datastore.store.get(dataset_id)
+    columns = _column_list(request.args.get('columns')) or dataset.suggested_axes()['yAxisKeys']
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        since = None if since is None else int(since)
+    except ValueError:
+        raise DatasetError("'since' must be a row number") from None
+    tail = request.args.get('tail', type=int)
+    if tail is not None and tail < 0:
+        raise DatasetError("'tail' must be a row count")
+    subscription = datastore.hub.subscribe(
+        dataset,
+        columns,
+        x=request.args.get('x') or dataset.suggested_axes()['xAxisKey'],
+        since=since,
+        tail=tail,
+        cumulative=request.args.get('cumulative') == 'true',
+        window=request.args.get('window', type=int),
+    )
+
+    def generate():
+        try:
+            yield from subscription.events()
+        finally:
+            datastore.hub.unsubscribe(dataset_id, subscription)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@datasets_bp.route('/<dataset_id>/export.<export_format>', methods=['GET'])
+def export_dataset(dataset_id, export_format):
+    """Stream the rows as ``export.csv`` or ``export.xlsx``.
+
+    Takes the rows filters (``filter``, ``sort``/``order``, ``time``/``from``/
+    ``to``) plus ``columns``, ``y`` and JSON ``transforms`` / ``formatOptions``
+    in the useChartData / ChartContext shapes.
+    """
+    dataset = datastore.store.get(dataset_id)
+    chunks, mimetype, filename = datastore.export_rows(dataset, request.args, export_format)
+    filename = re.sub(r'[^\w.\- ]', '_', filename)
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@datasets_bp.route('/<dataset_id>/aggregate', methods=['GET'])
+def aggregate(dataset_id):
+    """Group by a text column: ``?by=region&column=revenue&agg=sum[&filter=...]``."""
+    dataset = datastore.store.get(dataset_id)
+    by = request.args.get('by')
+    if not by:
+        raise DatasetError("Missing 'by' column")
+    return _shared_json('aggregate', [dataset_id], lambda: dataset.group_by(
+        by,
+        request.args.get('column') or None,
+        request.args.get('agg', 'count'),
+        mask=_row_mask(dataset),
+    ))
+
+
+@datasets_bp.route('/<dataset_id>/pivot', methods=['POST'])
+def pivot(dataset_id):
+    """Long to wide as a new dataset: ``{"index": "date", "columns": "metric", "values": "value", "agg": "sum"}``."""
+    return _reshape('pivot', dataset_id, datastore.pivot)
+
+
+@datasets_bp.route('/<dataset_id>/unpivot', methods=['POST'])
+def unpivot(dataset_id):
+    """Wide to long as a new dataset: ``{"keep": "date", "columns": "Rev,COGS", "key": "metric"}``."""
+    return _reshape('unpivot', dataset_id, datastore.unpivot)
+
+
+@datasets_bp.route('/<dataset_id>/cells', methods=['PATCH'])
+def update_cells(dataset_id):
+    """Apply ``{"edits": [{"row": 0, "column": "revenue", "value": 1}, ...]}``."""
+    dataset = datastore.store.get(dataset_id)
+    body = request.get_json(silent=True) or {}
+    edits = body.get('edits')
+    if not isinstance(edits, list):
+        raise DatasetError("Expected a list of 'edits'")
+
+    parsed = []
+    for edit in edits:
+        try:
+            parsed.append((int(edit['row']), edit['column'], edit.get('value')))
+        except (KeyError, TypeError, ValueError):
+            raise DatasetError("Each edit needs a 'row' and a 'column'") from None
+
+    # One request is one undo step, and all of it is checked before any
+    # cell is written: a bad edit must not leave the ones before it applied
+    with dataset.step('edit cells'):
+        for row, column, _ in parsed:
+            dataset.editable_column(row, column)
+        for row, column, value in parsed:
+            dataset.set_cell(row, column, value)
+
+    return jsonify(dataset.describe())
+
+
+@datasets_bp.route('/<dataset_id>/undo', methods=['POST'])
+def undo(dataset_id):
+    """Revert the latest edit request (cells, appended rows or a column change)."""
+    dataset = datastore.store.get(dataset_id)
+    dataset.undo()
+    # Streams drop rows of an undone append or send those of a redone one
+    datastore.hub.publish(dataset_id)
+    return jsonify(dataset.describe())
+
+
+@datasets_bp.route('/<dataset_id>/redo', methods=['POST'])
+def redo(dataset_id):
+    dataset = datastore.store.get(dataset_id)
+    dataset.redo()
+    datastore.hub.publish(dataset_id)
+    return jsonify(dataset.describe())
+
+
+@datasets_bp.route('/<dataset_id>/versions', methods=['GET'])
+def list_versions(dataset_id):
+    """Undo history, oldest first; each state lists the versions that named it."""
+    dataset = datastore.store.get(dataset_id)
+    with dataset.lock:
+        return jsonify(dataset.history.to_dict())
+
+
+@datasets_bp.route('/<dataset_id>/compare', methods=['GET'])
+def compare_version(dataset_id):
+    """Changes since ``?version=N`` (or still undone up to it): cells, row count and columns."""
+    dataset = datastore.store.get(dataset_id)
+    version = request.args.get('version', type=int)
+    if version is None:
+        raise DatasetError("Missing 'version'")
+    return jsonify(dataset.compare(version))
+
+
+@datasets_bp.route('/<dataset_id>/columns', methods=['POST'])
+def add_computed_column(dataset_id):
+    """Add ``{"name": "Gross Profit", "expression": "Rev - COGS"}``, evaluated on first read."""
+    dataset = datastore.store.get(dataset_id)
+    body = request.get_json(silent=True) or {}
+    dataset.add_computed(body.get('name'), body.get('expression'))
+    return jsonify(dataset.describe()), 201
+
+
+@datasets_bp.route('/<dataset_id>/columns/<path:name>', methods=['DELETE'])
+def remove_computed_column(dataset_id, name):
+    dataset = datastore.store.get(dataset_id)
+    dataset.remove_computed(name)
+    return jsonify(dataset.describe())
+
+
+@datasets_bp.route('/<dataset_id>/resample', methods=['GET'])
+def resample(dataset_id):
+    """Bucket a date column: ``?time=date&column=revenue&unit=quarter&agg=sum[&filter=...]``."""
+    dataset = datastore.store.get(dataset_id)
+    time_column = request.args.get('time')
+    if not time_column:
+        raise DatasetError("Missing 'time' column")
+    return _shared_json('resample', [dataset_id], lambda: dataset.resample(
+        time_column,
+        request.args.get('column') or None,
+        unit=request.args.get('unit', 'month'),
+        how=request.args.get('agg', 'sum' if request.args.get('column') else 'count'),
+        mask=_row_mask(dataset),
+    ))
+
+
+@datasets_bp.route('/<dataset_id>/count', methods=['GET'])
+def count_rows(dataset_id):
+    """Number of rows matching ``?filter=...`` (all rows without one)."""
+    dataset = datastore.store.get(dataset_id)
+    mask = _row_mask(dataset)
+    return jsonify({
+        "version": dataset.version,
+        "rows": dataset.row_count if mask is None else int(mask.sum()),
+    })
+
+
+@datasets_bp.route('/<dataset_id>/trend', methods=['GET'])
+def trend(dataset_id):
+    """Trend line and forecast for a numeric column.
+
+    ``?column=revenue&x=date&method=linear|polynomial|holt-winters&horizon=6``,
+    plus ``degree``, ``unit`` (fit date buckets), ``season``, ``alpha``/``beta``/
+    ``gamma``, ``confidence``, ``points`` and ``filter``.
+    """
+    dataset = datastore.store.get(dataset_id)
+    return _shared_json('trend', [dataset_id], lambda: datastore.fit_trend(dataset, request.args))
+
+
+def _shared_json(kind, dataset_ids, compute, body=None):
+    """JSON response for ``compute()``, computed once for identical concurrent requests.
+
+    The key covers the query string, the JSON ``body`` and the current
+    version of every dataset read, so a result is only shared between
+    requests that would have produced the same bytes.  Followers also reuse
+    the serialised body.
+    """
+    versions = tuple(sorted(
+        (dataset_id, datastore.store.get(dataset_id).version) for dataset_id in dataset_ids
+        if isinstance(dataset_id, str)
+    ))
+    key = (
+        kind,
+        versions,
+        tuple(sorted(request.args.items(multi=True))),
+        None if body is None else json.dumps(body, sort_keys=True, default=str),
+    )
+    text = datastore.jobs.run(key, lambda: current_app.json.dumps(compute()))
+    return current_app.response_class(f'{text}\n', mimetype=current_app.json.mimetype)
+
+
+def _reshape(kind, dataset_id, operation):
+    """Run a pivot or unpivot as a job and add the result to the store."""
+    dataset = datastore.store.get(dataset_id)
+    body = request.get_json(silent=True) or {}
+    # Identical concurrent requests share one derived dataset
+    key = (kind, dataset.id, dataset.version, json.dumps(body, sort_keys=True, default=str))
+    derived = datastore.jobs.run(key, lambda: datastore.store.add(operation(dataset, body)))
+    return jsonify(derived.describe()), 201
+
+
+def _row_mask(dataset):
+    """Cached mask for the request's ``filter`` expression, if any."""
+    return datastore.filter_mask(dataset, request.args.get('filter'))
+
+
+def _column_list(raw):
+    return [name for name in (raw or '').split(',') if name]
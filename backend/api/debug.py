@@ -0,0 +1,67 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/api/debug.py
+from flask import Blueprint, Response, abort, jsonify, make_response, request
+
+import profiling
+
+debug_bp = Blueprint('debug', __name__, url_prefix='/api/debug')
+
+
+@debug_bp.before_request
+def require_token():
+    """Hidden unless profiling is enabled; the profile token is required."""
+    if profiling.PROFILE_TOKEN is None:
+        abort(404)
+    if not profiling.token_matches(request.headers.get('X-Profile-Token') or request.args.get('_profile_token')):
+        _abort("A valid X-Profile-Token is required", 403)
+
+
+@debug_bp.route('/profiles', methods=['GET'])
+def list_profiles():
+    """Recent request profiles of this worker, newest first."""
+    return jsonify([profile.to_dict() for profile in profiling.profiles.list()])
+
+
+@debug_bp.route('/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    return jsonify(_profile(profile_id).to_dict())
+
+
+@debug_bp.route('/profiles/<profile_id>.pstats', methods=['GET'])
+def profile_pstats(profile_id):
+    """Raw stats for ``python -m pstats`` or snakeviz."""
+    profile = _profile(profile_id, 'cprofile')
+    return Response(
+        profile.pstats_bytes(),
+        mimetype='application/octet-stream',
+        headers={'Content-Disposition': f'attachment; filename="{profile.id}.pstats"'},
+    )
+
+
+@debug_bp.route('/profiles/<profile_id>.txt', methods=['GET'])
+def profile_summary(profile_id):
+    """Top functions; ``?sort=cumulative|tottime|calls`` and ``?limit=60``."""
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'calls'):
+        _abort(f"Unknown sort '{sort}'", 400)
+    profile = _profile(profile_id, 'cprofile')
+    return Response(profile.summary(sort, request.args.get('limit', 60, type=int)), mimetype='text/plain')
+
+
+@debug_bp.route('/profiles/<profile_id>.collapsed', methods=['GET'])
+def profile_collapsed(profile_id):
+    """Collapsed stacks for flamegraph.pl or speedscope."""
+    profile = _profile(profile_id, 'sample')
+    return Response(profile.collapsed(), mimetype='text/plain')
+
+
+def _profile(profile_id, mode=None):
+    profile = profiling.profiles.get(profile_id)
+    if profile is None:
+        _abort(f"Profile '{profile_id}' not found (only the last {profiling.KEEP_PROFILES} are kept)", 404)
+    if mode is not None and profile.mode != mode:
+        _abort(f"Profile '{profile_id}' was recorded in '{profile.mode}' mode", 404)
+    return profile
+
+
+def _abort(message, status):
+    abort(make_response(jsonify({"error": message}), status))
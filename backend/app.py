@@ -1,18 +1,80 @@
 # FILE PATH: ~/Downloads/my work/bizcharts/backend/app.py
 # Replace the entire content of this file with the code below
 
-from flask import Flask, render_template, jsonify, request, send_from_directory
+import time
+
+# Taken before any other import so /api/health can report the full load time
+LOAD_STARTED = time.perf_counter()
+
+from flask import Flask, abort, render_template, jsonify, request, send_from_directory
 from flask_cors import CORS
+import gc
 import os
+import sys
 
-# Create Flask app with development-appropriate settings
-app = Flask(__name__)
+import datastore
+from api.datasets import datasets_bp
+from api.debug import debug_bp
+from profiling import ProfilingMiddleware, profiles
+from config import config
+from static_assets import load_manifest
+
+# Create Flask app with development-appropriate settings; the built frontend
+# is served by the catch-all route below, not Flask's static folder
+app = Flask(__name__, static_folder=None)
+app.config.from_object(config[os.environ.get('FLASK_CONFIG', 'default')])
 CORS(app, resources={r"/api/*": {"origins": "*"}})
+app.register_blueprint(datasets_bp)
+app.register_blueprint(debug_bp)
+# Profiles single requests on demand; inert unless BIZCHARTS_PROFILE_TOKEN is set
+app.wsgi_app = ProfilingMiddleware(app.wsgi_app, profiles)
+
+# Output of `npm run build`; without it the dev page below is served instead
+FRONTEND_BUILD = os.environ.get(
+    'FRONTEND_BUILD',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend', 'build'),
+)
+frontend = load_manifest(FRONTEND_BUILD)
+
+# Idle datasets beyond this budget are spilled to disk (see datastore/memory.py)
+datastore.store.memory.configure(app.config['MEMORY_BUDGET'], app.config['SPILL_DIR'])
+
+# Heavy subsystems (numpy, the dataset engine) load on first use, so this
+# only covers Flask and the route definitions
+STARTUP = {
+    "loadMs": round((time.perf_counter() - LOAD_STARTED) * 1000, 1),
+    "warmed": False,
+    "warmMs": None,
+}
+
+
+def warm():
+    """Load the lazily imported subsystems and freeze the heap before forking.
+
+    Called by gunicorn's preload path (see gunicorn.conf.py).  Workers forked
+    afterwards share these read-only pages instead of importing on their
+    first request, and gc.freeze() keeps the collector from touching (and so
+    copying) them.
+    """
+    started = time.perf_counter()
+    datastore.warm()
+    gc.collect()
+    gc.freeze()
+    STARTUP["warmed"] = True
+    STARTUP["warmMs"] = round((time.perf_counter() - started) * 1000, 1)
 
 
 @app.route('/api/health')
 def health_check():
-    return jsonify({"status": "ok"})
+    return jsonify({
+        "status": "ok",
+        "pid": os.getpid(),
+        "startup": STARTUP,
+        "frontend": frontend.summary() if frontend is not None else None,
+        "jobs": datastore.jobs.snapshot(),
+        "memory": datastore.store.memory.snapshot(),
+        "loadedModules": sorted(name for name in sys.modules if name.startswith('datastore.')),
+    })
 
 
 @app.route('/api/sample-data')
@@ -34,8 +96,20 @@ def sample_data():
     return jsonify(data)
 
 
+@app.route('/', defaults={'path': ''})
+@app.route('/<path:path>')
+def serve(path):
+    """Built frontend from memory (see static_assets.py), else the dev page."""
+    if path.startswith('api/'):
+        abort(404)
+    if frontend is not None:
+        return frontend.serve(path)
+    if path:
+        abort(404)
+    return dev_home()
+
+
 # For development only - serve a simple page when accessing root
-@app.route('/')
 def dev_home():
     return """
     <html>
@@ -55,13 +129,37 @@ def dev_home():
 
             <h2>Available API Endpoints:</h2>
             <div class="endpoint">
-                <p><span class="url">GET /api/health</span> - Health check endpoint</p>
+                <p><span class="url">GET /api/health</span> - Health check endpoint, with startup timings and resident vs spilled dataset memory</p>
             </div>
             <div class="endpoint">
                 <p><span class="url">GET /api/sample-data</span> - Returns sample business data</p>
             </div>
+            <div class="endpoint">
+                <p><span class="url">POST /api/datasets</span> - Upload a CSV (multipart <code>file</code>) or JSON <code>rows</code>; identical or extended re-uploads reuse earlier parses</p>
+                <p class="note">Parquet and .xlsx uploads read only <code>columns=date,revenue</code> and rows in <code>range=date&amp;from=2023-01&amp;to=2024-01</code>, skipping Parquet row groups by their statistics</p>
+                <p><span class="url">GET /api/datasets/content/&lt;sha256&gt;</span> - Dataset already holding a file with this hash</p>
+                <p><span class="url">POST /api/datasets/query</span> - Several series (dataset, column, transforms, range) aligned in one response</p>
+                <p><span class="url">POST /api/datasets/thumbnails</span> - SVG or PNG previews of a whole chart gallery, downsampled to their pixels and cached per chart and dataset version</p>
+                <p><span class="url">GET /api/datasets/&lt;id&gt;/stats</span> - Per-column type, nulls, min/max, sum, mean, distinct and quantiles</p>
+                <p><span class="url">GET /api/datasets/&lt;id&gt;/rows</span> - Rows <code>start:end</code> as records or columns, optionally sorted or dictionary-encoded</p>
+                <p><span class="url">GET /api/datasets/&lt;id&gt;/aggregate</span> - Group a text column: count, sum, mean, min or max</p>
+                <p><span class="url">GET /api/datasets/&lt;id&gt;/resample</span> - Bucket a date column by year, quarter, month, day, hour or minute</p>
+                <p><span class="url">GET /api/datasets/&lt;id&gt;/export.csv</span> / <span class="url">export.xlsx</span> - Streaming download with filter, sort, transforms and formatOptions applied</p>
+                <p><span class="url">GET /api/datasets/&lt;id&gt;/trend</span> - Linear or polynomial trend line, or Holt-Winters forecast, with confidence bands</p>
+                <p class="note">Rows, aggregate and resample accept <code>?filter=revenue &gt; 50000 AND region IN ('EU', 'US')</code>; <span class="url">GET /api/datasets/&lt;id&gt;/count</span> counts matching rows</p>
+                <p><span class="url">POST /api/datasets/&lt;id&gt;/rows</span> - Append rows; pushed to <span class="url">GET /api/datasets/&lt;id&gt;/stream</span> (Server-Sent Events)</p>
+                <p><span class="url">POST /api/datasets/&lt;id&gt;/pivot</span> / <span class="url">unpivot</span> - Long <code>date, metric, value</code> rows to one column per series (or back), as a new dataset</p>
+                <p><span class="url">PATCH /api/datasets/&lt;id&gt;/cells</span> - Edit cells; stats are kept current</p>
+                <p><span class="url">POST /api/datasets/&lt;id&gt;/undo</span> / <span class="url">redo</span> - Step back or forward through edits; <span class="url">GET /api/datasets/&lt;id&gt;/versions</span> lists them and <span class="url">GET /api/datasets/&lt;id&gt;/compare?version=N</span> shows the cells changed since</p>
+                <p><span class="url">POST /api/datasets/&lt;id&gt;/columns</span> - Computed column such as <code>{"name": "Gross Profit", "expression": "Rev - COGS"}</code>, evaluated on first read and after edits only for the changed rows; <span class="url">DELETE /api/datasets/&lt;id&gt;/columns/&lt;name&gt;</span> removes it</p>
+                <p class="note">Identical concurrent query, rows, aggregate, resample and trend requests share one computation; each worker runs a bounded number at once and answers 503 with <code>Retry-After</code> when its queue is full</p>
+            </div>
+            <div class="endpoint">
+                <p><span class="url">GET /api/debug/profiles</span> - Recent request profiles; fetch one as <span class="url">&lt;id&gt;.pstats</span>, <span class="url">&lt;id&gt;.txt</span> or <span class="url">&lt;id&gt;.collapsed</span></p>
+                <p class="note">Only with <code>BIZCHARTS_PROFILE_TOKEN</code> set: send it as <code>X-Profile-Token</code> together with <code>X-Profile: cprofile</code> or <code>sample</code> to profile that request</p>
+            </div>
 
-            <p class="note">Note: In production, this page would serve the compiled React frontend.</p>
+            <p class="note">Note: Once <code>frontend/build</code> exists (or <code>FRONTEND_BUILD</code> points at a build), the compiled React frontend is served here instead, precompressed and with long-lived caching for fingerprinted files.</p>
         </body>
     </html>
     """
@@ -1,8 +1,24 @@
-
 import os
 
+
+def _size(text):
+    """Bytes from '536870912', '512M' or '2G' style text; None when unset."""
+    if not text:
+        return None
+    text = text.strip().upper().rstrip('B')
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-key-please-change-in-production'
+    # RAM for dataset cells and derived caches per worker; beyond it idle
+    # datasets are spilled to disk.  None means no limit.
+    MEMORY_BUDGET = _size(os.environ.get('BIZCHARTS_MEMORY_BUDGET'))
+    # Where spilled columns are written (default: a temporary directory)
+    SPILL_DIR = os.environ.get('BIZCHARTS_SPILL_DIR')
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,67 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/__init__.py
+"""Columnar, numpy-backed dataset storage for uploaded chart data.
+
+Only the exception types are imported eagerly.  Everything else (and numpy
+with it) loads on first attribute access, so importing the package -- and
+therefore booting a worker -- stays cheap until a dataset route is used.
+"""
+import importlib
+
+from .errors import DatasetError, DatasetNotFound
+
+# Public name -> submodule that defines it
+_LAZY_ATTRIBUTES = {
+    'Column': 'column',
+    'DatetimeColumn': 'column',
+    'NumberColumn': 'column',
+    'StringColumn': 'column',
+    'ComputedColumn': 'computed',
+    'compile_expression': 'computed',
+    'ColumnStats': 'stats',
+    'Dataset': 'dataset',
+    'VersionHistory': 'versions',
+    'DatasetStore': 'registry',
+    'store': 'registry',
+    'FilterError': 'filters',
+    'compile_filter': 'filters',
+    'filter_mask': 'filters',
+    'LiveHub': 'live',
+    'hub': 'live',
+    'import_csv': 'ingest',
+    'read_csv': 'ingest',
+    'FILE_FORMATS': 'readers',
+    'read_file': 'readers',
+    'export_rows': 'export',
+    'read_records': 'ingest',
+    'run_batch': 'query',
+    'fit_trend': 'forecast',
+    'pivot': 'reshape',
+    'unpivot': 'reshape',
+    'render_thumbnails': 'thumbnails',
+    'ProcessPool': 'parallel',
+    'pool': 'parallel',
+    'JobRunner': 'admission',
+    'Overloaded': 'admission',
+    'jobs': 'admission',
+}
+
+__all__ = ['DatasetError', 'DatasetNotFound', *_LAZY_ATTRIBUTES]
+
+
+def __getattr__(name):
+    try:
+        module_name = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    module = importlib.import_module(f'.{module_name}', __name__)
+    # Bind everything the submodule provides so later lookups skip __getattr__
+    for attribute, source in _LAZY_ATTRIBUTES.items():
+        if source == module_name:
+            globals()[attribute] = getattr(module, attribute)
+    return globals()[name]
+
+
+def warm():
+    """Import every submodule now (e.g. in a preloading master before fork)."""
+    for name in _LAZY_ATTRIBUTES:
+        __getattr__(name)
@@ -0,0 +1,140 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/admission.py
+"""Request coalescing and admission control for expensive queries.
+
+When many clients ask for the same thing at once (a shared dashboard
+refreshing on the hour), only the first request computes it; the rest wait
+for that result instead of repeating the work.  Computations that do run
+are capped per worker process, and requests beyond the cap queue briefly
+and are then turned away with a retryable error instead of all competing
+for the CPU at once.
+"""
+import os
+import threading
+
+from .errors import DatasetError
+
+# Expensive computations running at once in this worker: its share of the
+# cores among WEB_CONCURRENCY web workers (parallel.py splits its pool the
+# same way), but at least 2 so one slow query cannot hold up the rest
+MAX_RUNNING = int(os.environ.get(
+    'BIZCHARTS_MAX_JOBS', max((os.cpu_count() or 2) // max(int(os.environ.get('WEB_CONCURRENCY', 4)), 1), 2)))
+
+# Computations allowed to wait for a slot before new ones are refused
+MAX_QUEUED = int(os.environ.get('BIZCHARTS_MAX_QUEUED_JOBS', 64))
+
+# Seconds a queued computation waits for a slot
+QUEUE_TIMEOUT = float(os.environ.get('BIZCHARTS_JOB_QUEUE_TIMEOUT', 30))
+
+
+class Overloaded(DatasetError):
+    """Too many expensive queries in flight; the client should retry."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs one computation per key at a time and shares its outcome."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, compute):
+        """``(result, shared)``; ``shared`` is True if another caller computed it.
+
+        Exceptions raised by the computation are raised in every caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = compute()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class JobRunner:
+    """Single-flight coalescing in front of a bounded pool of job slots."""
+
+    def __init__(self, max_running=MAX_RUNNING, max_queued=MAX_QUEUED, queue_timeout=QUEUE_TIMEOUT):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.flights = SingleFlight()
+        self._slots = threading.Condition()
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def run(self, key, compute):
+        """Result of ``compute()``, shared with concurrent runs of the same ``key``.
+
+        Keys must identify the result completely, including the version of
+        every dataset it reads.
+        """
+        result, shared = self.flights.do(key, lambda: self._admitted(compute))
+        if shared:
+            with self._slots:
+                self.coalesced += 1
+        return result
+
+    def _admitted(self, compute):
+        with self._slots:
+            if self.running >= self.max_running:
+                if self.queued >= self.max_queued:
+                    self.rejected += 1
+                    raise Overloaded('Server is busy, please retry shortly')
+                self.queued += 1
+                try:
+                    admitted = self._slots.wait_for(lambda: self.running < self.max_running, self.queue_timeout)
+                finally:
+                    self.queued -= 1
+                if not admitted:
+                    self.rejected += 1
+                    raise Overloaded('Server is busy, please retry shortly')
+            self.running += 1
+
+        try:
+            return compute()
+        finally:
+            with self._slots:
+                self.running -= 1
+                self.completed += 1
+                self._slots.notify()
+
+    def snapshot(self):
+        with self._slots:
+            return {
+                'maxRunning': self.max_running,
+                'running': self.running,
+                'queued': self.queued,
+                'completed': self.completed,
+                'coalesced': self.coalesced,
+                'rejected': self.rejected,
+            }
+
+
+# Shared by the API routes of this worker
+jobs = JobRunner()
@@ -0,0 +1,51 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/aggregate.py
+import functools
+
+import numpy as np
+
+from .parallel import pool
+
+AGGREGATES = ('count', 'sum', 'mean', 'min', 'max')
+
+# How partial per-group results of row chunks combine
+_MERGES = {'sum': np.add, 'mean': np.add, 'min': np.minimum, 'max': np.maximum}
+
+
+def reduce_groups(codes, size, how, weights=None):
+    """Aggregate ``weights`` per group code in ``0..size-1``.
+
+    Returns ``(result, counts)`` as float64 / int64 arrays of length ``size``;
+    groups with no rows hold NaN (or 0 for 'count').  Large inputs are split
+    across the process pool, unless there are so many groups that the
+    per-chunk partials would outweigh the rows.
+    """
+    if how not in AGGREGATES:
+        raise ValueError(how)
+    if pool.engaged(len(codes)) and size * pool.workers <= len(codes):
+        parts = pool.reduce(group_partials, [codes, weights], size, how)
+        counts = functools.reduce(np.add, [part_counts for part_counts, _ in parts])
+        result = None if how == 'count' else functools.reduce(_MERGES[how], [part for _, part in parts])
+    else:
+        counts, result = group_partials(codes, weights, size, how)
+    if how == 'count':
+        return counts.astype(np.float64), counts
+    if how == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = result / counts
+    return np.where(counts > 0, result, np.nan), counts
+
+
+def group_partials(codes, weights, size, how):
+    """Row counts and sums (or min / max) per group over one run of rows.
+
+    Groups without rows hold 0 for sums and +-inf for min / max, so partials
+    of consecutive chunks merge with ``_MERGES``.
+    """
+    counts = np.bincount(codes, minlength=size)
+    if how == 'count':
+        return counts, None
+    if how in ('sum', 'mean'):
+        return counts, np.bincount(codes, weights=weights, minlength=size)
+    result = np.full(size, np.inf if how == 'min' else -np.inf)
+    (np.minimum if how == 'min' else np.maximum).at(result, codes, weights)
+    return counts, result
@@ -0,0 +1,323 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/blocks.py
+"""Compressed block files for spilled columns.
+
+A column is cut into blocks of BLOCK_ROWS cells and each block is encoded
+on its own, picking whichever of these fits its cells:
+
+- run-length, for repeated values (status flags, low-cardinality codes);
+- delta or delta-of-delta of whole numbers, narrowed to the smallest int
+  width, for sorted timestamps and integer-valued amounts;
+- the raw cells byte-shuffled (all first bytes, then all second bytes...),
+  which lines up the similar high bytes of nearby floats.
+
+The result then goes through a general codec: zstd or LZ4 when their
+packages are installed, else zlib at its fastest level.  Every block records
+its row count, null count and min/max, so ``select`` answers range filters
+over a spilled column by decoding only the blocks whose range straddles the
+bound.  Files are memory-mapped, so reading one costs no file descriptor and
+cold files stay in the page cache.
+"""
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # optional: faster codec than zlib
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:  # optional: fastest codec, used when zstd is missing
+    lz4 = None
+
+# Cells per block: small enough that a range scan decodes little beyond
+# the rows it needs, large enough that per-block overhead stays negligible
+BLOCK_ROWS = 65_536
+
+# A block is run-length encoded when it has at most this share of runs
+RLE_MAX_RUNS = 0.125
+
+# Integer-valued floats up to this magnitude survive the trip through int64
+_MAX_EXACT = 2.0 ** 53
+
+# Decimal places tried when turning floats into whole numbers (amounts in cents)
+_DECIMALS = (0, 2)
+
+_MAGIC = b'BZB1'
+
+# magic, dtype str, codec, has null sentinel, null sentinel, rows, blocks
+_HEADER = struct.Struct('<4s8sBBqQI')
+
+_BLOCK_INDEX = np.dtype([
+    ('offset', '<u8'),
+    ('length', '<u4'),
+    ('rows', '<u4'),
+    ('encoding', 'u1'),
+    # Item size of the stored deltas; 0 for raw and run-length blocks
+    ('width', 'u1'),
+    # Delta blocks of floats store cells * 10 ** decimals
+    ('decimals', 'u1'),
+    ('nulls', '<u4'),
+    # Over non-null cells; NaN when the block is all null
+    ('min', '<f8'),
+    ('max', '<f8'),
+])
+
+_RAW, _RLE, _DELTA, _DELTA2 = range(4)
+
+_ZLIB, _ZSTD, _LZ4 = range(3)
+
+_INT_WIDTHS = (np.int8, np.int16, np.int32, np.int64)
+
+
+def _codec():
+    if zstandard is not None:
+        return _ZSTD
+    if lz4 is not None:
+        return _LZ4
+    return _ZLIB
+
+
+def _compress(codec, data):
+    if codec == _ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == _LZ4:
+        return lz4.frame.compress(data)
+    return zlib.compress(data, 1)
+
+
+def _decompress(codec, data):
+    if codec == _ZSTD:
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == _LZ4:
+        return lz4.frame.decompress(data)
+    return zlib.decompress(data)
+
+
+def write(path, cells, null=None):
+    """Write ``cells`` (a 1-d numpy array) to the block file ``path``.
+
+    Nulls are NaN in float arrays; integer arrays may name a ``null``
+    sentinel (e.g. NULL_TIME) that is left out of min/max.  Returns the
+    opened BlockFile.
+    """
+    cells = np.ascontiguousarray(cells)
+    codec = _codec()
+    starts = range(0, len(cells), BLOCK_ROWS)
+    index = np.zeros(len(starts), dtype=_BLOCK_INDEX)
+    payloads = []
+    offset = _HEADER.size + index.nbytes
+    for position, start in enumerate(starts):
+        block = cells[start:start + BLOCK_ROWS]
+        nulls = _null_mask(block, null)
+        encoding, width, decimals, payload = _encode(block, nulls)
+        payload = _compress(codec, payload)
+        present = block[~nulls] if nulls is not None else block
+        index[position] = (
+            offset, len(payload), len(block), encoding, width, decimals,
+            0 if nulls is None else np.count_nonzero(nulls),
+            present.min() if len(present) else np.nan,
+            present.max() if len(present) else np.nan,
+        )
+        payloads.append(payload)
+        offset += len(payload)
+    with open(path, 'wb') as handle:
+        handle.write(_HEADER.pack(
+            _MAGIC, cells.dtype.str.encode(), codec, null is not None, 0 if null is None else null,
+            len(cells), len(index),
+        ))
+        handle.write(index.tobytes())
+        for payload in payloads:
+            handle.write(payload)
+    return BlockFile(path)
+
+
+class BlockFile:
+    """Read side of a block file written by ``write``."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as handle:
+            # The mapping outlives the descriptor and an unlinked file
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, dtype, self._codec, has_null, null, self.rows, count = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC:
+            raise ValueError(f'{path} is not a block file')
+        self.dtype = np.dtype(dtype.rstrip(b'\0').decode())
+        self.null = null if has_null else None
+        self.index = np.frombuffer(self._map, dtype=_BLOCK_INDEX, count=count, offset=_HEADER.size)
+        self.nbytes = len(self._map)
+
+    def read(self):
+        """All cells, decoded into a new array."""
+        cells = np.empty(self.rows, dtype=self.dtype)
+        start = 0
+        for block in range(len(self.index)):
+            rows = int(self.index['rows'][block])
+            cells[start:start + rows] = self.block(block)
+            start += rows
+        return cells
+
+    def block(self, block):
+        """Decoded cells of block number ``block``."""
+        entry = self.index[block]
+        offset = int(entry['offset'])
+        payload = _decompress(self._codec, self._map[offset:offset + int(entry['length'])])
+        return _decode(entry, payload, self.dtype, self.null)
+
+    def select(self, op, value, evaluate):
+        """Boolean row mask of non-null cells where ``cell <op> value`` holds.
+
+        ``op`` is one of = != < <= > >=.  Blocks wholly inside or outside the
+        bound are answered from their min/max; the others are decoded and
+        passed to ``evaluate(cells)``, which returns their mask.
+        """
+        mask = np.zeros(self.rows, dtype=bool)
+        start = 0
+        for block, entry in enumerate(self.index):
+            rows = int(entry['rows'])
+            verdict = _verdict(op, value, entry['min'], entry['max'])
+            if verdict is None or (verdict and entry['nulls']):
+                mask[start:start + rows] = evaluate(self.block(block))
+            elif verdict:
+                mask[start:start + rows] = True
+            start += rows
+        return mask
+
+    def remove(self):
+        """Delete the file; this object (and readers using it) stay valid."""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _verdict(op, value, low, high):
+    """True / False if every non-null cell in ``[low, high]`` passes / fails, else None."""
+    if np.isnan(low):
+        return False
+    if op == '<':
+        return True if high < value else False if low >= value else None
+    if op == '<=':
+        return True if high <= value else False if low > value else None
+    if op == '>':
+        return True if low > value else False if high <= value else None
+    if op == '>=':
+        return True if low >= value else False if high < value else None
+    outside = value < low or value > high
+    if op == '=':
+        return False if outside else True if low == high else None
+    return True if outside else False if low == high else None
+
+
+def _null_mask(block, null):
+    if block.dtype.kind == 'f':
+        nulls = np.isnan(block)
+    elif null is not None:
+        nulls = block == null
+    else:
+        return None
+    return nulls if nulls.any() else None
+
+
+def _encode(block, nulls):
+    """(encoding, delta width, decimals, uncompressed payload) for one block."""
+    starts = np.flatnonzero(np.concatenate(([True], block[1:] != block[:-1])))
+    if nulls is not None and block.dtype.kind == 'f':
+        # NaN != NaN starts a run at every null; merge consecutive ones
+        null_starts = nulls[starts]
+        starts = starts[~np.concatenate(([False], null_starts[1:] & null_starts[:-1]))]
+    if len(starts) <= RLE_MAX_RUNS * len(block):
+        lengths = np.diff(np.append(starts, len(block))).astype(np.int32)
+        return _RLE, 0, 0, struct.pack('<I', len(starts)) + block[starts].tobytes() + lengths.tobytes()
+
+    whole, decimals = _whole_numbers(block, nulls)
+    if whole is not None:
+        first = np.diff(whole)
+        second = np.diff(first)
+        if np.dtype(_width(second)).itemsize < np.dtype(_width(first)).itemsize:
+            deltas, encoding, head = second, _DELTA2, whole[:1].tobytes() + first[:1].tobytes()
+        else:
+            deltas, encoding, head = first, _DELTA, whole[:1].tobytes()
+        width = _width(deltas)
+        bitmap = b'' if nulls is None else np.packbits(nulls).tobytes()
+        return encoding, np.dtype(width).itemsize, decimals, bitmap + head + deltas.astype(width).tobytes()
+
+    itemsize = block.dtype.itemsize
+    shuffled = block.view(np.uint8).reshape(len(block), itemsize).T
+    return _RAW, 0, 0, shuffled.tobytes()
+
+
+def _whole_numbers(block, nulls):
+    """(int64 cells, decimals) if ``block`` scales to whole numbers, else (None, 0).
+
+    Nulls are filled forward; floats must come back bit for bit when divided
+    by ``10 ** decimals``.
+    """
+    if len(block) < 3:
+        return None, 0
+    if nulls is not None:
+        present = np.flatnonzero(~nulls)
+        if not len(present):
+            return None, 0
+        # Repeat the previous value so nulls add no deltas
+        filled = np.maximum.accumulate(np.where(nulls, 0, np.arange(len(block))))
+        filled[:present[0]] = present[0]
+        block = block[filled]
+    if block.dtype.kind != 'f':
+        return block.astype(np.int64), 0
+    for decimals in _DECIMALS:
+        scaled = np.round(block * 10 ** decimals)
+        if np.all(np.abs(scaled) <= _MAX_EXACT) and np.array_equal(_unscale(scaled, decimals), block):
+            return scaled.astype(np.int64), decimals
+    return None, 0
+
+
+def _unscale(whole, decimals):
+    return whole / 10 ** decimals if decimals else whole.astype(np.float64)
+
+
+def _width(values):
+    """Narrowest signed integer type holding every value."""
+    if not len(values):
+        return np.int8
+    low, high = int(values.min()), int(values.max())
+    for width in _INT_WIDTHS:
+        info = np.iinfo(width)
+        if info.min <= low and high <= info.max:
+            return width
+    return np.int64
+
+
+def _decode(entry, payload, dtype, null):
+    rows = int(entry['rows'])
+    encoding = int(entry['encoding'])
+    if encoding == _RAW:
+        return np.frombuffer(payload, dtype=np.uint8).reshape(dtype.itemsize, rows).T.copy().view(dtype).ravel()
+    if encoding == _RLE:
+        (runs,) = struct.unpack_from('<I', payload)
+        values = np.frombuffer(payload, dtype=dtype, count=runs, offset=4)
+        lengths = np.frombuffer(payload, dtype=np.int32, count=runs, offset=4 + runs * dtype.itemsize)
+        return np.repeat(values, lengths)
+
+    offset = 0
+    nulls = None
+    if entry['nulls']:
+        size = (rows + 7) // 8
+        nulls = np.unpackbits(np.frombuffer(payload, dtype=np.uint8, count=size), count=rows).astype(bool)
+        offset = size
+    width = _INT_WIDTHS[int(entry['width']).bit_length() - 1]
+    head = 2 if encoding == _DELTA2 else 1
+    start = np.frombuffer(payload, dtype=np.int64, count=head, offset=offset)
+    deltas = np.frombuffer(payload, dtype=width, offset=offset + 8 * head).astype(np.int64)
+    if encoding == _DELTA2:
+        deltas = np.cumsum(np.concatenate((start[1:], deltas)))
+    whole = np.cumsum(np.concatenate((start[:1], deltas)))
+    cells = _unscale(whole, int(entry['decimals'])) if dtype.kind == 'f' else whole.astype(dtype)
+    if nulls is not None:
+        cells[nulls] = np.nan if dtype.kind == 'f' else null
+    return cells
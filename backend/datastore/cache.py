@@ -0,0 +1,85 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/cache.py
+import threading
+import weakref
+from collections import OrderedDict
+
+# Every LRUCache, so the memory budget can count and trim them
+_caches = weakref.WeakSet()
+
+
+def nbytes(value):
+    """Size of a cached value: numpy arrays report it, anything else counts as 1 KiB."""
+    return getattr(value, 'nbytes', 1024)
+
+
+class LRUCache:
+    """Thread-safe LRU mapping bounded by the total size of its values.
+
+    Keys normally start with ``(dataset_id, dataset_version)`` so entries for
+    an edited dataset simply stop being hit and age out.
+    """
+
+    def __init__(self, max_bytes, sizeof=nbytes):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return default
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted
+        return value
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for ``key``, computing and storing it if absent."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.put(key, compute())
+        return value
+
+    def discard(self, predicate):
+        """Drop every entry whose key satisfies ``predicate``; returns the bytes freed."""
+        with self._lock:
+            before = self.current_bytes
+            for key in [key for key in self._entries if predicate(key)]:
+                self.current_bytes -= self._entries.pop(key)[1]
+            return before - self.current_bytes
+
+    def shrink(self, nbytes):
+        """Evict least recently used entries until ``nbytes`` are freed (or none are left)."""
+        with self._lock:
+            before = self.current_bytes
+            while self._entries and before - self.current_bytes < nbytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted
+            return before - self.current_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def all_caches():
+    """Every live LRUCache."""
+    return list(_caches)
+
+
+_MISSING = object()
@@ -0,0 +1,618 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/column.py
+import numbers
+import re
+import threading
+
+import numpy as np
+
+from . import blocks
+from .stats import ColumnStats
+from .timeparse import NULL_TIME, bucket, format_times, guess_format
+
+# Cell contents treated as missing when parsing uploaded text
+NULL_TOKENS = ('', 'null', 'NULL', 'NaN', 'nan', 'NA', 'N/A', 'n/a')
+
+# Code stored for a null cell in a dictionary-encoded column
+NULL_CODE = -1
+
+# Start of an ISO 8601 date ('2023', '2023-01', '2023-01-15T...')
+ISO_PREFIX = re.compile(r'^\d{4}(-\d{2}){0,2}([T ]|$)')
+
+# IN lists up to this many values are OR-ed equality scans, which beat a
+# per-row lookup table on large columns
+SMALL_IN_LIST = 8
+
+# Vectorised comparison operators understood by Column.compare
+COMPARISONS = {
+    '=': np.equal,
+    '!=': np.not_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+}
+
+# Serialises spilling and reloading cells across request threads
+_spill_lock = threading.Lock()
+
+# Columns read back from spill files by this process (reported by /api/health)
+reloads = 0
+
+
+def reload_count():
+    """Columns read back from spill files by this process so far."""
+    return reloads
+
+
+class _Cells:
+    """Cell array attribute that reads spilled cells back in on first access.
+
+    Stored in the instance dict under its own name; None there means the
+    column is spilled.
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, column, owner=None):
+        if column is None:
+            return self
+        cells = column.__dict__.get(self.name)
+        if cells is None:
+            column.restore()
+            cells = column.__dict__[self.name]
+        return cells
+
+    def __set__(self, column, cells):
+        column.__dict__[self.name] = cells
+
+
+class Column:
+    """A single named column of a dataset.
+
+    Subclasses hold their cells in numpy arrays and keep ``stats`` current as
+    cells are edited.  ``rows`` arguments below accept anything numpy can
+    index with: a slice, an index array or a boolean mask.
+    """
+
+    kind = None
+
+    # Attribute holding the cell array (a view of ``_buffer``)
+    _cells = 'values'
+    # Null sentinel of integer cells, left out of spilled block min/max
+    _null = None
+    # Source text of a computed column's expression (see computed.py)
+    expression = None
+
+    _buffer = _Cells()
+
+    def __init__(self, name):
+        self.name = name
+        self._stats = None
+        # BlockFile holding the cells while spilled
+        self._blocks = None
+
+    @staticmethod
+    def from_strings(name, raw):
+        """Build a column from parsed text cells, inferring its type."""
+        text = np.char.strip(np.asarray(raw, dtype=np.str_)) if len(raw) else np.array([], dtype=np.str_)
+        nulls = np.isin(text, NULL_TOKENS)
+        try:
+            values = np.full(len(text), np.nan)
+            values[~nulls] = text[~nulls].astype(np.float64)
+            return NumberColumn(name, values)
+        except ValueError:
+            pass
+        times = DatetimeColumn.parse_text(name, text, nulls)
+        if times is not None:
+            return times
+        return StringColumn.encode(name, text, nulls)
+
+    @staticmethod
+    def from_values(name, raw):
+        """Build a column from JSON-decoded cell values, inferring its type."""
+        present = [v for v in raw if v is not None]
+        if all(_is_number(v) for v in present):
+            values = np.array([np.nan if v is None else v for v in raw], dtype=np.float64)
+            return NumberColumn(name, values)
+        return Column.from_strings(name, ['' if v is None else format_value(v) for v in raw])
+
+    @property
+    def stats(self):
+        return self._stats
+
+    def __len__(self):
+        spilled = self._blocks
+        if spilled is not None:
+            return spilled.rows
+        return len(getattr(self, self._cells))
+
+    def set_value(self, row, value):
+        """Overwrite one cell; raises ``ValueError`` if the type does not fit."""
+        raise NotImplementedError
+
+    def to_list(self, rows=slice(None)):
+        """JSON-friendly cell values for ``rows`` (nulls become None)."""
+        raise NotImplementedError
+
+    def to_wire(self, rows=slice(None)):
+        """Compact JSON form of ``rows`` for columnar responses."""
+        return self.to_list(rows)
+
+    def argsort(self, descending=False):
+        """Row order sorting this column, nulls last either way."""
+        raise NotImplementedError
+
+    def null_mask(self):
+        """Boolean row mask of null cells."""
+        raise NotImplementedError
+
+    def compare(self, op, value):
+        """Boolean row mask of non-null cells where ``cell <op> value`` holds.
+
+        ``op`` is a key of COMPARISONS; raises ``ValueError`` if ``value``
+        cannot be compared with this column's type.
+        """
+        raise NotImplementedError
+
+    def isin(self, values):
+        """Boolean row mask of cells equal to any of ``values``."""
+        raise NotImplementedError
+
+    def append(self, cells):
+        """Append JSON-decoded cells; raises ``ValueError`` if the type does not fit.
+
+        Storage grows geometrically, so appends are amortised O(len(cells)).
+        """
+        raise NotImplementedError
+
+    def copy(self):
+        """Independent copy with the same cells (stats are rebuilt)."""
+        raise NotImplementedError
+
+    def take(self, rows):
+        """New column of the cells at ``rows`` (an index array), in that order."""
+        raise NotImplementedError
+
+    @property
+    def nbytes(self):
+        """Bytes of cell storage held in memory (0 while spilled)."""
+        buffer = self.__dict__.get('_buffer')
+        return 0 if buffer is None else buffer.nbytes
+
+    @property
+    def spilled(self):
+        return self._blocks is not None
+
+    @property
+    def spilled_bytes(self):
+        """Size of the block file holding the cells (0 unless spilled)."""
+        spilled = self._blocks
+        return 0 if spilled is None else spilled.nbytes
+
+    def spill(self, path):
+        """Write the cells to the block file ``path`` and drop them from memory.
+
+        Returns the bytes written.  The next access to the cells reads them
+        back; until then ``compare`` and ``between`` answer from the blocks.
+        """
+        with _spill_lock:
+            spilled = self._blocks = blocks.write(path, getattr(self, self._cells), self._null)
+            # Requests already holding the arrays keep them alive until done
+            self.__dict__[self._cells] = self.__dict__['_buffer'] = None
+        return spilled.nbytes
+
+    def restore(self):
+        """Read spilled cells back into memory and delete their block file."""
+        global reloads
+        with _spill_lock:
+            spilled = self._blocks
+            if spilled is None:
+                return
+            cells = spilled.read()
+            self.__dict__[self._cells] = self.__dict__['_buffer'] = cells
+            self._blocks = None
+            reloads += 1
+        spilled.remove()
+
+    def _select(self, op, value, evaluate):
+        """``evaluate(cells)`` over the whole column, or block by block while spilled."""
+        spilled = self._blocks
+        if spilled is None:
+            return evaluate(getattr(self, self._cells))
+        return spilled.select(op, value, evaluate)
+
+    def to_strings(self):
+        """Re-encode as a string column (used when an edit breaks the type)."""
+        cells = self.to_list()
+        nulls = np.array([cell is None for cell in cells], dtype=bool)
+        text = np.array(['' if cell is None else format_value(cell) for cell in cells], dtype=np.str_)
+        return StringColumn.encode(self.name, text, nulls)
+
+
+class NumberColumn(Column):
+    """float64 cells with NaN for nulls."""
+
+    kind = 'number'
+    values = _Cells()
+
+    def __init__(self, name, values):
+        super().__init__(name)
+        self.values = self._buffer = values
+        self._stats = ColumnStats.for_numbers(values)
+
+    @property
+    def stats(self):
+        if self._stats.stale_extremes:
+            self._stats.refresh(self.values)
+        return self._stats
+
+    def set_value(self, row, value):
+        new = _coerce_number(value)
+        old = self.values[row]
+        self.values[row] = new
+        self._stats.replace(row, old, new)
+
+    def to_list(self, rows=slice(None)):
+        return float_list(self.values[rows])
+
+    def argsort(self, descending=False):
+        # NaN already sorts last ascending; negate for a stable descending order
+        keys = -self.values if descending else self.values
+        return np.argsort(keys, kind='stable')
+
+    def null_mask(self):
+        return np.isnan(self.values)
+
+    def compare(self, op, value):
+        value = _coerce_filter_number(value)
+
+        def evaluate(values):
+            mask = COMPARISONS[op](values, value)
+            if op == '!=':
+                # NaN compares False for everything except '!='
+                mask &= ~np.isnan(values)
+            return mask
+
+        return self._select(op, value, evaluate)
+
+    def isin(self, values):
+        return np.isin(self.values, [_coerce_filter_number(value) for value in values])
+
+    def append(self, cells):
+        new = np.array([_coerce_number(cell) for cell in cells], dtype=np.float64)
+        self._buffer, self.values = extend_buffer(self._buffer, len(self.values), new)
+        self._stats.append(new)
+
+    def copy(self):
+        return NumberColumn(self.name, self.values.copy())
+
+    def take(self, rows):
+        return NumberColumn(self.name, np.array(self.values[rows]))
+
+
+class DatetimeColumn(Column):
+    """int64 epoch milliseconds with NULL_TIME (NaT) for nulls.
+
+    ``time_format`` is the layout guessed at ingest; it is reused to parse
+    edits and range bounds so no per-cell format detection is needed.
+    ``granularity`` ('month', 'day', 'minute', 'second') is how precise the
+    source text was and controls how values are rendered back.
+    """
+
+    kind = 'datetime'
+    _null = NULL_TIME
+    values = _Cells()
+
+    def __init__(self, name, values, time_format):
+        super().__init__(name)
+        self.values = self._buffer = values
+        self.time_format = time_format
+        self._stats = ColumnStats.for_times(self._as_float())
+
+    @classmethod
+    def parse_text(cls, name, text, nulls):
+        """Parse a numpy str array as dates, or return None if it is not one."""
+        present = text[~nulls]
+        time_format = guess_format(present)
+        if time_format is None:
+            return None
+        values = np.full(len(text), NULL_TIME, dtype=np.int64)
+        try:
+            values[~nulls] = time_format.parse(present)
+        except ValueError:
+            return None
+        return cls(name, values, time_format)
+
+    @property
+    def granularity(self):
+        return self.time_format.granularity
+
+    def _as_float(self, values=None):
+        values = self.values if values is None else values
+        floats = values.astype(np.float64)
+        floats[values == NULL_TIME] = np.nan
+        return floats
+
+    @property
+    def stats(self):
+        if self._stats.stale_extremes:
+            self._stats.refresh(self._as_float())
+        return self._stats
+
+    def parse(self, value):
+        """Parse one cell with this column's format; NULL_TIME for nulls."""
+        if _is_null_text(value):
+            return NULL_TIME
+        if not isinstance(value, str):
+            raise ValueError(value)
+        text = np.array([value.strip()], dtype=np.str_)
+        try:
+            return int(self.time_format.parse(text)[0])
+        except ValueError:
+            # Accept plain ISO text too, e.g. range bounds typed by hand (but
+            # not numpy's special strings such as 'today' or 'now')
+            if not ISO_PREFIX.match(value.strip()):
+                raise
+            return int(text.astype('datetime64[ms]').astype(np.int64)[0])
+
+    def set_value(self, row, value):
+        new = self.parse(value)
+        old = self.values[row]
+        self.values[row] = new
+        self._stats.replace(row, *self._as_float(np.array([old, new], dtype=np.int64)))
+
+    def to_list(self, rows=slice(None)):
+        return format_times(self.values[rows], self.granularity).tolist()
+
+    def to_wire(self, rows=slice(None)):
+        values = self.values[rows]
+        epoch = values.astype(object)
+        epoch[values == NULL_TIME] = None
+        return {"granularity": self.granularity, "epoch": epoch.tolist()}
+
+    def argsort(self, descending=False):
+        nulls = self.values == NULL_TIME
+        keys = -self.values if descending else self.values
+        keys = np.where(nulls, np.iinfo(np.int64).max, keys)
+        return np.argsort(keys, kind='stable')
+
+    def null_mask(self):
+        return self.values == NULL_TIME
+
+    def compare(self, op, value):
+        value = self.parse(format_value(value))
+        return self._select(op, value, lambda values: COMPARISONS[op](values, value) & (values != NULL_TIME))
+
+    def isin(self, values):
+        return np.isin(self.values, [self.parse(format_value(value)) for value in values]) & (self.values != NULL_TIME)
+
+    def append(self, cells):
+        new = np.array([self.parse(cell) for cell in cells], dtype=np.int64)
+        self._buffer, self.values = extend_buffer(self._buffer, len(self.values), new)
+        self._stats.append(self._as_float(new))
+
+    def copy(self):
+        return DatetimeColumn(self.name, self.values.copy(), self.time_format)
+
+    def take(self, rows):
+        return DatetimeColumn(self.name, np.array(self.values[rows]), self.time_format)
+
+    def between(self, start=None, end=None):
+        """Boolean row mask of ``start <= value < end``; bounds are cell text."""
+        if start is None and end is None:
+            return self.values != NULL_TIME
+        mask = None
+        if start is not None:
+            mask = self.compare('>=', start)
+        if end is not None:
+            below = self.compare('<', end)
+            mask = below if mask is None else mask & below
+        return mask
+
+    def buckets(self, unit, rows=slice(None)):
+        """datetime64 bucket per row of ``rows``, floored to ``unit``."""
+        return bucket(self.values[rows], unit)
+
+
+class StringColumn(Column):
+    """Dictionary-encoded strings: int32 codes into a shared dictionary.
+
+    Ingest builds a sorted dictionary, so codes compare in lexical order until
+    an edit appends a new value; ``sort_ranks`` restores that ordering without
+    touching the per-row codes.  Equality filters, group-bys and sorts all
+    work on the codes.
+    """
+
+    kind = 'string'
+    _cells = 'codes'
+    codes = _Cells()
+
+    def __init__(self, name, codes, dictionary):
+        super().__init__(name)
+        self.codes = self._buffer = codes
+        self.dictionary = dictionary
+        self._lookup = {value: code for code, value in enumerate(dictionary)}
+        self._ranks = np.arange(len(dictionary), dtype=np.int32)
+        self._stats = ColumnStats.for_categories(
+            dictionary, int(np.count_nonzero(codes == NULL_CODE)), len(codes))
+
+    @classmethod
+    def encode(cls, name, text, nulls):
+        """Encode a numpy str array, with ``nulls`` marking missing cells."""
+        dictionary, inverse = np.unique(text[~nulls], return_inverse=True)
+        codes = np.full(len(text), NULL_CODE, dtype=np.int32)
+        codes[~nulls] = inverse
+        return cls(name, codes, dictionary.tolist())
+
+    def code_for(self, value):
+        """Dictionary code of ``value``, or None if it never occurs."""
+        return self._lookup.get(value)
+
+    def _intern(self, value):
+        code = self._lookup.get(value)
+        if code is None:
+            code = len(self.dictionary)
+            self.dictionary.append(value)
+            self._lookup[value] = code
+            self._ranks = None
+        return code
+
+    def sort_ranks(self):
+        """Lexical rank of each dictionary entry, indexed by code."""
+        if self._ranks is None:
+            order = np.argsort(np.array(self.dictionary, dtype=np.str_), kind='stable')
+            self._ranks = np.empty(len(order), dtype=np.int32)
+            self._ranks[order] = np.arange(len(order), dtype=np.int32)
+        return self._ranks
+
+    def set_value(self, row, value):
+        new = None if _is_null_text(value) else format_value(value)
+        old_code = self.codes[row]
+        old = None if old_code == NULL_CODE else self.dictionary[old_code]
+        self.codes[row] = NULL_CODE if new is None else self._intern(new)
+        self._stats.replace(row, old, new)
+
+    def append(self, cells):
+        new = [None if _is_null_text(cell) else format_value(cell) for cell in cells]
+        codes = np.array([NULL_CODE if value is None else self._intern(value) for value in new], dtype=np.int32)
+        self._buffer, self.codes = extend_buffer(self._buffer, len(self.codes), codes)
+        self._stats.append_categories(new)
+
+    def copy(self):
+        column = StringColumn(self.name, self.codes.copy(), list(self.dictionary))
+        # Appended values may have left the dictionary unsorted
+        column._ranks = None if self._ranks is None else self._ranks.copy()
+        return column
+
+    def take(self, rows):
+        codes = np.array(self.codes[rows])
+        present = codes != NULL_CODE
+        used = np.unique(codes[present])
+        # Only values still occurring are kept, so stats describe these rows
+        remap = np.full(len(self.dictionary), NULL_CODE, dtype=np.int32)
+        remap[used] = np.arange(len(used), dtype=np.int32)
+        codes[present] = remap[codes[present]]
+        column = StringColumn(self.name, codes, [self.dictionary[code] for code in used])
+        if self._ranks is None or np.any(np.diff(self._ranks[used]) < 0):
+            column._ranks = None
+        return column
+
+    def decode(self, rows=slice(None)):
+        """Object array of the cell strings for ``rows`` (None for nulls)."""
+        codes = self.codes[rows]
+        table = np.array(self.dictionary + [None], dtype=object)
+        # NULL_CODE (-1) indexes the trailing None
+        return table[codes]
+
+    def to_list(self, rows=slice(None)):
+        return self.decode(rows).tolist()
+
+    def to_wire(self, rows=slice(None)):
+        return {"dictionary": self.dictionary, "codes": self.codes[rows].tolist()}
+
+    def argsort(self, descending=False):
+        ranks = self.sort_ranks()
+        if not len(ranks):
+            return np.arange(len(self.codes))
+        keys = np.where(self.codes == NULL_CODE, len(ranks), ranks[self.codes])
+        if descending:
+            keys = np.where(self.codes == NULL_CODE, len(ranks), len(ranks) - 1 - keys)
+        return np.argsort(keys, kind='stable')
+
+    def null_mask(self):
+        return self.codes == NULL_CODE
+
+    def equals(self, value):
+        """Boolean row mask of cells equal to ``value``."""
+        code = self.code_for(value)
+        if code is None:
+            return np.zeros(len(self.codes), dtype=bool)
+        return self.codes == code
+
+    def compare(self, op, value):
+        value = format_value(value)
+        if op == '=':
+            return self.equals(value)
+        # Evaluate once per dictionary entry, then look the answer up per row;
+        # the trailing False is what NULL_CODE (-1) indexes
+        table = COMPARISONS[op](np.array(self.dictionary, dtype=np.str_), value)
+        return np.append(table, False)[self.codes]
+
+    def isin(self, values):
+        codes = {code for code in (self.code_for(format_value(v)) for v in values) if code is not None}
+        if len(codes) <= SMALL_IN_LIST:
+            mask = np.zeros(len(self.codes), dtype=bool)
+            for code in codes:
+                mask |= self.codes == code
+            return mask
+        table = np.zeros(len(self.dictionary) + 1, dtype=bool)
+        table[list(codes)] = True
+        return table[self.codes]
+
+    def group_codes(self, rows=slice(None)):
+        """Codes of ``rows`` with nulls dropped, for bincount-style grouping."""
+        codes = self.codes[rows]
+        return codes[codes != NULL_CODE]
+
+
+def extend_buffer(buffer, length, new):
+    """Write ``new`` after the first ``length`` items of ``buffer``.
+
+    Reallocates with doubled capacity when full.  Returns the (possibly new)
+    buffer and a view of its used part; views handed out earlier stay valid.
+    """
+    needed = length + len(new)
+    if needed > len(buffer):
+        grown = np.empty(max(needed, 2 * len(buffer), 16), dtype=buffer.dtype)
+        grown[:length] = buffer[:length]
+        buffer = grown
+    buffer[length:needed] = new
+    return buffer, buffer[:needed]
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+
+def _is_null_text(value):
+    return value is None or (isinstance(value, str) and value.strip() in NULL_TOKENS)
+
+
+def _coerce_number(value):
+    if _is_null_text(value):
+        return np.nan
+    if isinstance(value, bool):
+        raise ValueError(value)
+    return float(value)
+
+
+def float_list(values):
+    """List of floats from a float64 array, with NaN turned into None."""
+    nulls = np.isnan(values)
+    if not nulls.any():
+        return values.tolist()
+    out = values.astype(object)
+    out[nulls] = None
+    return out.tolist()
+
+
+def _coerce_filter_number(value):
+    if isinstance(value, str):
+        return float(value)
+    return value
+
+
+def format_value(value):
+    """Render a cell as text, dropping the '.0' from whole floats."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def format_floats(values):
+    """format_value for every cell of a float64 array, with '' for NaN."""
+    return [
+        '' if value != value else str(int(value)) if value.is_integer() else str(value)
+        for value in values.tolist()
+    ]
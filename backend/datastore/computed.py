@@ -0,0 +1,335 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/computed.py
+"""Computed columns: arithmetic expressions over other numeric columns.
+
+Grammar::
+
+    expr   := term (('+' | '-') term)*
+    term   := unary (('*' | '/') unary)*
+    unary  := '-' unary | atom
+    atom   := number | column | function '(' expr ')' | '(' expr ')'
+    column := name | "quoted name"
+
+For example ``Rev - COGS`` or ``("Rev" - "COGS") / "Rev" * 100``.  Nulls
+propagate, and so does anything that is not a finite number (x / 0 is
+null).  A ComputedColumn is an ordinary numeric column to the rest of the
+engine; its cells are evaluated, vectorised, on first read and kept until
+an input changes.  Edits to inputs mark only their rows stale, and appended
+rows are evaluated when next read, so neither re-evaluates the column.
+"""
+import functools
+import re
+import threading
+
+import numpy as np
+
+from .column import Column, NumberColumn, extend_buffer
+from .errors import DatasetError
+from .stats import ColumnStats
+
+FUNCTIONS = {
+    'abs': np.abs,
+    'sqrt': np.sqrt,
+    'log': np.log,
+    'exp': np.exp,
+    'round': np.round,
+}
+
+# Stale rows kept current in the stats one by one; beyond this they are
+# rebuilt from the whole column
+MAX_STAT_UPDATES = 1000
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+      | (?P<quoted>"(?:[^"]|"")*")
+      | (?P<op>[-+*/()])
+      | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+
+_OPERATORS = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide}
+
+
+class ExpressionError(DatasetError):
+    """Raised for a column expression that cannot be parsed."""
+
+
+class Expr:
+    """A parsed column expression."""
+
+    def evaluate(self, dataset, rows):
+        """float64 cells (or a scalar) over the slice ``rows`` of ``dataset``."""
+        raise NotImplementedError
+
+    def columns(self):
+        """Names of the columns this expression reads."""
+        raise NotImplementedError
+
+
+class Number(Expr):
+
+    def __init__(self, value):
+        self.value = value
+
+    def evaluate(self, dataset, rows):
+        return self.value
+
+    def columns(self):
+        return set()
+
+
+class ColumnRef(Expr):
+
+    def __init__(self, name):
+        self.name = name
+
+    def evaluate(self, dataset, rows):
+        column = dataset.column(self.name)
+        if column.kind != 'number':
+            # An edit turned the input into text; its cells are no numbers
+            return np.full(rows.stop - rows.start, np.nan)
+        return column.values[rows]
+
+    def columns(self):
+        return {self.name}
+
+
+class Negate(Expr):
+
+    def __init__(self, operand):
+        self.operand = operand
+
+    def evaluate(self, dataset, rows):
+        return np.negative(self.operand.evaluate(dataset, rows))
+
+    def columns(self):
+        return self.operand.columns()
+
+
+class BinaryOp(Expr):
+
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def evaluate(self, dataset, rows):
+        return _OPERATORS[self.op](self.left.evaluate(dataset, rows), self.right.evaluate(dataset, rows))
+
+    def columns(self):
+        return self.left.columns() | self.right.columns()
+
+
+class Call(Expr):
+
+    def __init__(self, function, argument):
+        self.function = function
+        self.argument = argument
+
+    def evaluate(self, dataset, rows):
+        return FUNCTIONS[self.function](self.argument.evaluate(dataset, rows))
+
+    def columns(self):
+        return self.argument.columns()
+
+
+@functools.lru_cache(maxsize=512)
+def compile_expression(text):
+    """Parse a column expression into an Expr (cached by expression text)."""
+    if not isinstance(text, str) or not text.strip():
+        raise ExpressionError("Missing 'expression'")
+    parser = _Parser(_tokenize(text))
+    node = parser.expr()
+    if parser.peek() is not None:
+        raise ExpressionError(f"Unexpected '{parser.peek()[1]}' in expression")
+    return node
+
+
+class ComputedColumn(NumberColumn):
+    """Numeric column whose cells come from an expression over ``dataset``.
+
+    Reads see the cells of the dataset's current rows; there is no per-cell
+    storage to edit.
+    """
+
+    def __init__(self, name, expression, dataset):
+        Column.__init__(self, name)
+        self.expression = expression
+        self.node = compile_expression(expression)
+        self.inputs = frozenset(self.node.columns())
+        self._dataset = dataset
+        # Evaluated cells (a view of _buffer), or None until first read
+        self._values = None
+        # (start, end) row ranges whose inputs changed since evaluation
+        self._stale = []
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def values(self):
+        values = self._values
+        if values is not None and not self._stale and len(values) == self._dataset.row_count:
+            return values
+        with self._refresh_lock:
+            return self._refresh()
+
+    def __len__(self):
+        return self._dataset.row_count
+
+    @property
+    def stats(self):
+        values = self.values
+        if self._stats is None:
+            self._stats = ColumnStats.for_numbers(values)
+        elif self._stats.stale_extremes:
+            self._stats.refresh(values)
+        return self._stats
+
+    def invalidate(self, start, end):
+        """Mark rows ``start:end`` for re-evaluation on the next read."""
+        with self._refresh_lock:
+            if self._values is not None:
+                self._stale.append((start, end))
+
+    def set_value(self, row, value):
+        raise DatasetError(f"Column '{self.name}' is computed from '{self.expression}' and cannot be edited")
+
+    def append(self, cells):
+        """Nothing to store: appended rows are evaluated from the inputs when read."""
+
+    def spill(self, path):
+        """Drop the evaluated cells; they are cheaper to recompute than to store."""
+        with self._refresh_lock:
+            self._values = self._buffer = None
+            self._stale = []
+        return 0
+
+    def _refresh(self):
+        count = self._dataset.row_count
+        values = self._values
+        if values is None:
+            values = self._evaluate(0, count)
+            self._buffer = values
+            # Inputs may have changed since the stats were taken
+            self._stats = None
+        else:
+            if count < len(values):
+                # An append was undone; the stats still count its rows
+                values = values[:count]
+                self._stats = None
+            stale, self._stale = self._stale, []
+            updates = sum(max(min(end, len(values)) - start, 0) for start, end in stale)
+            for start, end in stale:
+                end = min(end, len(values))
+                if start >= end:
+                    continue
+                fresh = self._evaluate(start, end)
+                if self._stats is not None and updates <= MAX_STAT_UPDATES:
+                    for offset, new in enumerate(fresh):
+                        self._stats.replace(start + offset, values[start + offset], new)
+                values[start:end] = fresh
+            if updates > MAX_STAT_UPDATES:
+                self._stats = None
+            if count > len(values):
+                appended = self._evaluate(len(values), count)
+                self._buffer, values = extend_buffer(self._buffer, len(values), appended)
+                if self._stats is not None:
+                    self._stats.append(appended)
+        self._values = values
+        return values
+
+    def _evaluate(self, start, end):
+        rows = slice(start, end)
+        with np.errstate(all='ignore'):
+            result = np.asarray(self.node.evaluate(self._dataset, rows), dtype=np.float64)
+        # A constant expression evaluates to a scalar
+        result = np.array(np.broadcast_to(result, (end - start,)))
+        result[~np.isfinite(result)] = np.nan
+        return result
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise ExpressionError(f'Unexpected character at position {position} in expression')
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'number':
+            tokens.append(('number', float(value)))
+        elif kind == 'quoted':
+            tokens.append(('name', value[1:-1].replace('""', '"')))
+        else:
+            tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    """Recursive-descent parser over the token list."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def take(self, kind, value=None):
+        token = self.peek()
+        if token is None or token[0] != kind or (value and token[1] != value):
+            found = 'end of expression' if token is None else f"'{token[1]}'"
+            raise ExpressionError(f'Expected {value or kind}, found {found}')
+        self.position += 1
+        return token[1]
+
+    def accept(self, kind, value):
+        token = self.peek()
+        if token is not None and token == (kind, value):
+            self.position += 1
+            return True
+        return False
+
+    def expr(self):
+        node = self.term()
+        while self.peek() in (('op', '+'), ('op', '-')):
+            node = BinaryOp(self.take('op'), node, self.term())
+        return node
+
+    def term(self):
+        node = self.unary()
+        while self.peek() in (('op', '*'), ('op', '/')):
+            node = BinaryOp(self.take('op'), node, self.unary())
+        return node
+
+    def unary(self):
+        if self.accept('op', '-'):
+            return Negate(self.unary())
+        return self.atom()
+
+    def atom(self):
+        token = self.peek()
+        if token is None:
+            raise ExpressionError('Unexpected end of expression')
+        if self.accept('op', '('):
+            node = self.expr()
+            self.take('op', ')')
+            return node
+        if token[0] == 'number':
+            return Number(self.take('number'))
+        if token[0] == 'name':
+            return ColumnRef(self.take('name'))
+        if token[0] == 'word':
+            name = self.take('word')
+            if self.peek() != ('op', '('):
+                return ColumnRef(name)
+            if name.lower() not in FUNCTIONS:
+                raise ExpressionError(f"Unknown function '{name}'")
+            self.take('op', '(')
+            node = Call(name.lower(), self.expr())
+            self.take('op', ')')
+            return node
+        raise ExpressionError(f"Unexpected '{token[1]}' in expression")
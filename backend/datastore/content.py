@@ -0,0 +1,74 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/content.py
+"""Content addressing for uploads.
+
+An upload is hashed in fixed-size chunks as well as as a whole.  The whole
+digest finds byte-identical re-uploads; the chunk digests find uploads that
+start with an earlier upload (the same export with rows appended), so only
+the new tail has to be parsed.
+"""
+import hashlib
+import tempfile
+
+# Bytes per chunk digest; also the read size while hashing
+CHUNK_SIZE = 1 << 20
+
+# Uploads up to this size are spooled in memory when the stream cannot seek
+SPOOL_BYTES = 8 * 1024 * 1024
+
+
+class ContentDigest:
+    """SHA-256 of an upload and of each of its CHUNK_SIZE chunks."""
+
+    def __init__(self, digest, chunks, size, ends_with_newline):
+        self.digest = digest
+        self.chunks = chunks
+        self.size = size
+        self.ends_with_newline = ends_with_newline
+
+    def prefix_of(self, other, stream):
+        """True if ``other`` (hashed from ``stream``) starts with this content
+        and continues after a line break.
+
+        Whole chunks compare by digest; only the final partial chunk is
+        re-read from ``stream`` to check it.
+        """
+        if other.size <= self.size or not self.ends_with_newline:
+            return False
+        whole, partial = divmod(self.size, CHUNK_SIZE)
+        if self.chunks[:whole] != other.chunks[:whole]:
+            return False
+        if partial:
+            stream.seek(whole * CHUNK_SIZE)
+            if hashlib.sha256(stream.read(partial)).hexdigest() != self.chunks[whole]:
+                return False
+        return True
+
+    def to_dict(self):
+        return {'sha256': self.digest, 'bytes': self.size}
+
+
+def seekable(stream):
+    """``stream`` itself if it can seek, else a spooled copy of it."""
+    if getattr(stream, 'seekable', lambda: False)():
+        return stream
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    for block in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        spooled.write(block)
+    spooled.seek(0)
+    return spooled
+
+
+def digest_stream(stream):
+    """Hash a binary stream from its current position; rewinds it afterwards."""
+    start = stream.tell()
+    whole = hashlib.sha256()
+    chunks = []
+    size = 0
+    last = b''
+    for block in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        whole.update(block)
+        chunks.append(hashlib.sha256(block).hexdigest())
+        size += len(block)
+        last = block
+    stream.seek(start)
+    return ContentDigest(whole.hexdigest(), chunks, size, last.endswith(b'\n'))
@@ -0,0 +1,313 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/dataset.py
+import contextlib
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from .aggregate import AGGREGATES, reduce_groups
+from .column import NULL_CODE, float_list
+from .computed import ComputedColumn
+from .errors import DatasetError
+from .timeparse import NULL_TIME
+from .versions import VersionHistory
+
+KIND_LABELS = {'number': 'numeric', 'string': 'text', 'datetime': 'date/time'}
+
+
+class Dataset:
+    """An uploaded table held column by column.
+
+    ``version`` is bumped on every edit, undo and redo so that caches keyed
+    on ``(dataset.id, dataset.version)`` invalidate themselves; ``history``
+    records the edits (see versions.py).
+    """
+
+    def __init__(self, name, columns, dataset_id=None):
+        lengths = {len(column) for column in columns}
+        if len(lengths) > 1:
+            raise DatasetError('All columns must have the same number of rows')
+        self.id = dataset_id or uuid.uuid4().hex
+        self.name = name
+        self.columns = {column.name: column for column in columns}
+        # Published only once every column holds the row, so concurrent
+        # readers never see a half-appended row
+        self.row_count = lengths.pop() if lengths else 0
+        self.version = 1
+        self.created_at = time.time()
+        # Serialises writers (cell edits, appends); readers work on array views
+        self.lock = threading.RLock()
+        # ContentDigest of the upload this dataset was parsed from, if any
+        self.source = None
+        self._source_version = None
+        self.history = VersionHistory(self)
+
+    def set_source(self, content):
+        """Record the upload the current cells were parsed from."""
+        self.source = content
+        self._source_version = self.version
+
+    @property
+    def matches_source(self):
+        """True while the dataset still holds exactly its uploaded content."""
+        return self.source is not None and self.version == self._source_version
+
+    def column(self, name):
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise DatasetError(f"Unknown column '{name}'") from None
+
+    def editable_column(self, row, column_name):
+        """Column whose cell ``row`` may be edited; raises DatasetError if none is."""
+        if not 0 <= row < self.row_count:
+            raise DatasetError(f'Row {row} is out of range')
+        if not isinstance(column_name, str):
+            raise DatasetError("Each edit's 'column' must be a column name")
+        column = self.column(column_name)
+        if column.expression is not None:
+            raise DatasetError(f"Column '{column_name}' is computed from '{column.expression}' and cannot be edited")
+        return column
+
+    def set_cell(self, row, column_name, value):
+        """Overwrite a single cell and bump the dataset version."""
+        with self.step('edit cells'):
+            column = self.editable_column(row, column_name)
+            self.history.save_cells(column, row, row + 1)
+            try:
+                column.set_value(row, value)
+                self._invalidate_computed(column_name, row, row + 1)
+            except (TypeError, ValueError):
+                # A non-numeric value in a numeric column turns it into text,
+                # matching how the DataGrid lets users type anything into a cell
+                self.history.save_column(column_name)
+                column = self.columns[column_name] = column.to_strings()
+                column.set_value(row, value)
+                self._invalidate_computed(column_name, 0, self.row_count)
+            self.version += 1
+
+    def append_rows(self, records):
+        """Append row dicts (missing keys become nulls); returns the first new row index."""
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise DatasetError('Expected a list of row objects')
+        unknown = {key for record in records for key in record} - set(self.columns)
+        if unknown:
+            raise DatasetError(f"Unknown column(s): {', '.join(sorted(unknown))}")
+        computed = {key for record in records for key in record if self.columns[key].expression is not None}
+        if computed:
+            raise DatasetError(f"Computed column(s) cannot be given values: {', '.join(sorted(computed))}")
+
+        with self.step('append rows'):
+            start = self.row_count
+            if not records:
+                return start
+            for name, column in list(self.columns.items()):
+                cells = [record.get(name) for record in records]
+                self.history.save_stats(column)
+                try:
+                    column.append(cells)
+                except (TypeError, ValueError):
+                    self.history.save_column(name)
+                    column = self.columns[name] = column.to_strings()
+                    column.append(cells)
+            self.row_count = start + len(records)
+            self.version += 1
+        return start
+
+    def add_computed(self, name, expression):
+        """Add a numeric column evaluated from ``expression`` (see computed.py)."""
+        if not isinstance(name, str) or not name.strip():
+            raise DatasetError("Missing column 'name'")
+        if name in self.columns:
+            raise DatasetError(f"Column '{name}' already exists")
+        with self.step('add column'):
+            column = ComputedColumn(name, expression, self)
+            for input_name in sorted(column.inputs):
+                if self.column(input_name).kind != 'number':
+                    raise DatasetError(f"Column '{input_name}' is not a numeric column")
+            self.history.save_column(name)
+            self.columns[name] = column
+            self.version += 1
+        return column
+
+    def remove_computed(self, name):
+        """Drop a computed column that no other computed column reads."""
+        with self.step('remove column'):
+            if self.column(name).expression is None:
+                raise DatasetError(f"Column '{name}' is not a computed column")
+            readers = [other.name for other in self.columns.values() if other.expression is not None and name in other.inputs]
+            if readers:
+                raise DatasetError(f"Column '{name}' is used by {', '.join(readers)}")
+            self.history.save_column(name)
+            del self.columns[name]
+            self.version += 1
+
+    @contextlib.contextmanager
+    def step(self, label):
+        """Hold the write lock and record the edits made inside as one undo step."""
+        with self.lock, self.history.step(label):
+            yield
+
+    def undo(self):
+        """Revert the latest edit step (a new version, like any edit)."""
+        with self.lock:
+            self.history.undo()
+
+    def redo(self):
+        """Reapply the latest undone step."""
+        with self.lock:
+            self.history.redo()
+
+    def compare(self, version):
+        """Cells, rows and columns that differ between ``version`` and now."""
+        with self.lock:
+            return self.history.compare(version)
+
+    def _invalidate_computed(self, name, start, end):
+        """Mark rows ``start:end`` stale in computed columns reading ``name``, directly or not."""
+        changed = {name}
+        # Computed columns only read columns added before them
+        for column in self.columns.values():
+            if column.expression is not None and column.inputs & changed:
+                column.invalidate(start, end)
+                changed.add(column.name)
+
+    def row_order(self, sort_by=None, descending=False):
+        """Index array ordering rows by ``sort_by``; None keeps upload order."""
+        if sort_by is None:
+            return None
+        return self.column(sort_by).argsort(descending)
+
+    def time_range(self, time_column, start=None, end=None):
+        """Boolean row mask of ``start <= time_column < end`` (bounds as text)."""
+        column = self._column_of_kind(time_column, 'datetime')
+        try:
+            return column.between(start, end)
+        except ValueError:
+            raise DatasetError(f"Could not parse range bounds for '{time_column}'") from None
+
+    def select(self, start=0, end=None, sort_by=None, descending=False, mask=None):
+        """Row indexer (slice or index array) for a filtered, sorted range."""
+        count = self.row_count
+        end = count if end is None else min(end, count)
+        order = self.row_order(sort_by, descending)
+        if order is not None and len(order) > count:
+            # Rows appended while sorting are not published yet
+            order = order[order < count]
+        if mask is not None:
+            mask = mask[:count]
+            order = np.flatnonzero(mask) if order is None else order[mask[order]]
+        return slice(start, end) if order is None else order[start:end]
+
+    def rows(self, start=0, end=None, orient='records', sort_by=None, descending=False, encoding=None, mask=None):
+        """Return rows ``start:end`` as a list of dicts or as column lists.
+
+        ``mask`` restricts the rows before sorting and slicing.  With
+        ``orient='columns'`` and ``encoding='dictionary'`` string columns are
+        sent as ``{"dictionary": [...], "codes": [...]}`` so each distinct
+        label crosses the wire once (datetime columns send epoch milliseconds).
+        """
+        rows = self.select(start, end, sort_by, descending, mask)
+        if orient == 'columns':
+            if encoding == 'dictionary':
+                return {name: column.to_wire(rows) for name, column in self.columns.items()}
+            return {name: column.to_list(rows) for name, column in self.columns.items()}
+        if orient != 'records':
+            raise DatasetError(f"Unknown orient '{orient}'")
+        data = {name: column.to_list(rows) for name, column in self.columns.items()}
+        names = list(data)
+        return [dict(zip(names, values)) for values in zip(*data.values())]
+
+    def group_by(self, by, value_column=None, how='count', mask=None):
+        """Aggregate ``value_column`` per distinct value of the text column ``by``.
+
+        Grouping runs on the dictionary codes with ``np.bincount``; groups come
+        back in lexical order and values that no longer occur (in the rows
+        selected by ``mask``) are dropped.
+        """
+        key = self._column_of_kind(by, 'string')
+        present = key.codes != NULL_CODE
+        if mask is not None:
+            present &= mask
+        weights = self._aggregate_input(value_column, how, present)
+
+        size = len(key.dictionary)
+        result, _ = reduce_groups(key.codes[present], size, how, weights)
+        occurring = np.flatnonzero(np.bincount(key.group_codes(mask if mask is not None else slice(None)), minlength=size))
+        occurring = occurring[np.argsort(key.sort_ranks()[occurring], kind='stable')]
+        return {
+            'keys': [key.dictionary[code] for code in occurring],
+            'values': float_list(result[occurring]),
+        }
+
+    def resample(self, time_column, value_column=None, unit='month', how='sum', mask=None):
+        """Aggregate ``value_column`` into ``unit`` buckets of a datetime column.
+
+        Bucketing floors the int64 timestamps with numpy datetime units, so the
+        whole operation stays vectorised.
+        """
+        times = self._column_of_kind(time_column, 'datetime')
+        present = times.values != NULL_TIME
+        if mask is not None:
+            present &= mask
+        weights = self._aggregate_input(value_column, how, present)
+        try:
+            buckets = times.buckets(unit, present)
+        except ValueError:
+            raise DatasetError(f"Unknown time unit '{unit}'") from None
+
+        keys, codes = np.unique(buckets, return_inverse=True)
+        result, _ = reduce_groups(codes.ravel(), len(keys), how, weights)
+        return {
+            'keys': np.datetime_as_string(keys).tolist(),
+            'values': float_list(result),
+        }
+
+    def _column_of_kind(self, name, kind):
+        column = self.column(name)
+        if column.kind != kind:
+            raise DatasetError(f"Column '{name}' is not a {KIND_LABELS[kind]} column")
+        return column
+
+    def _aggregate_input(self, value_column, how, present):
+        """Validate an aggregate request; narrows ``present`` to non-null values.
+
+        Returns the numeric values to aggregate, or None for a plain count.
+        """
+        if how not in AGGREGATES:
+            raise DatasetError(f"Unknown aggregate '{how}'")
+        if value_column is None:
+            if how != 'count':
+                raise DatasetError(f"Aggregate '{how}' needs a value column")
+            return None
+        values = self._column_of_kind(value_column, 'number').values
+        present &= ~np.isnan(values)
+        return values[present]
+
+    def suggested_axes(self):
+        """First column on the x-axis, remaining numeric columns as series."""
+        names = list(self.columns)
+        if not names:
+            return {'xAxisKey': None, 'yAxisKeys': []}
+        return {
+            'xAxisKey': names[0],
+            'yAxisKeys': [name for name in names[1:] if self.columns[name].kind == 'number'],
+        }
+
+    def describe(self):
+        """Metadata and per-column stats, without any row data."""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'version': self.version,
+            'rows': self.row_count,
+            'canUndo': self.history.can_undo,
+            'canRedo': self.history.can_redo,
+            'source': None if self.source is None else self.source.to_dict(),
+            'columns': [
+                {'name': name, **column.stats.to_dict(), **({'expression': column.expression} if column.expression else {})}
+                for name, column in self.columns.items()
+            ],
+            **self.suggested_axes(),
+        }
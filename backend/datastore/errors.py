@@ -0,0 +1,9 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/errors.py
+
+
+class DatasetError(ValueError):
+    """Raised when a dataset request cannot be satisfied (bad input, bad column, ...)."""
+
+
+class DatasetNotFound(DatasetError):
+    """Raised when a dataset ID is not known to the store."""
@@ -0,0 +1,218 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/export.py
+"""Streaming CSV and XLSX export straight from the columnar store.
+
+Rows are read, transformed and written BATCH_ROWS at a time, so an export
+of millions of rows starts downloading at once and holds only one batch of
+text in memory.  Filter, sort, transforms and formatOptions have the same
+meaning as in the frontend.
+"""
+import csv
+import io
+import json
+
+import numpy as np
+
+from .column import format_floats, format_value
+from .errors import DatasetError
+from .filters import filter_mask
+from .transforms import resolve_transforms, stream_transforms
+from .xlsx import stream_xlsx
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Rows read and written per step
+BATCH_ROWS = 10_000
+
+# Same shape and defaults as the `formatOptions` state in ChartContext
+DEFAULT_FORMAT_OPTIONS = {
+    'precision': 2,
+    'commaSeparator': True,
+    'decimalSeparator': '.',
+    'prefix': '',
+    'postfix': '',
+}
+
+
+class ExportSpec:
+    """Export request parsed from query-string style ``params``.
+
+    ``columns`` (default: all) are written in order; ``y`` names the series
+    columns that ``transforms`` and ``formatOptions`` (both JSON) apply to,
+    defaulting to the dataset's suggested y-axis keys.
+    """
+
+    def __init__(self, dataset, params, export_format):
+        if export_format not in EXPORT_FORMATS:
+            raise DatasetError(f"Unknown export format '{export_format}'")
+        self.format = export_format
+        self.columns = _names(params.get('columns')) or list(dataset.columns)
+        for name in self.columns:
+            dataset.column(name)
+        self.transforms, self.window = resolve_transforms(_json(params, 'transforms'))
+        self.format_options = _json(params, 'formatOptions')
+        if self.format_options is not None:
+            self.format_options = {**DEFAULT_FORMAT_OPTIONS, **self.format_options}
+            try:
+                self.format_options['precision'] = max(0, min(int(self.format_options['precision']), 20))
+            except (TypeError, ValueError):
+                raise DatasetError("'precision' must be a number") from None
+        y = _names(params.get('y')) or dataset.suggested_axes()['yAxisKeys']
+        self.series = [name for name in y if name in self.columns and dataset.column(name).kind == 'number']
+        self.filter = params.get('filter')
+        self.sort = params.get('sort') or None
+        self.descending = params.get('order') == 'descending'
+        self.time = params.get('time') or None
+        self.time_from = params.get('from')
+        self.time_to = params.get('to')
+        self.name = params.get('filename') or dataset.name
+
+
+def export_rows(dataset, params, export_format):
+    """``(chunks, mimetype, filename)`` for a streaming download of ``dataset``.
+
+    Everything that can fail (unknown columns, bad filter or options) is
+    checked here, before the first byte is sent.
+    """
+    spec = ExportSpec(dataset, params, export_format)
+    mask = filter_mask(dataset, spec.filter)
+    if spec.time:
+        time_mask = dataset.time_range(spec.time, spec.time_from, spec.time_to)
+        mask = time_mask if mask is None else mask & time_mask
+    rows = dataset.select(0, None, spec.sort, spec.descending, mask)
+    length = _length(rows)
+    header, batches = _batches(dataset, spec, rows, length)
+    if spec.format == 'csv':
+        chunks = _csv_chunks(header, batches, spec.format_options)
+    else:
+        chunks = stream_xlsx(header, batches, length, _excel_format(spec.format_options))
+    return chunks, EXPORT_FORMATS[spec.format], f'{spec.name}.{spec.format}'
+
+
+def _batches(dataset, spec, rows, length):
+    """Header ``[(name, is_series)]`` and a generator of per-batch columns.
+
+    Numeric columns come as float64 arrays, the others as lists of cells.
+    """
+    windows = list(_windows(rows, length))
+    streams = {
+        name: stream_transforms(
+            lambda column=dataset.column(name): (column.values[window] for window in windows),
+            spec.transforms, length,
+        )
+        for name in spec.series
+    }
+    header = [(name, name in streams) for name in spec.columns]
+    # stream_transforms gives no moving average for series shorter than the window
+    averaged = spec.series if spec.window is not None and 2 <= spec.window <= length else []
+    header += [(f'{name}_MA', True) for name in averaged]
+
+    def generate():
+        for window in windows:
+            results = {name: next(streams[name]) for name in spec.series}
+            columns = []
+            for name in spec.columns:
+                column = dataset.column(name)
+                if name in results:
+                    columns.append(results[name][0])
+                elif column.kind == 'number':
+                    columns.append(column.values[window])
+                else:
+                    columns.append(column.to_list(window))
+            columns += [results[name][1] for name in averaged]
+            yield columns
+
+    return header, generate()
+
+
+def _csv_chunks(header, batches, format_options):
+    number = _number_formatter(format_options)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    # Sent before any row is read, so the download starts at once
+    writer.writerow([name for name, _ in header])
+    yield buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    for columns in batches:
+        text_columns = [
+            [number(value) for value in _floats(column)] if is_series and format_options is not None else
+            format_floats(column) if isinstance(column, np.ndarray) else
+            ['' if value is None else format_value(value) for value in column]
+            for column, (_, is_series) in zip(columns, header)
+        ]
+        writer.writerows(zip(*text_columns))
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _number_formatter(options):
+    """formatNumber from ChartContext."""
+    if options is None:
+        return None
+    spec = f"{',' if options['commaSeparator'] else ''}.{options['precision']}f"
+    decimal = options['decimalSeparator'] or '.'
+    prefix, postfix = options['prefix'] or '', options['postfix'] or ''
+
+    def format_number(value):
+        if value is None:
+            return ''
+        text = format(value, spec)
+        if decimal != '.':
+            text = text.replace('.', decimal, 1)
+        return f'{prefix}{text}{postfix}'
+
+    return format_number
+
+
+def _excel_format(options):
+    """Excel number format code for formatOptions (Excel picks the decimal separator)."""
+    if options is None:
+        return 'General'
+    digits = '#,##0' if options['commaSeparator'] else '0'
+    if options['precision']:
+        digits += '.' + '0' * options['precision']
+    prefix = (options['prefix'] or '').replace('"', '')
+    postfix = (options['postfix'] or '').replace('"', '')
+    return (f'"{prefix}"' if prefix else '') + digits + (f'"{postfix}"' if postfix else '')
+
+
+def _windows(rows, length):
+    """Consecutive BATCH_ROWS pieces of a row indexer (slice or index array)."""
+    for offset in range(0, length, BATCH_ROWS):
+        if isinstance(rows, slice):
+            start = rows.start or 0
+            yield slice(start + offset, start + min(offset + BATCH_ROWS, length))
+        else:
+            yield rows[offset:offset + BATCH_ROWS]
+
+
+def _length(rows):
+    if isinstance(rows, slice):
+        return max(0, (rows.stop or 0) - (rows.start or 0))
+    return len(rows)
+
+
+def _floats(values):
+    """Python floats with None for NaN."""
+    return [None if value != value else value for value in values.tolist()]
+
+
+def _names(raw):
+    return [name for name in (raw or '').split(',') if name]
+
+
+def _json(params, name):
+    raw = params.get(name)
+    if not raw:
+        return None
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        raise DatasetError(f"'{name}' must be JSON") from None
+    if not isinstance(value, dict):
+        raise DatasetError(f"'{name}' must be a JSON object")
+    return value
@@ -0,0 +1,266 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/filters.py
+"""Row filter expressions compiled to boolean numpy masks.
+
+Grammar (keywords are case-insensitive)::
+
+    expr       := term ('OR' term)*
+    term       := factor ('AND' factor)*
+    factor     := 'NOT' factor | '(' expr ')' | comparison
+    comparison := column op value
+                | column ['NOT'] 'IN' '(' value (',' value)* ')'
+                | column 'BETWEEN' value 'AND' value
+                | column 'IS' ['NOT'] 'NULL'
+    op         := '=' | '==' | '!=' | '<>' | '<' | '<=' | '>' | '>='
+    column     := name | "quoted name"
+    value      := number | 'quoted text'
+
+For example ``revenue > 50000 AND region IN ('EU', 'US')``.  Every node has
+a canonical ``key``; masks are cached per ``(dataset, version, key)`` so a
+repeated predicate, or a shared sub-expression, is only evaluated once.
+"""
+import functools
+import re
+
+import numpy as np
+
+from .cache import LRUCache
+from .errors import DatasetError
+
+# Upper bound on memory held by cached filter masks (one byte per row each)
+MASK_CACHE_BYTES = 256 * 1024 * 1024
+
+KEYWORDS = {'AND', 'OR', 'NOT', 'IN', 'BETWEEN', 'IS', 'NULL'}
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+      | (?P<text>'(?:[^']|'')*')
+      | (?P<quoted>"(?:[^"]|"")*")
+      | (?P<op><=|>=|!=|<>|==|=|<|>)
+      | (?P<punct>[(),])
+      | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+
+_OPERATORS = {'==': '=', '<>': '!='}
+
+
+class FilterError(DatasetError):
+    """Raised for a filter expression that cannot be parsed or evaluated."""
+
+
+mask_cache = LRUCache(MASK_CACHE_BYTES)
+
+
+class Node:
+    """A parsed filter expression."""
+
+    key = None
+
+    def mask(self, dataset):
+        """Read-only boolean row mask over ``dataset``, cached per dataset version."""
+        return mask_cache.get_or_compute((dataset.id, dataset.version, self.key), lambda: _frozen(self.evaluate(dataset)))
+
+    def evaluate(self, dataset):
+        raise NotImplementedError
+
+    def columns(self):
+        """Names of the columns this expression reads."""
+        raise NotImplementedError
+
+
+class Comparison(Node):
+
+    def __init__(self, column, op, values):
+        self.column = column
+        self.op = op
+        self.values = values
+        self.key = f'{_quote_name(column)} {op} {", ".join(map(_literal, values))}'
+
+    def evaluate(self, dataset):
+        column = dataset.column(self.column)
+        try:
+            if self.op == 'IS NULL':
+                return column.null_mask()
+            if self.op == 'IS NOT NULL':
+                return ~column.null_mask()
+            if self.op == 'IN':
+                return column.isin(self.values)
+            if self.op == 'NOT IN':
+                # Like '!=', a null is neither in nor outside the list
+                return ~column.isin(self.values) & ~column.null_mask()
+            if self.op == 'BETWEEN':
+                return column.compare('>=', self.values[0]) & column.compare('<=', self.values[1])
+            return column.compare(self.op, self.values[0])
+        except (TypeError, ValueError):
+            raise FilterError(f"Cannot apply {self.op} to column '{self.column}' with those values") from None
+
+    def columns(self):
+        return {self.column}
+
+
+class Not(Node):
+
+    def __init__(self, operand):
+        self.operand = operand
+        self.key = f'NOT ({operand.key})'
+
+    def evaluate(self, dataset):
+        return ~self.operand.mask(dataset)
+
+    def columns(self):
+        return self.operand.columns()
+
+
+class BoolOp(Node):
+
+    def __init__(self, op, operands):
+        self.op = op
+        self.operands = operands
+        self.key = f' {op} '.join(f'({operand.key})' for operand in operands)
+
+    def evaluate(self, dataset):
+        combine = np.logical_and if self.op == 'AND' else np.logical_or
+        result = self.operands[0].mask(dataset).copy()
+        for operand in self.operands[1:]:
+            combine(result, operand.mask(dataset), out=result)
+        return result
+
+    def columns(self):
+        return set().union(*(operand.columns() for operand in self.operands))
+
+
+@functools.lru_cache(maxsize=512)
+def compile_filter(text):
+    """Parse a filter expression into a Node (cached by expression text)."""
+    parser = _Parser(_tokenize(text))
+    node = parser.expr()
+    if parser.peek() is not None:
+        raise FilterError(f"Unexpected '{parser.peek()[1]}' in filter")
+    return node
+
+
+def filter_mask(dataset, text):
+    """Row mask for a filter expression, or None for an empty expression."""
+    if not text or not text.strip():
+        return None
+    return compile_filter(text.strip()).mask(dataset)
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise FilterError(f'Unexpected character at position {position} in filter')
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'number':
+            tokens.append(('value', float(value)))
+        elif kind == 'text':
+            tokens.append(('value', value[1:-1].replace("''", "'")))
+        elif kind == 'quoted':
+            tokens.append(('name', value[1:-1].replace('""', '"')))
+        elif kind == 'op':
+            tokens.append(('op', _OPERATORS.get(value, value)))
+        elif kind == 'word' and value.upper() in KEYWORDS:
+            tokens.append(('keyword', value.upper()))
+        elif kind == 'word':
+            tokens.append(('name', value))
+        else:
+            tokens.append(('punct', value))
+    return tokens
+
+
+class _Parser:
+    """Recursive-descent parser over the token list."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token is None or (kind and token[0] != kind) or (value and token[1] != value):
+            expected = value or kind or 'more input'
+            found = 'end of filter' if token is None else f"'{token[1]}'"
+            raise FilterError(f'Expected {expected}, found {found}')
+        self.position += 1
+        return token[1]
+
+    def accept(self, kind, value):
+        token = self.peek()
+        if token is not None and token == (kind, value):
+            self.position += 1
+            return True
+        return False
+
+    def expr(self):
+        operands = [self.term()]
+        while self.accept('keyword', 'OR'):
+            operands.append(self.term())
+        return operands[0] if len(operands) == 1 else BoolOp('OR', operands)
+
+    def term(self):
+        operands = [self.factor()]
+        while self.accept('keyword', 'AND'):
+            operands.append(self.factor())
+        return operands[0] if len(operands) == 1 else BoolOp('AND', operands)
+
+    def factor(self):
+        if self.accept('keyword', 'NOT'):
+            return Not(self.factor())
+        if self.accept('punct', '('):
+            node = self.expr()
+            self.take('punct', ')')
+            return node
+        return self.comparison()
+
+    def comparison(self):
+        column = self.take('name')
+        if self.accept('keyword', 'IS'):
+            negated = self.accept('keyword', 'NOT')
+            self.take('keyword', 'NULL')
+            return Comparison(column, 'IS NOT NULL' if negated else 'IS NULL', ())
+        if self.accept('keyword', 'BETWEEN'):
+            low = self.take('value')
+            self.take('keyword', 'AND')
+            return Comparison(column, 'BETWEEN', (low, self.take('value')))
+        negated = self.accept('keyword', 'NOT')
+        if negated or self.accept('keyword', 'IN'):
+            if negated:
+                self.take('keyword', 'IN')
+            return Comparison(column, 'NOT IN' if negated else 'IN', self.value_list())
+        return Comparison(column, self.take('op'), (self.take('value'),))
+
+    def value_list(self):
+        self.take('punct', '(')
+        values = [self.take('value')]
+        while self.accept('punct', ','):
+            values.append(self.take('value'))
+        self.take('punct', ')')
+        # Order does not matter for IN, so sort for a canonical cache key
+        return tuple(sorted(set(values), key=lambda value: (isinstance(value, str), value)))
+
+
+def _frozen(mask):
+    # Cached masks are shared between requests, so nobody may modify them
+    mask.flags.writeable = False
+    return mask
+
+
+def _quote_name(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value):
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(value)
@@ -0,0 +1,336 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/forecast.py
+"""Trend lines and forecasts: polynomial regression and Holt-Winters smoothing.
+
+Regression is fitted from power sums of the (rescaled) x values, so even
+millions of rows cost a few vectorised passes and no n-by-degree matrix.
+Holt-Winters is a sequential recurrence; it runs on date buckets (``unit``)
+or on series of at most SMOOTHING_MAX_POINTS rows.
+
+Results are cached per dataset version, so repeated chart renders of an
+unchanged dataset do not refit.
+"""
+from statistics import NormalDist
+
+import numpy as np
+
+from .aggregate import reduce_groups
+from .cache import LRUCache
+from .column import float_list
+from .errors import DatasetError
+from .filters import filter_mask
+from .timeparse import BUCKET_UNITS, advance, format_times
+
+METHODS = ('linear', 'polynomial', 'holt-winters')
+
+MAX_DEGREE = 6
+
+# Points the fitted line is returned at; a chart cannot show more
+DEFAULT_POINTS = 200
+MAX_POINTS = 5000
+
+MAX_HORIZON = 1000
+
+# Longest series Holt-Winters runs on without resampling by date
+SMOOTHING_MAX_POINTS = 50_000
+
+# Holt-Winters smoothing factors when the request gives none
+DEFAULT_SMOOTHING = {'alpha': 0.5, 'beta': 0.1, 'gamma': 0.1}
+
+TREND_CACHE_BYTES = 32 * 1024 * 1024
+
+# Rough length of each date granularity, to turn a mean gap into whole units
+_GRANULARITY_MS = {'month': 2_629_746_000, 'day': 86_400_000, 'minute': 60_000, 'second': 1000}
+
+
+def _result_size(result):
+    return 32 * (len(result['fit']['x']) + len(result['forecast']['x'])) + 1024
+
+
+trend_cache = LRUCache(TREND_CACHE_BYTES, sizeof=_result_size)
+
+
+class TrendSpec:
+    """Trend request parsed from query-string style ``params``."""
+
+    def __init__(self, params):
+        self.column = params.get('column')
+        if not self.column:
+            raise DatasetError("Missing 'column'")
+        self.x = params.get('x') or None
+        self.method = params.get('method', 'linear')
+        if self.method not in METHODS:
+            raise DatasetError(f"Unknown trend method '{self.method}'")
+        self.filter = (params.get('filter') or '').strip()
+        self.unit = params.get('unit') or None
+        if self.unit is not None and self.unit not in BUCKET_UNITS:
+            raise DatasetError(f"Unknown time unit '{self.unit}'")
+
+        default_degree = 2 if self.method == 'polynomial' else 1
+        self.degree = _number(params, 'degree', default_degree, int, 1, MAX_DEGREE)
+        if self.method == 'linear':
+            self.degree = 1
+        self.horizon = _number(params, 'horizon', 0, int, 0, MAX_HORIZON)
+        self.points = _number(params, 'points', DEFAULT_POINTS, int, 2, MAX_POINTS)
+        self.confidence = _number(params, 'confidence', 0.95, float, 0.5, 0.999)
+        self.season = _number(params, 'season', 0, int, 0, SMOOTHING_MAX_POINTS // 2)
+        self.smoothing = {
+            name: _number(params, name, default, float, 0.0, 1.0)
+            for name, default in DEFAULT_SMOOTHING.items()
+        }
+
+    @property
+    def key(self):
+        return (
+            self.column, self.x, self.method, self.filter, self.unit, self.degree, self.horizon,
+            self.points, self.confidence, self.season, tuple(self.smoothing.values()),
+        )
+
+
+class _Series:
+    """Non-null (x, y) pairs to fit, with a way to label x positions."""
+
+    def __init__(self, x, y, label, step, calendar=None):
+        self.x = x
+        self.y = y
+        self.label = label
+        # Typical x distance between consecutive points, used to place forecasts
+        self.step = step
+        # (granularity, units per step) when x holds epoch-ms dates
+        self.calendar = calendar
+
+    def ahead(self, horizon):
+        """x positions of the next ``horizon`` points after the last one."""
+        steps = np.arange(1, horizon + 1)
+        last = float(self.x.max())
+        if self.calendar is None:
+            return last + self.step * steps
+        granularity, units = self.calendar
+        # Calendar steps, so monthly data forecasts the 1st of each next month
+        return advance(last, granularity, steps * units).astype(np.float64)
+
+
+def fit_trend(dataset, params):
+    """Trend line and optional forecast for one numeric column of ``dataset``.
+
+    ``lower``/``upper`` hold a confidence band around the fitted line and a
+    prediction interval around forecasts, at ``confidence`` (default 0.95).
+    """
+    spec = TrendSpec(params)
+    version = dataset.version
+    key = (dataset.id, version) + spec.key
+    return trend_cache.get_or_compute(key, lambda: _fit(dataset, spec, version))
+
+
+def _fit(dataset, spec, version):
+    series = _series(dataset, spec)
+    z = NormalDist().inv_cdf(0.5 + spec.confidence / 2)
+    if spec.method == 'holt-winters':
+        result = _holt_winters(series, spec, z)
+    else:
+        result = _regression(series, spec, z)
+    result.update({
+        'column': spec.column,
+        'x': spec.x,
+        'method': spec.method,
+        'version': version,
+        'points': len(series.y),
+    })
+    return result
+
+
+def _series(dataset, spec):
+    count = dataset.row_count
+    column = dataset.column(spec.column)
+    if column.kind != 'number':
+        raise DatasetError(f"Column '{spec.column}' is not numeric")
+    x_column = None if spec.x is None else dataset.column(spec.x)
+    if x_column is not None and x_column.kind == 'string':
+        raise DatasetError(f"Trend x column '{spec.x}' must be numeric or a date")
+    if spec.unit is not None and (x_column is None or x_column.kind != 'datetime'):
+        raise DatasetError("'unit' needs a date 'x' column")
+
+    values = column.values[:count]
+    present = ~np.isnan(values)
+    if x_column is not None:
+        present &= ~x_column.null_mask()[:count]
+    mask = filter_mask(dataset, spec.filter)
+    if mask is not None:
+        present &= mask[:count]
+    if present.all():
+        # Nothing to drop: slicing shares memory where a boolean index would copy
+        present = slice(None)
+    y = values[present]
+
+    if x_column is None:
+        x = np.arange(count, dtype=np.float64)[present]
+        return _Series(x, y, lambda xs: np.round(xs).astype(np.int64).tolist(), 1.0)
+    if x_column.kind == 'number':
+        x = x_column.values[:count][present]
+        return _Series(x, y, float_list, _mean_step(x))
+
+    if spec.unit is None:
+        x = x_column.values[:count][present].astype(np.float64)
+        granularity = x_column.granularity
+        step = _mean_step(x)
+        return _Series(
+            x, y,
+            lambda xs: format_times(np.round(xs).astype(np.int64), granularity).tolist(),
+            step, (granularity, max(1, round(step / _GRANULARITY_MS[granularity]))),
+        )
+
+    # Bucket means, with x as the bucket's ordinal in its numpy unit
+    keys, codes = np.unique(x_column.buckets(spec.unit, present), return_inverse=True)
+    means, _ = reduce_groups(codes.ravel(), len(keys), 'mean', y)
+    numpy_unit = BUCKET_UNITS[spec.unit]
+    return _Series(
+        keys.astype(np.int64).astype(np.float64), means,
+        lambda xs: np.datetime_as_string(np.round(xs).astype(np.int64).astype(f'datetime64[{numpy_unit}]')).tolist(),
+        3.0 if spec.unit == 'quarter' else 1.0,
+    )
+
+
+def _regression(series, spec, z):
+    x, y = series.x, series.y
+    degree = spec.degree
+    n = len(y)
+    if n <= degree + 1:
+        raise DatasetError(f'A degree-{degree} trend needs more than {degree + 1} points')
+
+    # Rescale x to -1..1 so high powers of epoch milliseconds stay well conditioned
+    low, high = float(x.min()), float(x.max())
+    center = (low + high) / 2
+    half = (high - low) / 2 or 1.0
+    u = x - center
+    u /= half
+    mean = float(y.mean())
+    centered = y - mean
+
+    # Normal equations from sums of u**k and y*u**k, one pass per power
+    power_sums = np.empty(2 * degree + 1)
+    moments = np.empty(degree + 1)
+    power_sums[0], moments[0] = n, 0.0
+    power = u.copy()
+    for k in range(1, 2 * degree + 1):
+        power_sums[k] = power.sum()
+        if k <= degree:
+            moments[k] = power @ centered
+        if k < 2 * degree:
+            power *= u
+    gram = power_sums[np.add.outer(np.arange(degree + 1), np.arange(degree + 1))]
+    inverse = np.linalg.pinv(gram)
+    coefficients = inverse @ moments
+
+    # At the least-squares solution SSE = y.y - c.m (y centred), so no residual pass
+    total = float(centered @ centered)
+    sse = max(total - float(coefficients @ moments), 0.0)
+    sigma = np.sqrt(sse / (n - degree - 1))
+    coefficients[0] += mean
+
+    def evaluate(xs, prediction):
+        design = np.vander((xs - center) / half, degree + 1, increasing=True)
+        leverage = np.einsum('ij,jk,ik->i', design, inverse, design)
+        width = z * sigma * np.sqrt(leverage + 1.0 if prediction else leverage)
+        fitted = design @ coefficients
+        return {
+            'x': series.label(xs),
+            'values': float_list(fitted),
+            'lower': float_list(fitted - width),
+            'upper': float_list(fitted + width),
+        }
+
+    result = {
+        'fit': evaluate(np.linspace(low, high, min(spec.points, n)), False),
+        'forecast': evaluate(series.ahead(spec.horizon), True),
+        'residualStd': float(sigma),
+        'rSquared': 1 - sse / total if total else 1.0,
+    }
+    if degree == 1:
+        result['slopePerStep'] = float(coefficients[1] / half * series.step)
+    return result
+
+
+def _holt_winters(series, spec, z):
+    """Additive Holt-Winters (Holt's linear method when ``season`` is 0)."""
+    n = len(series.y)
+    if n > SMOOTHING_MAX_POINTS:
+        raise DatasetError(
+            f'Holt-Winters runs on at most {SMOOTHING_MAX_POINTS} points; '
+            "pass a date 'x' and a 'unit' to resample first"
+        )
+    season = spec.season
+    if n < max(2 * season, 3):
+        raise DatasetError(f'Holt-Winters needs at least {max(2 * season, 3)} points')
+    order = np.argsort(series.x, kind='stable')
+    x, y = series.x[order], series.y[order]
+    alpha, beta, gamma = spec.smoothing['alpha'], spec.smoothing['beta'], spec.smoothing['gamma']
+
+    if season:
+        level = float(y[:season].mean())
+        trend = float((y[season:2 * season].mean() - level) / season)
+        seasonals = (y[:season] - level).tolist()
+    else:
+        level, trend = float(y[0]), float(y[1] - y[0])
+        seasonals = [0.0]
+    period = len(seasonals)
+
+    # Sequential by nature; plain floats keep the loop cheap
+    fitted = []
+    for i, value in enumerate(y.tolist()):
+        seasonal = seasonals[i % period]
+        fitted.append(level + trend + seasonal)
+        new_level = alpha * (value - seasonal) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        if season:
+            seasonals[i % period] = gamma * (value - new_level) + (1 - gamma) * seasonal
+        level = new_level
+    fitted = np.array(fitted)
+
+    # One-step-ahead errors after the initialisation window
+    errors = (y - fitted)[max(season, 1):]
+    sigma = float(np.sqrt(np.mean(errors ** 2)))
+
+    steps = np.arange(1, spec.horizon + 1)
+    forecast = level + steps * trend + np.array([seasonals[(n + h - 1) % period] for h in steps.tolist()])
+    # Error variance grows with the horizon (additive Holt-Winters, h-step ahead)
+    growth = alpha * (1 + np.arange(1, spec.horizon) * beta)
+    if season:
+        growth = growth + gamma * (np.arange(1, spec.horizon) % season == 0)
+    variance = np.concatenate(([1.0], 1.0 + np.cumsum(growth ** 2)))[:spec.horizon]
+    forecast_width = z * sigma * np.sqrt(variance)
+
+    shown = np.unique(np.linspace(0, n - 1, min(spec.points, n)).round().astype(np.intp))
+    return {
+        'fit': {
+            'x': series.label(x[shown]),
+            'values': float_list(fitted[shown]),
+            'lower': float_list(fitted[shown] - z * sigma),
+            'upper': float_list(fitted[shown] + z * sigma),
+        },
+        'forecast': {
+            'x': series.label(series.ahead(spec.horizon)),
+            'values': float_list(forecast),
+            'lower': float_list(forecast - forecast_width),
+            'upper': float_list(forecast + forecast_width),
+        },
+        'residualStd': sigma,
+        'parameters': {'alpha': alpha, 'beta': beta, 'gamma': gamma, 'season': season},
+    }
+
+
+def _mean_step(x):
+    if len(x) < 2:
+        return 1.0
+    return float((x.max() - x.min()) / (len(x) - 1)) or 1.0
+
+
+def _number(params, name, default, cast, low, high):
+    raw = params.get(name)
+    if raw is None or raw == '':
+        return default
+    try:
+        value = cast(raw)
+    except (TypeError, ValueError):
+        raise DatasetError(f"'{name}' must be a number") from None
+    if not low <= value <= high:
+        raise DatasetError(f"'{name}' must be between {low} and {high}")
+    return value
@@ -0,0 +1,142 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/ingest.py
+import codecs
+import csv
+from itertools import zip_longest
+
+import numpy as np
+
+from .column import NULL_TOKENS, Column
+from .content import digest_stream, seekable
+from .dataset import Dataset
+from .errors import DatasetError
+from .versions import VersionHistory
+
+
+def import_csv(store, stream, name):
+    """Content-addressed CSV upload into ``store``.
+
+    Returns ``(dataset, reused)``: ``reused`` is 'content' when a
+    byte-identical upload is still held (nothing is parsed), 'prefix' when
+    the upload extends an earlier one (its columns are copied and only the
+    new rows parsed), else None.
+    """
+    stream = seekable(stream)
+    content = digest_stream(stream)
+    existing = store.find_content(content.digest)
+    if existing is not None:
+        return existing, 'content'
+
+    dataset = None
+    reused = None
+    base = store.find_prefix(content, stream)
+    if base is not None:
+        dataset = _extend(base, stream, name)
+        reused = 'prefix'
+    if dataset is None:
+        stream.seek(0)
+        dataset = read_csv(stream, name)
+        reused = None
+    dataset.set_source(content)
+    store.add(dataset)
+    return dataset, reused
+
+
+def _extend(base, stream, name):
+    """Copy of ``base`` with the rows after its upload appended.
+
+    Returns None whenever the result could differ from parsing the whole
+    file: when the new rows change a column's type, or hold dates a full
+    parse would not read with the column's format.  Only the parsing of the
+    earlier rows is saved; the copy holds its own arrays, so the two
+    datasets take as much memory as two full uploads.
+    """
+    stream.seek(base.source.size)
+    records = _read_tail(stream, list(base.columns))
+    for column_name, column in base.columns.items():
+        if column.kind == 'datetime' and not _fits_format(column, [record[column_name] for record in records]):
+            return None
+    dataset = Dataset(name, [column.copy() for column in base.columns.values()])
+    dataset.append_rows(records)
+    if any(dataset.columns[column_name].kind != column.kind for column_name, column in base.columns.items()):
+        return None
+    # The appended rows are part of the upload, not an edit to undo
+    dataset.history = VersionHistory(dataset)
+    return dataset
+
+
+def _fits_format(column, cells):
+    """True if every non-null (stripped) cell parses with ``column``'s own date format.
+
+    DatetimeColumn.append also takes other ISO text, which a full parse,
+    checking every cell against one format, would leave as text.
+    """
+    text = np.array([cell for cell in cells if cell not in NULL_TOKENS], dtype=np.str_)
+    try:
+        column.time_format.parse(text)
+    except ValueError:
+        return False
+    return True
+
+
+def read_csv(stream, name):
+    """Parse a binary CSV stream (header row first) into a Dataset."""
+    reader = csv.reader(codecs.iterdecode(stream, 'utf-8-sig'))
+    try:
+        header = next(reader)
+    except StopIteration:
+        raise DatasetError('No data found in CSV') from None
+    except UnicodeDecodeError:
+        raise DatasetError('CSV must be UTF-8 encoded') from None
+
+    rows = _data_rows(reader)
+    if not rows:
+        raise DatasetError('No data found in CSV')
+
+    header = unique_names(header)
+    cells = list(zip_longest(*rows, fillvalue=''))[:len(header)]
+    cells += [('',) * len(rows)] * (len(header) - len(cells))
+    columns = [Column.from_strings(column_name, list(values)) for column_name, values in zip(header, cells)]
+    return Dataset(name, columns)
+
+
+def read_records(records, name):
+    """Build a Dataset from a list of row dicts (the frontend's chartData shape)."""
+    if not isinstance(records, list) or not records or not all(isinstance(r, dict) for r in records):
+        raise DatasetError('Expected a non-empty list of row objects')
+    names = list(dict.fromkeys(key for record in records for key in record))
+    columns = [Column.from_values(column_name, [record.get(column_name) for record in records]) for column_name in names]
+    return Dataset(name, columns)
+
+
+def _read_tail(stream, names):
+    """Row dicts for the header-less CSV rows left in ``stream``."""
+    rows = _data_rows(csv.reader(codecs.iterdecode(stream, 'utf-8')))
+    # Cells are stripped, short rows padded and long ones cut, as in read_csv
+    return [
+        dict(zip_longest(names, [cell.strip() for cell in row[:len(names)]], fillvalue=''))
+        for row in rows
+    ]
+
+
+def _data_rows(reader):
+    try:
+        # Skip blank lines, as PapaParse does with skipEmptyLines
+        return [row for row in reader if any(cell.strip() for cell in row)]
+    except (csv.Error, UnicodeDecodeError) as error:
+        raise DatasetError(f'Failed to parse CSV: {error}') from None
+
+
+def unique_names(header):
+    """Fill blank header cells and de-duplicate repeated column names."""
+    names = []
+    seen = set()
+    for index, raw in enumerate(header):
+        base = raw.strip() or f'column{index + 1}'
+        candidate = base
+        suffix = 1
+        while candidate in seen:
+            suffix += 1
+            candidate = f'{base}_{suffix}'
+        seen.add(candidate)
+        names.append(candidate)
+    return names
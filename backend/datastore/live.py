@@ -0,0 +1,224 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/live.py
+"""Push newly appended rows to subscribed charts.
+
+Appends only notify subscribers; each subscriber then reads the rows it has
+not sent yet straight from the dataset, so several quick appends collapse
+into one event.  Running totals come from the column stats (updated per
+append) and cumulative sums / moving averages carry their state forward, so
+no event costs more than the rows it contains.
+"""
+import json
+import threading
+import time
+
+import numpy as np
+
+from .column import float_list
+from .errors import DatasetError
+from .transforms import moving_average
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_SECONDS = 15
+
+# Minimum seconds between two events on one stream; appends in between are batched
+MIN_EVENT_INTERVAL = 0.25
+
+# Most rows sent in a single event (a reconnecting client catches up in chunks)
+MAX_EVENT_ROWS = 5000
+
+
+class RunningSeries:
+    """Cumulative and moving-average state for one streamed column."""
+
+    def __init__(self, cumulative=False, window=None):
+        self.cumulative = cumulative
+        self.window = window if window and window >= 2 else None
+        self.total = 0.0
+        # Last window - 1 transformed values, enough to continue the average
+        self.tail = np.zeros(0)
+
+    def update(self, values):
+        """Transform a chunk of new float64 values; returns ``(values, averages)``."""
+        if self.cumulative:
+            running = np.nancumsum(values) + self.total
+            self.total = running[-1] if len(running) else self.total
+            running[np.isnan(values)] = np.nan
+            values = running
+
+        averages = None
+        if self.window:
+            history = np.concatenate([self.tail, values])
+            averages = moving_average(history, self.window)
+            averages = np.full(len(values), np.nan) if averages is None else averages[len(self.tail):]
+            self.tail = history[-(self.window - 1):]
+        return values, averages
+
+
+class Subscription:
+    """One client's view of a dataset's appended rows."""
+
+    def __init__(self, dataset, columns, x=None, since=None, tail=None, cumulative=False, window=None):
+        for name in columns:
+            if dataset.column(name).kind != 'number':
+                raise DatasetError(f"Column '{name}' is not numeric")
+        if x is not None:
+            dataset.column(x)
+        self.dataset = dataset
+        self.columns = columns
+        self.x = x
+        if since is None:
+            # A new subscriber gets the last ``tail`` rows, or only rows appended from now on
+            since = dataset.row_count - (tail or 0)
+        self.position = max(0, min(since, dataset.row_count))
+        self.series = {name: RunningSeries(cumulative, window) for name in columns}
+        self._wake = threading.Event()
+        self.closed = False
+        if self.position < dataset.row_count and (cumulative or window):
+            self._prime()
+
+    def _prime(self, columns=None):
+        # Resuming mid-stream: seed the running state from the rows already sent
+        columns = columns or self._columns()
+        for name, series in self.series.items():
+            series.update(columns[name].values[:self.position])
+
+    def _columns(self):
+        """Streamed columns, looked up once per event.
+
+        Raises ``DatasetError`` once an edit has turned one into text (or a
+        computed one was removed).
+        """
+        columns = {}
+        for name in self.series:
+            column = self.dataset.columns.get(name)
+            if column is None or column.kind != 'number':
+                raise DatasetError(f"Column '{name}' is no longer a numeric column")
+            columns[name] = column
+        return columns
+
+    def notify(self):
+        self._wake.set()
+
+    def close(self):
+        self.closed = True
+        self._wake.set()
+
+    def next_event(self):
+        """Payload for rows not yet sent, or None if there are none."""
+        columns = self._columns()
+        if self.position > self.dataset.row_count:
+            return self._truncate(columns)
+        end = min(self.dataset.row_count, self.position + MAX_EVENT_ROWS)
+        if end <= self.position:
+            return None
+        rows = slice(self.position, end)
+        payload = {
+            'start': self.position,
+            'end': end,
+            'version': self.dataset.version,
+            'series': {},
+            'totals': {},
+        }
+        if self.x is not None:
+            payload['x'] = self.dataset.column(self.x).to_list(rows)
+        for name, series in self.series.items():
+            column = columns[name]
+            values, averages = series.update(column.values[rows])
+            entry = {'values': float_list(values)}
+            if averages is not None:
+                entry['movingAverage'] = float_list(averages)
+            payload['series'][name] = entry
+            payload['totals'][name] = _totals(column)
+        self.position = end
+        return payload
+
+    def _truncate(self, columns):
+        # An append was undone: the client drops the rows from ``end`` on
+        self.position = self.dataset.row_count
+        self.series = {name: RunningSeries(series.cumulative, series.window) for name, series in self.series.items()}
+        self._prime(columns)
+        return {
+            'start': self.position,
+            'end': self.position,
+            'version': self.dataset.version,
+            'truncated': True,
+            'series': {},
+            'totals': {name: _totals(column) for name, column in columns.items()},
+        }
+
+    def events(self):
+        """Server-Sent Events text for this subscription, until closed."""
+        yield 'retry: 3000\n\n'
+        last_sent = 0.0
+        while not self.closed:
+            try:
+                payload = self.next_event()
+            except DatasetError as error:
+                # Tell the client to stop instead of reconnecting to a stream
+                # that can no longer be served
+                yield f"event: stopped\ndata: {json.dumps({'error': str(error)})}\n\n"
+                return
+            if payload is not None:
+                last_sent = time.monotonic()
+                yield f"id: {payload['end']}\nevent: rows\ndata: {json.dumps(payload)}\n\n"
+                continue
+            if not self._wake.wait(HEARTBEAT_SECONDS):
+                yield ': keepalive\n\n'
+                continue
+            self._wake.clear()
+            # Batch bursts of appends into one event
+            delay = MIN_EVENT_INTERVAL - (time.monotonic() - last_sent)
+            if delay > 0:
+                time.sleep(delay)
+
+
+def _totals(column):
+    stats = column.stats
+    return {
+        'count': stats.count,
+        'sum': stats.sum,
+        'min': stats.min,
+        'max': stats.max,
+        'mean': stats.mean,
+    }
+
+
+class LiveHub:
+    """Registry of open subscriptions per dataset."""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, dataset, columns, **options):
+        subscription = Subscription(dataset, columns, **options)
+        with self._lock:
+            self._subscriptions.setdefault(dataset.id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, dataset_id, subscription):
+        subscription.close()
+        with self._lock:
+            subscribers = self._subscriptions.get(dataset_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[dataset_id]
+
+    def publish(self, dataset_id):
+        """Wake every subscriber of ``dataset_id`` after an append."""
+        with self._lock:
+            subscribers = list(self._subscriptions.get(dataset_id, ()))
+        for subscription in subscribers:
+            subscription.notify()
+
+    def close_dataset(self, dataset_id):
+        """End all streams of a deleted dataset."""
+        with self._lock:
+            subscribers = self._subscriptions.pop(dataset_id, set())
+        for subscription in subscribers:
+            subscription.close()
+
+
+# Shared hub used by the API routes
+hub = LiveHub()
@@ -0,0 +1,147 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/memory.py
+"""RAM budget for the dataset store, enforced by spilling to disk.
+
+When the cells of all datasets plus the derived caches (filter masks, trend
+fits) exceed ``max_bytes``, datasets are spilled coldest first: each column
+is written to a compressed block file (see blocks.py) and its arrays are
+dropped; requests already reading them carry on with their references.
+Victims are picked by idle time weighted by size, so one large dataset
+nobody looked at for a while goes before many small recent ones.  A spilled
+dataset's cache entries are dropped with it, and caches are trimmed as a
+last resort.
+
+A spilled column is read back into memory the first time its cells are
+touched, so a request charting two columns of a wide dataset reloads just
+those two, and range filters over spilled columns skip blocks by their
+min/max.  Callers never see the difference.  Dictionaries of text columns
+stay in memory; only the per-row arrays are spilled.
+"""
+import atexit
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from .cache import all_caches
+from .column import reload_count
+
+
+class MemoryBudget:
+    """Keeps resident dataset and cache bytes under ``max_bytes`` (None: no limit).
+
+    ``datasets`` is a callable returning every dataset of the store.
+    """
+
+    def __init__(self, datasets, max_bytes=None, spill_dir=None):
+        self._datasets = datasets
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self._directory = None
+        # Dataset id -> time.monotonic() of its last access
+        self._last_used = {}
+        self._generation = itertools.count()
+        self.spills = 0
+        self._lock = threading.RLock()
+
+    def configure(self, max_bytes=None, spill_dir=None):
+        """Set the budget (bytes) and where spill files go (default: a temp dir)."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self.spill_dir = spill_dir
+        self.enforce()
+
+    def touch(self, dataset):
+        """Record an access to ``dataset``, then enforce the budget."""
+        self._last_used[dataset.id] = time.monotonic()
+        if self.max_bytes is not None:
+            self.enforce(keep=dataset)
+
+    def forget(self, dataset):
+        """Drop the bookkeeping and spill files of a removed dataset."""
+        with self._lock:
+            self._last_used.pop(dataset.id, None)
+        if self._directory is not None:
+            shutil.rmtree(os.path.join(self._directory, dataset.id), ignore_errors=True)
+
+    def enforce(self, keep=None):
+        """Spill cold datasets (never ``keep``), then trim caches, until within budget."""
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            datasets = self._datasets()
+            resident = sum(_resident_bytes(dataset) for dataset in datasets) + _cache_bytes()
+            if resident <= self.max_bytes:
+                return
+            now = time.monotonic()
+            candidates = [dataset for dataset in datasets if dataset is not keep and _resident_bytes(dataset)]
+            candidates.sort(
+                key=lambda dataset: (now - self._last_used.get(dataset.id, 0)) * _resident_bytes(dataset),
+                reverse=True,
+            )
+            for dataset in candidates:
+                if resident <= self.max_bytes:
+                    break
+                resident -= self._spill(dataset)
+            for cache in sorted(all_caches(), key=lambda cache: cache.current_bytes, reverse=True):
+                if resident <= self.max_bytes:
+                    break
+                resident -= cache.shrink(resident - self.max_bytes)
+
+    def snapshot(self):
+        """Resident and spilled bytes, for monitoring."""
+        with self._lock:
+            datasets = self._datasets()
+            return {
+                "budgetBytes": self.max_bytes,
+                "residentBytes": sum(_resident_bytes(dataset) for dataset in datasets),
+                "cacheBytes": _cache_bytes(),
+                "spilledBytes": sum(_spilled_bytes(dataset) for dataset in datasets),
+                "datasets": len(datasets),
+                "spilledDatasets": sum(1 for dataset in datasets if _spilled_bytes(dataset)),
+                "spills": self.spills,
+                "reloads": reload_count(),
+            }
+
+    def _spill(self, dataset):
+        """Spill every resident column of ``dataset``; returns the bytes freed."""
+        freed = 0
+        directory = os.path.join(self._spill_directory(), dataset.id)
+        os.makedirs(directory, exist_ok=True)
+        generation = next(self._generation)
+        with dataset.lock:
+            for index, column in enumerate(list(dataset.columns.values())):
+                held = column.nbytes
+                if not held:
+                    continue
+                # A fresh name per spill: readers may still map an older file
+                column.spill(os.path.join(directory, f'{generation}-{index}.blocks'))
+                freed += held
+        freed += sum(cache.discard(lambda key: key[0] == dataset.id) for cache in all_caches())
+        self.spills += 1
+        return freed
+
+    def _spill_directory(self):
+        if self._directory is None:
+            if self.spill_dir:
+                # One directory per worker process, as each has its own store
+                self._directory = os.path.join(self.spill_dir, f'worker-{os.getpid()}')
+                os.makedirs(self._directory, exist_ok=True)
+            else:
+                self._directory = tempfile.mkdtemp(prefix='bizcharts-spill-')
+            atexit.register(shutil.rmtree, self._directory, True)
+        return self._directory
+
+
+def _resident_bytes(dataset):
+    # Undo images stay in memory whatever is spilled
+    return sum(column.nbytes for column in list(dataset.columns.values())) + dataset.history.nbytes
+
+
+def _spilled_bytes(dataset):
+    return sum(column.spilled_bytes for column in list(dataset.columns.values()))
+
+
+def _cache_bytes():
+    return sum(cache.current_bytes for cache in all_caches())
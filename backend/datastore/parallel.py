@@ -0,0 +1,183 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/parallel.py
+"""Splitting one large computation across cores.
+
+numpy holds the GIL through bincount, ``ufunc.at`` and friends, so a
+group-by over tens of millions of rows runs on one core however many
+threads the server has.  Above PARALLEL_MIN_ROWS rows the engine cuts the
+inputs into one chunk per worker process and merges the partial results:
+
+- ``reduce`` runs a kernel per chunk and returns the small per-chunk
+  results (group sums, counts, min/max, totals) for the caller to combine;
+- ``transform`` fills one output row per input row, giving each chunk a
+  halo of preceding rows for windowed kernels and per-chunk arguments such
+  as cumulative offsets.
+
+Arrays travel as memory-mapped files under /dev/shm (a temp dir where that
+is missing): the caller writes each input once and workers map it, so no
+cell is pickled, and workers write their output rows straight into a shared
+result.  Kernels must be module-level functions so workers can import them.
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+# Web worker processes sharing this machine (gunicorn.conf.py reads the same variable)
+WEB_WORKERS = max(int(os.environ.get('WEB_CONCURRENCY', 4)), 1)
+
+# Worker processes per web worker; 1 keeps everything in-process.  The
+# default gives each web worker its share of the cores, so all pools
+# together start one process per core
+PARALLEL_WORKERS = int(os.environ.get('BIZCHARTS_PARALLEL_WORKERS', max((os.cpu_count() or 1) // WEB_WORKERS, 1)))
+
+# Inputs shorter than this are computed in-process, where the hand-off
+# would cost more than it saves.  Every parallel call copies its input
+# arrays into shared memory (8 bytes per row per float column, about a
+# memcpy of the column) and workers map them afresh; column buffers are
+# not kept mapped between calls, so this copy is paid on each call
+PARALLEL_MIN_ROWS = int(os.environ.get('BIZCHARTS_PARALLEL_MIN_ROWS', 2_000_000))
+
+# RAM-backed where available, so shared arrays never touch a disk
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# Workers are started from a clean server process rather than forked from a
+# threaded web worker
+_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class ProcessPool:
+    """Lazily started pool of worker processes running chunked kernels."""
+
+    def __init__(self, workers=PARALLEL_WORKERS, min_rows=PARALLEL_MIN_ROWS):
+        self.workers = workers
+        self.min_rows = min_rows
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def engaged(self, rows):
+        """True if ``rows`` rows are worth splitting across processes."""
+        return self.workers > 1 and rows >= self.min_rows
+
+    def split(self, rows):
+        """``(start, end)`` of each worker's chunk of ``rows`` rows."""
+        bounds = np.linspace(0, rows, self.workers + 1).astype(np.int64).tolist()
+        return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+    def reduce(self, kernel, arrays, *args):
+        """``[kernel(*chunks, *args)]`` per chunk, in row order.
+
+        ``arrays`` are equally long 1-d arrays (None is passed through).
+        """
+        rows = len(arrays[0])
+        with _SharedArrays() as shared:
+            specs = [shared.put(array) for array in arrays]
+            return self._gather(_reduce_chunk, [
+                (kernel, specs, start, end, args) for start, end in self.split(rows)
+            ])
+
+    def transform(self, kernel, arrays, *args, halo=0, chunk_args=None, dtype=np.float64):
+        """Array of ``kernel(lead, *chunks, *args, *chunk_args[i])`` per chunk, concatenated.
+
+        Each chunk also gets up to ``halo`` preceding rows; ``lead`` is how
+        many it got, and the kernel returns results for the rows after them.
+        ``chunk_args`` are extra arguments per chunk, as returned by ``split``.
+        """
+        rows = len(arrays[0])
+        chunks = self.split(rows)
+        with _SharedArrays() as shared:
+            specs = [shared.put(array) for array in arrays]
+            target, result = shared.empty(rows, dtype)
+            self._gather(_transform_chunk, [
+                (kernel, specs, target, start, end, halo, args + tuple(chunk_args[index] if chunk_args else ()))
+                for index, (start, end) in enumerate(chunks)
+            ])
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    def _gather(self, function, tasks):
+        executor = self._start()
+        futures = [executor.submit(function, *task) for task in tasks]
+        try:
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start afresh next time
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+
+    def _start(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(_START_METHOD))
+            return self._executor
+
+
+class _SharedArrays:
+    """Memory-mapped files holding the arrays of one parallel call.
+
+    Files are unlinked on exit; mappings (such as a returned result) stay
+    valid until garbage collected.
+    """
+
+    def __init__(self):
+        self._paths = []
+
+    def put(self, array):
+        """Copy ``array`` into a shared file; returns its spec (None for None)."""
+        if array is None:
+            return None
+        spec, mapped = self.empty(len(array), array.dtype)
+        mapped[:] = array
+        return spec
+
+    def empty(self, length, dtype):
+        """Spec of a new shared file and an array mapping it."""
+        handle, path = tempfile.mkstemp(prefix='bizcharts-parallel-', dir=SHARED_DIR)
+        os.close(handle)
+        self._paths.append(path)
+        dtype = np.dtype(dtype)
+        mapped = np.memmap(path, dtype=dtype, mode='w+', shape=(max(length, 1),))[:length]
+        return (path, dtype.str, length), mapped.view(np.ndarray)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        for path in self._paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _open(spec, mode='r'):
+    if spec is None:
+        return None
+    path, dtype, length = spec
+    return np.memmap(path, dtype=np.dtype(dtype), mode=mode, shape=(max(length, 1),))[:length]
+
+
+def _reduce_chunk(kernel, specs, start, end, args):
+    chunks = [None if array is None else array[start:end] for array in map(_open, specs)]
+    return kernel(*chunks, *args)
+
+
+def _transform_chunk(kernel, specs, target, start, end, halo, args):
+    first = max(start - halo, 0)
+    chunks = [None if array is None else array[first:end] for array in map(_open, specs)]
+    _open(target, 'r+')[start:end] = kernel(start - first, *chunks, *args)
+
+
+# Pool used by the data engine in this worker
+pool = ProcessPool()
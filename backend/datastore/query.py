@@ -0,0 +1,176 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/query.py
+"""Batch series queries: many (dataset, column, transform, range) specs at once.
+
+Specs that select the same rows of the same dataset (same filter, sort and
+range) share one selection, and each column is read once per selection no
+matter how many series use it.
+"""
+import numpy as np
+
+from .column import float_list
+from .errors import DatasetError
+from .filters import filter_mask
+from .transforms import apply_transforms
+
+ALIGNMENTS = ('x', 'index')
+
+# Most series a single batch may ask for
+MAX_SERIES = 64
+
+
+class SeriesSpec:
+    """One requested series, parsed from its JSON description."""
+
+    def __init__(self, raw, index):
+        if not isinstance(raw, dict):
+            raise DatasetError(f'Series {index} must be an object')
+        try:
+            self.dataset_id = raw['dataset']
+            self.column = raw['column']
+        except KeyError as error:
+            raise DatasetError(f'Series {index} is missing {error}') from None
+        if not isinstance(self.dataset_id, str) or not isinstance(self.column, str):
+            raise DatasetError(f"Series {index} needs 'dataset' and 'column' names")
+        self.x = raw.get('x')
+        self.label = raw.get('label') or self.column
+        self.transforms = raw.get('transforms')
+        self.filter = (raw.get('filter') or '').strip()
+        self.sort = raw.get('sort') or None
+        self.descending = raw.get('order') == 'descending'
+        try:
+            self.start = int(raw.get('start', 0))
+            self.end = None if raw.get('end') is None else int(raw['end'])
+        except (TypeError, ValueError):
+            raise DatasetError(f"Series {index} has a non-numeric 'start' or 'end'") from None
+
+    @property
+    def selection_key(self):
+        return (self.dataset_id, self.filter, self.sort, self.descending, self.start, self.end)
+
+
+class _Selection:
+    """Rows chosen for a group of specs, plus per-column reads of those rows."""
+
+    def __init__(self, dataset, spec):
+        self.dataset = dataset
+        self.version = dataset.version
+        mask = filter_mask(dataset, spec.filter)
+        self.rows = dataset.select(spec.start, spec.end, spec.sort, spec.descending, mask)
+        # Whole-column selections can use ingest-time stats instead of rescans;
+        # negative bounds count from the end, as in the slice select builds
+        start, end, _ = slice(spec.start, spec.end).indices(dataset.row_count)
+        self.whole_column = mask is None and start == 0 and end == dataset.row_count
+        self._values = {}
+        self._labels = {}
+
+    def values(self, name):
+        if name not in self._values:
+            column = self.dataset.column(name)
+            if column.kind != 'number':
+                raise DatasetError(f"Column '{name}' is not numeric")
+            self._values[name] = column.values[self.rows]
+        return self._values[name]
+
+    def labels(self, name):
+        if name not in self._labels:
+            self._labels[name] = self.dataset.column(name).to_list(self.rows)
+        return self._labels[name]
+
+
+def run_batch(store, raw_specs, align='x'):
+    """Evaluate a list of series specs against ``store`` in one pass.
+
+    With ``align='x'`` every series is placed on the union of their x labels
+    (nulls where a series has no row for a label; a repeated label keeps its
+    last value).  With ``align='index'`` series are lined up by position and
+    each one carries its own ``x`` labels.
+    """
+    if align not in ALIGNMENTS:
+        raise DatasetError(f"Unknown alignment '{align}'")
+    if not isinstance(raw_specs, list) or not raw_specs:
+        raise DatasetError("Expected a non-empty list of 'series'")
+    if len(raw_specs) > MAX_SERIES:
+        raise DatasetError(f'At most {MAX_SERIES} series can be requested at once')
+
+    specs = [SeriesSpec(raw, index) for index, raw in enumerate(raw_specs)]
+    selections = {}
+    results = []
+    for spec in specs:
+        selection = selections.get(spec.selection_key)
+        if selection is None:
+            selection = selections[spec.selection_key] = _Selection(store.get(spec.dataset_id), spec)
+        dataset = selection.dataset
+        x_column = spec.x or dataset.suggested_axes()['xAxisKey']
+        stats = dataset.column(spec.column).stats if selection.whole_column else None
+        values, averages = apply_transforms(selection.values(spec.column), spec.transforms, stats)
+        results.append({
+            'spec': spec,
+            'dataset': dataset,
+            'version': selection.version,
+            'x_column': x_column,
+            'x': selection.labels(x_column) if x_column else list(range(len(values))),
+            'values': values,
+            'averages': averages,
+        })
+
+    if align == 'x':
+        return _align_on_x(results)
+    return _align_on_index(results)
+
+
+def _align_on_x(results):
+    positions = {}
+    for result in results:
+        for label in result['x']:
+            if label is not None:
+                positions.setdefault(label, len(positions))
+    labels = list(positions)
+
+    kinds = {result['dataset'].column(result['x_column']).kind for result in results if result['x_column']}
+    if len(kinds) == 1 and kinds <= {'number', 'datetime'}:
+        # Numbers sort numerically and same-granularity ISO dates lexically
+        labels.sort()
+        positions = {label: index for index, label in enumerate(labels)}
+
+    series = []
+    for result in results:
+        present = [index for index, label in enumerate(result['x']) if label is not None]
+        targets = np.array([positions[result['x'][index]] for index in present], dtype=np.intp)
+        series.append(_series_json(result, lambda values: _scatter(values[present], targets, len(labels))))
+    return {'align': 'x', 'x': labels, 'series': series}
+
+
+def _align_on_index(results):
+    length = max(len(result['values']) for result in results)
+    series = []
+    for result in results:
+        entry = _series_json(result, lambda values: _pad(values, length))
+        entry['x'] = result['x']
+        series.append(entry)
+    return {'align': 'index', 'x': list(range(length)), 'series': series}
+
+
+def _series_json(result, place):
+    spec = result['spec']
+    entry = {
+        'label': spec.label,
+        'dataset': spec.dataset_id,
+        'column': spec.column,
+        'version': result['version'],
+        'values': float_list(place(result['values'])),
+    }
+    if result['averages'] is not None:
+        entry['movingAverage'] = float_list(place(result['averages']))
+    return entry
+
+
+def _scatter(values, targets, length):
+    aligned = np.full(length, np.nan)
+    aligned[targets] = values
+    return aligned
+
+
+def _pad(values, length):
+    padded = np.full(length, np.nan)
+    padded[:len(values)] = values
+    return padded
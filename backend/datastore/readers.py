@@ -0,0 +1,241 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/readers.py
+"""Parquet and Excel uploads.
+
+A chart needs its x-axis and series, not every column of a warehouse
+export, so both readers take a ReadSpec: the columns to keep and an
+optional half-open range ``from <= column < to``.  Parquet reads only the
+projected column chunks and skips row groups whose min/max statistics lie
+outside the range.  Excel sheets are streamed row by row (openpyxl's
+read-only mode) and cells of dropped columns are never converted.
+
+pyarrow and openpyxl are optional; without them these uploads get a 400.
+"""
+import os
+import zipfile
+
+import numpy as np
+
+from .column import Column, DatetimeColumn, NumberColumn
+from .content import seekable
+from .dataset import Dataset
+from .errors import DatasetError
+from .ingest import unique_names
+from .timeparse import FORMATS_BY_NAME, NULL_TIME
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for Parquet uploads
+    pa = pq = None
+
+try:
+    import openpyxl
+    from openpyxl.utils.exceptions import InvalidFileException
+except ImportError:  # optional: only needed for Excel uploads
+    openpyxl = None
+
+# Upload file extension -> reader format
+FILE_FORMATS = {
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.xlsx': 'excel',
+    '.xlsm': 'excel',
+}
+
+# Arrow types whose row-group min/max can rule out a range
+_PRUNABLE_TYPES = () if pa is None else (
+    pa.types.is_integer, pa.types.is_floating, pa.types.is_decimal, pa.types.is_timestamp, pa.types.is_date,
+)
+
+_MS_PER_DAY = 86_400_000
+_MS_PER_MINUTE = 60_000
+
+
+class ReadSpec:
+    """Projection and row range parsed from upload form fields.
+
+    ``columns`` (comma separated, default all) are kept in that order;
+    ``range``/``from``/``to`` keep rows with ``from <= range < to``, bounds
+    given as numbers or dates like the rows endpoint's ``time`` range.
+    ``sheet`` picks an Excel sheet (default the first).
+    """
+
+    def __init__(self, params):
+        self.columns = [name for name in (params.get('columns') or '').split(',') if name] or None
+        self.range_column = params.get('range') or None
+        self.start = params.get('from') or None
+        self.end = params.get('to') or None
+        self.sheet = params.get('sheet') or None
+
+    def read_names(self, available):
+        """Columns to read (kept ones plus the range column) out of ``available``."""
+        names = self.columns or list(available)
+        wanted = names + [self.range_column] if self.range_column and self.range_column not in names else names
+        unknown = [name for name in wanted if name not in available]
+        if unknown:
+            raise DatasetError(f"Unknown column(s): {', '.join(unknown)}")
+        return names, wanted
+
+
+def read_file(stream, filename, name, params):
+    """Dataset from a Parquet or Excel upload, chosen by ``filename``'s extension."""
+    file_format = FILE_FORMATS.get(os.path.splitext(filename or '')[1].lower())
+    if file_format is None:
+        raise DatasetError(f"Unsupported file type '{filename}'")
+    reader = read_parquet if file_format == 'parquet' else read_excel
+    return reader(seekable(stream), name, ReadSpec(params))
+
+
+def read_parquet(stream, name, spec):
+    """Dataset from a seekable Parquet stream, reading only what ``spec`` needs."""
+    if pq is None:
+        raise DatasetError('Parquet uploads need the pyarrow package')
+    try:
+        parquet = pq.ParquetFile(stream)
+    except (pa.ArrowException, OSError) as error:
+        raise DatasetError(f'Failed to read Parquet: {error}') from None
+    schema = parquet.schema_arrow
+    names, wanted = spec.read_names(schema.names)
+
+    groups = range(parquet.num_row_groups)
+    if spec.range_column is not None:
+        groups = [group for group in groups if _group_in_range(parquet, group, spec)]
+    try:
+        table = parquet.read_row_groups(groups, columns=wanted, use_threads=True)
+    except (pa.ArrowException, OSError) as error:
+        raise DatasetError(f'Failed to read Parquet: {error}') from None
+
+    if spec.range_column is not None:
+        mask = _range_mask(_arrow_column(spec.range_column, table.column(spec.range_column)), spec)
+        table = table.filter(pa.array(mask))
+    return Dataset(name, [_arrow_column(column_name, table.column(column_name)) for column_name in names])
+
+
+def read_excel(stream, name, spec):
+    """Dataset from one sheet of a seekable .xlsx stream.
+
+    The first non-blank row is the header; blank rows are skipped, as for CSV.
+    """
+    if openpyxl is None:
+        raise DatasetError('Excel uploads need the openpyxl package')
+    try:
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile, KeyError, ValueError) as error:
+        raise DatasetError(f'Failed to read Excel file: {error}') from None
+    try:
+        if spec.sheet is None:
+            sheet = workbook.worksheets[0]
+        elif spec.sheet in workbook.sheetnames:
+            sheet = workbook[spec.sheet]
+        else:
+            raise DatasetError(f"Unknown sheet '{spec.sheet}'")
+        rows = (row for row in sheet.iter_rows(values_only=True) if any(_present(cell) for cell in row))
+        header = next(rows, None)
+        if header is None:
+            raise DatasetError('No data found in sheet')
+        header = unique_names(['' if cell is None else str(cell) for cell in header])
+        names, wanted = spec.read_names(header)
+        positions = [header.index(column_name) for column_name in wanted]
+        cells = {column_name: [] for column_name in wanted}
+        lists = [cells[column_name] for column_name in wanted]
+        for row in rows:
+            for target, position in zip(lists, positions):
+                target.append(row[position] if position < len(row) else None)
+    finally:
+        workbook.close()
+
+    if not lists[0]:
+        raise DatasetError('No data found in sheet')
+    if spec.range_column is not None:
+        mask = _range_mask(_excel_column(spec.range_column, cells[spec.range_column]), spec)
+        cells = {
+            column_name: [cell for cell, keep in zip(values, mask) if keep]
+            for column_name, values in cells.items()
+        }
+    return Dataset(name, [_excel_column(column_name, cells[column_name]) for column_name in names])
+
+
+def _group_in_range(parquet, group, spec):
+    """False only when the row group's statistics prove no row is in range."""
+    field = parquet.schema_arrow.field(spec.range_column)
+    # Statistics of text columns order bytes, not the values typed from them
+    if not any(test(field.type) for test in _PRUNABLE_TYPES):
+        return True
+    row_group = parquet.metadata.row_group(group)
+    for index in range(row_group.num_columns):
+        chunk = row_group.column(index)
+        if chunk.path_in_schema != spec.range_column:
+            continue
+        stats = chunk.statistics
+        if stats is None or not stats.has_min_max:
+            return True
+        if stats.num_values == 0:
+            return False
+        # Compare through a two-cell column so bounds parse exactly as for rows
+        extremes = _arrow_column(spec.range_column, pa.chunked_array([pa.array([stats.min, stats.max], field.type)]))
+        below_end = _compare(extremes, '<', spec.end)
+        from_start = _compare(extremes, '>=', spec.start)
+        return bool(below_end[0] and from_start[1])
+    return True
+
+
+def _range_mask(column, spec):
+    """Boolean row mask of ``spec.start <= column < spec.end``."""
+    return _compare(column, '>=', spec.start) & _compare(column, '<', spec.end)
+
+
+def _compare(column, op, bound):
+    if bound is None:
+        return np.ones(len(column), dtype=bool)
+    try:
+        return column.compare(op, bound)
+    except (TypeError, ValueError):
+        raise DatasetError(f"Could not parse range bounds for '{column.name}'") from None
+
+
+def _arrow_column(name, array):
+    """Column from a pyarrow ChunkedArray; nulls map to the column's null."""
+    kind = array.type
+    if pa.types.is_dictionary(kind):
+        array, kind = array.cast(kind.value_type), kind.value_type
+    if pa.types.is_integer(kind) or pa.types.is_floating(kind) or pa.types.is_decimal(kind):
+        values = np.array(array.cast(pa.float64()).to_numpy(zero_copy_only=False), dtype=np.float64)
+        return NumberColumn(name, values)
+    if pa.types.is_timestamp(kind) or pa.types.is_date(kind):
+        if pa.types.is_date(kind):
+            array = array.cast(pa.date64())
+        else:
+            array = array.cast(pa.timestamp('ms', tz=kind.tz), safe=False)
+        values = np.array(array.cast(pa.int64()).fill_null(NULL_TIME).to_numpy(zero_copy_only=False), dtype=np.int64)
+        return _times_column(name, values, pa.types.is_date(kind))
+    try:
+        text = array.cast(pa.string()).fill_null('')
+    except pa.ArrowException:
+        raise DatasetError(f"Column '{name}' has an unsupported type ({kind})") from None
+    # Text is typed like CSV cells, so numbers or dates stored as strings still chart
+    return Column.from_strings(name, text.to_numpy(zero_copy_only=False))
+
+
+def _excel_column(name, cells):
+    """Column from openpyxl cell values (numbers, text, datetimes, None)."""
+    present = [cell for cell in cells if _present(cell)]
+    if present and all(hasattr(cell, 'year') for cell in present):
+        values = np.array([cell if _present(cell) else None for cell in cells], dtype='datetime64[ms]')
+        return _times_column(name, values.astype(np.int64), False)
+    return Column.from_values(name, [cell if _present(cell) else None for cell in cells])
+
+
+def _times_column(name, values, dates):
+    """DatetimeColumn rendered as precisely as the values need."""
+    present = values[values != NULL_TIME]
+    if dates or not (present % _MS_PER_DAY).any():
+        time_format = FORMATS_BY_NAME['iso-date']
+    elif not (present % _MS_PER_MINUTE).any():
+        time_format = FORMATS_BY_NAME['iso-minute']
+    else:
+        time_format = FORMATS_BY_NAME['iso-second']
+    return DatetimeColumn(name, values, time_format)
+
+
+def _present(cell):
+    return cell is not None and not (isinstance(cell, str) and not cell.strip())
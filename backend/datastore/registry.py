@@ -0,0 +1,77 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/registry.py
+import threading
+
+from .errors import DatasetNotFound
+from .memory import MemoryBudget
+
+
+class DatasetStore:
+    """Thread-safe in-memory registry of datasets for this worker.
+
+    ``memory`` enforces the worker's RAM budget: datasets may be spilled to
+    disk while idle and are read back column by column as they are used.
+    """
+
+    def __init__(self):
+        self._datasets = {}
+        # Upload SHA-256 -> dataset id, for content-addressed uploads
+        self._by_digest = {}
+        self._lock = threading.RLock()
+        self.memory = MemoryBudget(self.list)
+
+    def add(self, dataset):
+        with self._lock:
+            self._datasets[dataset.id] = dataset
+            if dataset.source is not None:
+                self._by_digest[dataset.source.digest] = dataset.id
+        self.memory.touch(dataset)
+        return dataset
+
+    def get(self, dataset_id):
+        with self._lock:
+            try:
+                dataset = self._datasets[dataset_id]
+            except KeyError:
+                raise DatasetNotFound(f"Dataset '{dataset_id}' not found") from None
+        self.memory.touch(dataset)
+        return dataset
+
+    def __contains__(self, dataset_id):
+        with self._lock:
+            return dataset_id in self._datasets
+
+    def remove(self, dataset_id):
+        with self._lock:
+            dataset = self._datasets.pop(dataset_id, None)
+            if dataset is None:
+                raise DatasetNotFound(f"Dataset '{dataset_id}' not found")
+            if dataset.source is not None and self._by_digest.get(dataset.source.digest) == dataset_id:
+                del self._by_digest[dataset.source.digest]
+        self.memory.forget(dataset)
+
+    def find_content(self, digest):
+        """Dataset still holding exactly the upload hashed to ``digest``, or None."""
+        with self._lock:
+            dataset = self._datasets.get(self._by_digest.get(digest))
+        if dataset is None or not dataset.matches_source:
+            return None
+        self.memory.touch(dataset)
+        return dataset
+
+    def find_prefix(self, content, stream):
+        """Largest unedited upload that ``content`` (read from ``stream``) extends, or None."""
+        with self._lock:
+            candidates = [dataset for dataset in self._datasets.values() if dataset.matches_source]
+        candidates.sort(key=lambda dataset: dataset.source.size, reverse=True)
+        for dataset in candidates:
+            if dataset.source.prefix_of(content, stream):
+                return dataset
+        return None
+
+    def list(self):
+        with self._lock:
+            return list(self._datasets.values())
+
+
+# Shared store used by the API routes
+store = DatasetStore()
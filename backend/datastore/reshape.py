@@ -0,0 +1,170 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/reshape.py
+"""Pivot (long to wide) and unpivot (wide to long) into new datasets.
+
+Warehouse exports are long (``date, metric, value``) while charts want one
+column per series.  Both operations work on whole columns: keys are
+factorised with a sort (``np.unique``), cells are aggregated with
+``np.bincount`` over ``row_key * series + series_key`` and unpivoting is
+``np.repeat``/``np.tile`` over row indexes, so no per-row Python objects are
+built however many rows or series there are.
+"""
+import numpy as np
+
+from .aggregate import AGGREGATES, reduce_groups
+from .column import DatetimeColumn, NumberColumn, StringColumn, format_value
+from .dataset import Dataset
+from .errors import DatasetError
+from .filters import filter_mask
+from .ingest import unique_names
+from .timeparse import format_times
+
+# Series (distinct values of the pivoted column) one pivot may create
+MAX_SERIES = 10_000
+
+# Cells (rows x columns) one reshape may produce
+MAX_CELLS = 50_000_000
+
+
+def pivot(dataset, params):
+    """Wide dataset with one row per ``index`` value and one column per ``columns`` value.
+
+    ``params``: ``index`` (the new x-axis, e.g. date), ``columns`` (the
+    column whose values become series, e.g. metric), ``values`` (numeric
+    cells; omit to count rows), ``agg`` (count, sum, mean, min, max; default
+    sum), ``filter`` and ``name``.
+    """
+    index = dataset.column(_required(params, 'index'))
+    series = dataset.column(_required(params, 'columns'))
+    if index is series:
+        raise DatasetError("'index' and 'columns' must be different columns")
+    values = dataset.column(params['values']) if params.get('values') else None
+    if values is not None and values.kind != 'number':
+        raise DatasetError(f"Column '{values.name}' is not a numeric column")
+    how = params.get('agg') or ('sum' if values is not None else 'count')
+    if how not in AGGREGATES:
+        raise DatasetError(f"Unknown aggregate '{how}'")
+    if values is None and how != 'count':
+        raise DatasetError(f"Aggregate '{how}' needs a 'values' column")
+
+    present = ~index.null_mask() & ~series.null_mask()
+    if values is not None:
+        present &= ~np.isnan(values.values)
+    mask = filter_mask(dataset, params.get('filter'))
+    if mask is not None:
+        present &= mask
+
+    row_keys, row_codes = _factorize(index, present)
+    series_keys, series_codes = _factorize(series, present)
+    if len(series_keys) > MAX_SERIES:
+        raise DatasetError(f"'{series.name}' has {len(series_keys)} distinct values; at most {MAX_SERIES} series are allowed")
+    size = len(row_keys) * len(series_keys)
+    if size > MAX_CELLS:
+        raise DatasetError(f'Pivot would create {size} cells; at most {MAX_CELLS} are allowed')
+
+    groups = row_codes.astype(np.int64) * len(series_keys) + series_codes
+    weights = None if values is None else values.values[present]
+    result, _ = reduce_groups(groups, size, how, weights)
+    # One contiguous array per series
+    table = np.ascontiguousarray(result.reshape(len(row_keys), len(series_keys)).T)
+
+    names = unique_names([index.name] + _labels(series, series_keys))
+    columns = [_key_column(names[0], index, row_keys)]
+    columns += [NumberColumn(name, table[position]) for position, name in enumerate(names[1:])]
+    return Dataset(params.get('name') or f'{dataset.name} (pivot)', columns)
+
+
+def unpivot(dataset, params):
+    """Long dataset with one row per (row, value column) of ``dataset``.
+
+    ``params``: ``keep`` (comma-separated id columns, e.g. date), ``columns``
+    (numeric columns to fold; default all other numeric columns), ``key`` and
+    ``value`` (names of the new columns, default 'series' and 'value'),
+    ``dropNulls``, ``filter`` and ``name``.
+    """
+    keep = _names(params.get('keep'))
+    for name in keep:
+        dataset.column(name)
+    folded = _names(params.get('columns')) or [
+        name for name, column in dataset.columns.items() if column.kind == 'number' and name not in keep
+    ]
+    if not folded:
+        raise DatasetError('No numeric columns to unpivot')
+    for name in folded:
+        if dataset.column(name).kind != 'number':
+            raise DatasetError(f"Column '{name}' is not a numeric column")
+        if name in keep:
+            raise DatasetError(f"Column '{name}' cannot be both kept and unpivoted")
+    key_name = params.get('key') or 'series'
+    value_name = params.get('value') or 'value'
+    if len({*keep, key_name, value_name}) != len(keep) + 2:
+        raise DatasetError("'key' and 'value' must be new, distinct column names")
+
+    mask = filter_mask(dataset, params.get('filter'))
+    source = np.arange(dataset.row_count) if mask is None else np.flatnonzero(mask[:dataset.row_count])
+    size = len(source) * len(folded)
+    if size * (len(keep) + 2) > MAX_CELLS:
+        raise DatasetError(f'Unpivot would create {size} rows; too many cells')
+
+    # Row-major: every folded column of a source row before the next row
+    rows = np.repeat(source, len(folded))
+    which = np.tile(np.arange(len(folded), dtype=np.int32), len(source))
+    cells = np.column_stack([dataset.column(name).values[source] for name in folded]).ravel()
+    if params.get('dropNulls') in (True, 'true'):
+        present = ~np.isnan(cells)
+        rows, which, cells = rows[present], which[present], cells[present]
+
+    # The key column's dictionary is sorted, like one built at ingest
+    order = sorted(range(len(folded)), key=lambda position: folded[position])
+    ranks = np.empty(len(folded), dtype=np.int32)
+    ranks[order] = np.arange(len(folded), dtype=np.int32)
+    columns = [dataset.column(name).take(rows) for name in keep]
+    columns.append(StringColumn(key_name, ranks[which], [folded[position] for position in order]))
+    columns.append(NumberColumn(value_name, cells))
+    return Dataset(params.get('name') or f'{dataset.name} (unpivot)', columns)
+
+
+def _factorize(column, present):
+    """Sorted distinct raw keys of ``column`` over ``present`` rows and each row's code."""
+    if column.kind != 'string':
+        keys, codes = np.unique(column.values[present], return_inverse=True)
+        return keys, codes.ravel()
+    # Dictionary codes are already small integers: a bincount finds the used
+    # ones without sorting the rows
+    raw = column.codes[present]
+    keys = np.flatnonzero(np.bincount(raw, minlength=len(column.dictionary)))
+    # Codes only sort lexically until edits append new values
+    keys = keys[np.argsort(column.sort_ranks()[keys], kind='stable')]
+    position = np.empty(len(column.dictionary), dtype=np.intp)
+    position[keys] = np.arange(len(keys))
+    return keys, position[raw]
+
+
+def _key_column(name, column, keys):
+    """Column holding the distinct ``keys`` of ``column``, one per row."""
+    if column.kind == 'number':
+        return NumberColumn(name, keys.astype(np.float64))
+    if column.kind == 'datetime':
+        return DatetimeColumn(name, keys.astype(np.int64), column.time_format)
+    return StringColumn(name, np.arange(len(keys), dtype=np.int32), [column.dictionary[code] for code in keys])
+
+
+def _labels(column, keys):
+    """Series names for the distinct ``keys`` of ``column``."""
+    if column.kind == 'string':
+        return [column.dictionary[code] for code in keys]
+    if column.kind == 'datetime':
+        return format_times(keys, column.granularity).tolist()
+    return [format_value(value) for value in keys.tolist()]
+
+
+def _required(params, name):
+    value = params.get(name)
+    if not value:
+        raise DatasetError(f"Missing '{name}' column")
+    return value
+
+
+def _names(raw):
+    if isinstance(raw, list):
+        return [name for name in raw if name]
+    return [name for name in (raw or '').split(',') if name]
@@ -0,0 +1,252 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/stats.py
+import math
+import zlib
+
+import numpy as np
+
+# Number of HyperLogLog registers is 2 ** HLL_PRECISION (~1.6% standard error at 12)
+HLL_PRECISION = 12
+
+# Upper bound on the number of rows kept in a column's quantile sample
+SKETCH_SIZE = 1024
+
+DEFAULT_QUANTILES = (0.0, 0.25, 0.5, 0.75, 1.0)
+
+
+def hash64(values):
+    """Vectorised splitmix64 finaliser over a uint64 array."""
+    z = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def hash_numbers(values):
+    """Hash non-null float64 values (0.0 and -0.0 hash the same)."""
+    return hash64((values + 0.0).view(np.uint64))
+
+
+def hash_strings(values):
+    """Hash an iterable of strings with a process-independent hash."""
+    crcs = np.fromiter((zlib.crc32(str(v).encode('utf-8')) for v in values), dtype=np.uint64)
+    return hash64(crcs)
+
+
+class DistinctSketch:
+    """HyperLogLog distinct-count estimator.
+
+    Registers only ever grow, so overwritten values are still counted; the
+    estimate is exact enough for cardinality hints, not for reporting.
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, hashes):
+        if len(hashes) == 0:
+            return
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.intp)
+        # Rank = position of the first set bit in the 32 bits after the index
+        tail = ((hashes << p) >> np.uint64(32)).astype(np.float64)
+        _, bit_length = np.frexp(tail)
+        rank = (33 - bit_length).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def estimate(self):
+        m = float(len(self.registers))
+        alpha = 0.7213 / (1.0 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is far more accurate for small cardinalities
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+
+class QuantileSketch:
+    """Every ``stride``-th row of a numeric column, used for approximate quantiles.
+
+    Sampling is positional, so a cell edit only has to touch the sample when
+    the edited row is one of the sampled ones.  Exact for columns of up to
+    SKETCH_SIZE rows.
+    """
+
+    def __init__(self, values, size=SKETCH_SIZE):
+        self.stride = max(1, -(-len(values) // size))
+        self.sample = np.array(values[::self.stride], dtype=np.float64)
+
+    def replace(self, row, value):
+        if row % self.stride == 0:
+            self.sample[row // self.stride] = value
+
+    def append(self, start, values):
+        """Sample rows ``start..start+len(values)`` appended to the column."""
+        first = -start % self.stride
+        self.sample = np.concatenate([self.sample, values[first::self.stride]])
+        while len(self.sample) > 2 * SKETCH_SIZE:
+            # sample[i] is row i * stride, so every other entry is row i * 2 * stride
+            self.sample = self.sample[::2].copy()
+            self.stride *= 2
+
+    def quantiles(self, qs=DEFAULT_QUANTILES):
+        valid = self.sample[~np.isnan(self.sample)]
+        if len(valid) == 0:
+            return [None] * len(qs)
+        return [float(q) for q in np.quantile(valid, qs)]
+
+
+class ColumnStats:
+    """Per-column profile computed once at ingest and kept current under edits.
+
+    Numeric columns track count, nulls, min, max, sum, mean, a distinct-count
+    estimate and a quantile sketch; datetime columns report the same minus
+    sum and mean; string columns track count, nulls and the distinct-count
+    estimate only.
+    """
+
+    def __init__(self, kind, row_count):
+        self.kind = kind
+        self.row_count = row_count
+        self.null_count = 0
+        self.min = None
+        self.max = None
+        self.sum = None
+        self.distinct = DistinctSketch()
+        self.quantile_sketch = None
+        # Set when an edit overwrote the current min/max; resolved by refresh()
+        self.stale_extremes = False
+
+    @classmethod
+    def for_numbers(cls, values):
+        """Profile a float64 array where NaN marks a null."""
+        stats = cls('number', len(values))
+        nulls = np.isnan(values)
+        stats.null_count = int(np.count_nonzero(nulls))
+        present = values[~nulls] if stats.null_count else values
+        if len(present):
+            stats.min = float(present.min())
+            stats.max = float(present.max())
+            stats.sum = float(present.sum())
+        else:
+            stats.sum = 0.0
+        stats.distinct.add(hash_numbers(present))
+        stats.quantile_sketch = QuantileSketch(values)
+        return stats
+
+    @classmethod
+    def for_times(cls, values):
+        """Profile epoch-millisecond timestamps given as float64 with NaN nulls."""
+        stats = cls.for_numbers(values)
+        stats.kind = 'datetime'
+        return stats
+
+    @classmethod
+    def for_categories(cls, dictionary, null_count, row_count):
+        """Profile a dictionary-encoded string column from its dictionary alone."""
+        stats = cls('string', row_count)
+        stats.null_count = null_count
+        stats.distinct.add(hash_strings(dictionary))
+        return stats
+
+    @property
+    def count(self):
+        return self.row_count - self.null_count
+
+    @property
+    def mean(self):
+        if self.sum is None or self.count == 0:
+            return None
+        return self.sum / self.count
+
+    def replace(self, row, old, new):
+        """Account for ``old`` being overwritten by ``new`` at ``row``.
+
+        Values use the column's storage representation (NaN / None for null).
+        """
+        old_null = _is_null(old)
+        new_null = _is_null(new)
+        self.null_count += int(new_null) - int(old_null)
+
+        if self.kind == 'string':
+            if not new_null:
+                self.distinct.add(hash_strings([new]))
+            return
+
+        if not old_null:
+            self.sum -= old
+            if old == self.min or old == self.max:
+                self.stale_extremes = True
+        if not new_null:
+            self.sum += new
+            self.distinct.add(hash_numbers(np.array([new], dtype=np.float64)))
+            if not self.stale_extremes:
+                self.min = new if self.min is None else min(self.min, new)
+                self.max = new if self.max is None else max(self.max, new)
+        if self.count == 0:
+            # Nothing left to sum: drop the rounding error the updates left behind
+            self.sum = 0.0
+        self.quantile_sketch.replace(row, new)
+
+    def append(self, values):
+        """Account for rows appended to a numeric or datetime column.
+
+        ``values`` is a float64 array with NaN nulls; only the new rows are
+        scanned.
+        """
+        start = self.row_count
+        nulls = np.isnan(values)
+        present = values[~nulls]
+        self.row_count += len(values)
+        self.null_count += int(np.count_nonzero(nulls))
+        if len(present):
+            self.sum += float(present.sum())
+            low, high = float(present.min()), float(present.max())
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+            self.distinct.add(hash_numbers(present))
+        self.quantile_sketch.append(start, values)
+
+    def append_categories(self, values):
+        """Account for strings (None for null) appended to a text column."""
+        present = [value for value in values if value is not None]
+        self.row_count += len(values)
+        self.null_count += len(values) - len(present)
+        self.distinct.add(hash_strings(set(present)))
+
+    def refresh(self, values):
+        """Recompute min/max from ``values`` if an edit invalidated them."""
+        if not self.stale_extremes:
+            return
+        present = values[~np.isnan(values)]
+        self.min = float(present.min()) if len(present) else None
+        self.max = float(present.max()) if len(present) else None
+        self.stale_extremes = False
+
+    def to_dict(self):
+        result = {
+            'type': self.kind,
+            'count': self.count,
+            'nullCount': self.null_count,
+            'distinct': self.distinct.estimate(),
+        }
+        if self.kind == 'number':
+            quantiles = self.quantile_sketch.quantiles()
+            # The sample may miss the extremes; the tracked min/max are exact
+            quantiles[0], quantiles[-1] = self.min, self.max
+            result.update({
+                'min': self.min,
+                'max': self.max,
+                'sum': self.sum,
+                'mean': self.mean,
+                'quantiles': dict(zip(('p0', 'p25', 'p50', 'p75', 'p100'), quantiles)),
+            })
+        elif self.kind == 'datetime':
+            # Epoch milliseconds; a sum or mean of timestamps means nothing
+            result.update({'min': self.min, 'max': self.max})
+        return result
+
+
+def _is_null(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
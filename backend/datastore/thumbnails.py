@@ -0,0 +1,395 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/thumbnails.py
+"""Small chart previews for the Dashboard gallery, rendered server-side.
+
+A thumbnail is drawn from the same rows and transforms as its chart, cut
+down to what its pixels can show: line and area series keep the first,
+last, lowest and highest point of each pixel column (so spikes survive),
+bars average the rows that fall into each bar and scatter plots keep one
+dot per dot-sized cell.  The result is an SVG string, or a PNG rasterised
+with numpy and written with zlib, and is cached per chart definition and
+dataset version: after an edit only the charts of the edited dataset are
+drawn again.
+"""
+import base64
+import hashlib
+import json
+import re
+import struct
+import zlib
+
+import numpy as np
+
+from .cache import LRUCache
+from .errors import DatasetError
+from .filters import filter_mask
+from .timeparse import NULL_TIME
+from .transforms import apply_transforms
+
+CHART_TYPES = ('line', 'area', 'bar', 'scatter')
+
+FORMATS = ('svg', 'png')
+
+# Thumbnail size in pixels when the chart gives none, and the largest allowed
+DEFAULT_SIZE = (160, 90)
+MAX_SIZE = (640, 360)
+
+# Thumbnails a single batch may ask for
+MAX_THUMBNAILS = 100
+
+# Series drawn per thumbnail; more cannot be told apart at this size
+MAX_SERIES = 8
+
+# Narrowest bar slot in pixels; longer series are averaged into fewer bars
+MIN_BAR_PIXELS = 3
+
+# LineChart's default series colours
+PALETTE = ('#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd')
+
+THUMBNAIL_CACHE_BYTES = 16 * 1024 * 1024
+
+# Blank border around the plot, in pixels
+_PADDING = 2
+
+# Scatter dot size in pixels
+_DOT = 2
+
+# Area fills are drawn at this opacity under their line
+_FILL_OPACITY = 0.3
+
+_COLOR = re.compile(r'#(?:[0-9a-fA-F]{3}){1,2}')
+
+
+def _result_size(result):
+    return len(result['svg'] if result['format'] == 'svg' else result['png']) + 256
+
+
+thumbnail_cache = LRUCache(THUMBNAIL_CACHE_BYTES, sizeof=_result_size)
+
+
+class ThumbnailSpec:
+    """One requested thumbnail, parsed from its chart definition."""
+
+    def __init__(self, raw, index, default_format='svg'):
+        if not isinstance(raw, dict):
+            raise DatasetError(f'Chart {index} must be an object')
+        self.id = raw.get('id', index)
+        self.dataset_id = raw.get('dataset')
+        if not self.dataset_id or not isinstance(self.dataset_id, str):
+            raise DatasetError(f"Chart {index} is missing 'dataset'")
+        self.type = raw.get('type') or 'line'
+        if self.type not in CHART_TYPES:
+            raise DatasetError(f"Unknown chart type '{self.type}'")
+        self.format = raw.get('format') or default_format
+        if self.format not in FORMATS:
+            raise DatasetError(f"Unknown thumbnail format '{self.format}'")
+        self.x = _name(raw, 'x', index)
+        y = raw.get('y') or []
+        if isinstance(y, str):
+            y = y.split(',')
+        if not isinstance(y, list) or not all(isinstance(name, str) for name in y):
+            raise DatasetError(f"Chart {index} needs 'y' as a list of column names")
+        self.y = [name for name in y if name]
+        if len(self.y) > MAX_SERIES:
+            raise DatasetError(f'At most {MAX_SERIES} series can be drawn in a thumbnail')
+        self.transforms = raw.get('transforms')
+        if self.transforms is not None and not isinstance(self.transforms, dict):
+            raise DatasetError(f"Chart {index} needs 'transforms' as an object")
+        self.filter = (_name(raw, 'filter', index) or '').strip()
+        self.sort = _name(raw, 'sort', index)
+        self.descending = raw.get('order') == 'descending'
+        try:
+            self.width = min(max(int(raw.get('width', DEFAULT_SIZE[0])), 16), MAX_SIZE[0])
+            self.height = min(max(int(raw.get('height', DEFAULT_SIZE[1])), 16), MAX_SIZE[1])
+        except (TypeError, ValueError):
+            raise DatasetError(f"Chart {index} has a non-numeric 'width' or 'height'") from None
+        colors = raw.get('colors')
+        if not isinstance(colors, list) or not colors:
+            colors = PALETTE
+        # Colours end up in SVG attributes; anything but #rgb / #rrggbb is dropped
+        self.colors = [color if isinstance(color, str) and _COLOR.fullmatch(color) else PALETTE[position % len(PALETTE)]
+                       for position, color in enumerate(colors)]
+        # Everything but the client's id decides the picture
+        definition = {key: value for key, value in raw.items() if key != 'id'}
+        definition['format'] = self.format
+        self.digest = hashlib.sha256(json.dumps(definition, sort_keys=True, default=str).encode()).hexdigest()[:20]
+
+
+def _name(raw, key, index):
+    """Optional string option ``key`` of a chart definition, or None."""
+    value = raw.get(key) or None
+    if value is not None and not isinstance(value, str):
+        raise DatasetError(f"Chart {index} needs '{key}' as a string")
+    return value
+
+
+def render_thumbnails(store, raw_charts, default_format='svg'):
+    """Thumbnails for a list of chart definitions, in request order.
+
+    A chart that cannot be drawn (unknown dataset or column, bad option)
+    gets an ``error`` entry instead of failing the whole gallery.
+    """
+    if not isinstance(raw_charts, list) or not raw_charts:
+        raise DatasetError("Expected a non-empty list of 'charts'")
+    if len(raw_charts) > MAX_THUMBNAILS:
+        raise DatasetError(f'At most {MAX_THUMBNAILS} thumbnails can be requested at once')
+    if default_format not in FORMATS:
+        raise DatasetError(f"Unknown thumbnail format '{default_format}'")
+
+    thumbnails = []
+    for index, raw in enumerate(raw_charts):
+        chart_id = raw.get('id', index) if isinstance(raw, dict) else index
+        try:
+            spec = ThumbnailSpec(raw, index, default_format)
+            dataset = store.get(spec.dataset_id)
+            version = dataset.version
+            result = thumbnail_cache.get_or_compute(
+                (dataset.id, version, spec.digest), lambda: render_thumbnail(dataset, spec, version))
+        except DatasetError as error:
+            thumbnails.append({'id': chart_id, 'error': str(error)})
+            continue
+        thumbnails.append({'id': chart_id, **result})
+    return {'thumbnails': thumbnails}
+
+
+def render_thumbnail(dataset, spec, version=None):
+    """``{key, version, format, width, height, svg | png}`` for one ThumbnailSpec."""
+    version = dataset.version if version is None else version
+    mask = filter_mask(dataset, spec.filter)
+    rows = dataset.select(0, None, spec.sort, spec.descending, mask)
+    whole_column = isinstance(rows, slice)
+    names = spec.y or dataset.suggested_axes()['yAxisKeys'][:MAX_SERIES]
+    series = []
+    for name in names:
+        column = dataset.column(name)
+        if column.kind != 'number':
+            raise DatasetError(f"Column '{name}' is not numeric")
+        values, _ = apply_transforms(column.values[rows], spec.transforms, column.stats if whole_column else None)
+        series.append(values)
+    x = _x_values(dataset, spec, rows) if spec.type == 'scatter' else None
+
+    plot = _Plot(spec, series, x)
+    marks = [plot.marks(values, spec.colors[position % len(spec.colors)], position, len(series))
+             for position, values in enumerate(series)]
+    result = {
+        'key': f'{spec.digest}-{version}',
+        'version': version,
+        'format': spec.format,
+        'width': spec.width,
+        'height': spec.height,
+    }
+    if spec.format == 'svg':
+        result['svg'] = _svg(spec, marks)
+    else:
+        result['png'] = 'data:image/png;base64,' + base64.b64encode(_png(spec, marks)).decode('ascii')
+    return result
+
+
+def _x_values(dataset, spec, rows):
+    column = dataset.column(spec.x or dataset.suggested_axes()['xAxisKey'])
+    if column.kind == 'number':
+        return column.values[rows]
+    if column.kind == 'datetime':
+        times = column.values[rows]
+        return np.where(times == NULL_TIME, np.nan, times.astype(np.float64))
+    raise DatasetError(f"Scatter thumbnails need a numeric or date x column, not '{column.name}'")
+
+
+class _Plot:
+    """Pixel geometry shared by every series of one thumbnail."""
+
+    def __init__(self, spec, series, x):
+        self.type = spec.type
+        self.left = self.top = _PADDING
+        self.width = spec.width - 2 * _PADDING
+        self.height = spec.height - 2 * _PADDING
+        self.x = x
+        self.x_range = _range([x]) if x is not None else None
+        self.bars = max(self.width // MIN_BAR_PIXELS, 1)
+        if self.type == 'bar':
+            series = [_bar_values(values, self.bars) for values in series]
+        low, high = _range(series)
+        if self.type in ('bar', 'area'):
+            # Bars and fills grow from zero
+            low, high = min(low, 0.0), max(high, 0.0)
+        self.low, self.high = low, high
+
+    def px(self, positions, count):
+        if count <= 1:
+            return np.full(len(positions), self.left + self.width / 2)
+        return self.left + positions * (self.width / (count - 1))
+
+    def py(self, values):
+        return self.top + (self.high - values) * (self.height / (self.high - self.low))
+
+    def marks(self, values, color, position, count):
+        """Drawing of one series: ``(shape, color, xs, ys, base)`` in pixels."""
+        base = float(self.py(np.float64(min(max(0.0, self.low), self.high))))
+        if self.type == 'bar':
+            heights = _bar_values(values, self.bars)
+            slots = len(heights)
+            slot = self.width / max(slots, 1)
+            # Series sit side by side in the middle 80% of each slot
+            bar = slot * 0.8 / count
+            starts = self.left + np.arange(slots) * slot + slot * 0.1 + position * bar
+            present = ~np.isnan(heights)
+            return ('bar', color, starts[present], self.py(heights[present]), base, bar)
+        if self.type == 'scatter':
+            present = ~np.isnan(values) & ~np.isnan(self.x)
+            low, high = self.x_range
+            xs = self.left + (self.x[present] - low) * (self.width / (high - low))
+            ys = self.py(values[present])
+            # One dot per cell of a grid as fine as the dots themselves
+            stride = self.width // _DOT + 2
+            cells = np.unique((ys // _DOT).astype(np.int64) * stride + (xs // _DOT).astype(np.int64))
+            xs, ys = (cells % stride) * _DOT + _DOT / 2, (cells // stride) * _DOT + _DOT / 2
+            return ('scatter', color, xs.astype(np.float64), ys.astype(np.float64), base, 0)
+        kept = _envelope(values, self.width)
+        return (self.type, color, self.px(kept, len(values)), self.py(values[kept]), base, 0)
+
+
+def _range(series):
+    """(low, high) over the finite values of every array, never empty or flat."""
+    lows = [np.nanmin(values) for values in series if len(values) and not np.isnan(values).all()]
+    highs = [np.nanmax(values) for values in series if len(values) and not np.isnan(values).all()]
+    if not lows:
+        return 0.0, 1.0
+    low, high = float(min(lows)), float(max(highs))
+    if low == high:
+        pad = abs(low) * 0.1 or 1.0
+        return low - pad, high + pad
+    return low, high
+
+
+def _envelope(values, buckets):
+    """Positions of the first, last, lowest and highest non-null value per pixel column."""
+    rows = np.flatnonzero(~np.isnan(values))
+    if len(rows) <= 4 * buckets:
+        return rows
+    bucket = rows * buckets // len(values)
+    firsts = np.flatnonzero(np.diff(bucket, prepend=-1))
+    lasts = np.append(firsts[1:], len(rows)) - 1
+    # Ordered by bucket, then value: each bucket's lowest comes first, highest last
+    order = np.lexsort((values[rows], bucket))
+    return np.unique(np.concatenate((rows[firsts], rows[lasts], rows[order[firsts]], rows[order[lasts]])))
+
+
+def _bar_values(values, slots):
+    """One value per bar: the rows themselves, or their mean over each of ``slots`` buckets."""
+    if len(values) <= slots:
+        return values
+    bucket = np.arange(len(values)) * slots // len(values)
+    present = ~np.isnan(values)
+    totals = np.bincount(bucket[present], weights=values[present], minlength=slots)
+    counts = np.bincount(bucket[present], minlength=slots)
+    with np.errstate(invalid='ignore'):
+        return totals / counts
+
+
+def _svg(spec, marks):
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{spec.width}" height="{spec.height}" '
+             f'viewBox="0 0 {spec.width} {spec.height}">']
+    for shape, color, xs, ys, base, bar in marks:
+        if not len(xs):
+            continue
+        if shape == 'bar':
+            path = ''.join(f'M{x:.1f} {min(y, base):.1f}h{bar:.1f}V{max(y, base):.1f}h{-bar:.1f}z'
+                           for x, y in zip(xs.tolist(), ys.tolist()))
+            parts.append(f'<path fill="{color}" d="{path}"/>')
+            continue
+        if shape == 'scatter':
+            path = ''.join(f'M{x - 1:.0f} {y - 1:.0f}h2v2h-2z' for x, y in zip(xs.tolist(), ys.tolist()))
+            parts.append(f'<path fill="{color}" d="{path}"/>')
+            continue
+        points = ' '.join(f'{x:.1f},{y:.1f}' for x, y in zip(xs.tolist(), ys.tolist()))
+        if shape == 'area':
+            parts.append(f'<polygon fill="{color}" fill-opacity="{_FILL_OPACITY}" stroke="none" '
+                         f'points="{xs[0]:.1f},{base:.1f} {points} {xs[-1]:.1f},{base:.1f}"/>')
+        parts.append(f'<polyline fill="none" stroke="{color}" stroke-width="1.5" '
+                     f'stroke-linejoin="round" points="{points}"/>')
+    parts.append('</svg>')
+    return ''.join(parts)
+
+
+def _png(spec, marks):
+    canvas = np.zeros((spec.height, spec.width, 4), dtype=np.uint8)
+    rows = np.arange(spec.height)[:, None]
+    for shape, color, xs, ys, base, bar in marks:
+        if not len(xs):
+            continue
+        rgb = _rgb(color)
+        if shape == 'bar':
+            mask = np.zeros(canvas.shape[:2], dtype=bool)
+            for x, y in zip(np.round(xs).astype(int).tolist(), np.round(ys).astype(int).tolist()):
+                top, bottom = sorted((y, int(round(base))))
+                mask[top:bottom + 1, x:x + max(int(round(bar)), 1)] = True
+            _blend(canvas, mask, rgb, 1.0)
+            continue
+        if shape == 'scatter':
+            mask = np.zeros(canvas.shape[:2], dtype=bool)
+            for dy in (-1, 0):
+                for dx in (-1, 0):
+                    _set(mask, xs + dx, ys + dy)
+            _blend(canvas, mask, rgb, 1.0)
+            continue
+        line_x, line_y = _trace(xs, ys)
+        if shape == 'area':
+            # Fill each pixel column between the line and the base, either side of zero
+            columns = np.clip(np.round(line_x).astype(int), 0, spec.width - 1)
+            tops, bottoms = np.full(spec.width, np.inf), np.full(spec.width, -np.inf)
+            np.minimum.at(tops, columns, line_y)
+            np.maximum.at(bottoms, columns, line_y)
+            drawn = np.isfinite(tops)
+            tops[drawn], bottoms[drawn] = np.minimum(tops[drawn], base), np.maximum(bottoms[drawn], base)
+            _blend(canvas, (rows >= np.round(tops)) & (rows <= np.round(bottoms)), rgb, _FILL_OPACITY)
+        mask = np.zeros(canvas.shape[:2], dtype=bool)
+        _set(mask, line_x, line_y)
+        _set(mask, line_x, line_y + 1)
+        _blend(canvas, mask, rgb, 1.0)
+
+    height, width = spec.height, spec.width
+    # Each scanline starts with filter type 0 (none)
+    raw = np.zeros((height, 1 + width * 4), dtype=np.uint8)
+    raw[:, 1:] = canvas.reshape(height, width * 4)
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)),
+        _png_chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)),
+        _png_chunk(b'IEND', b''),
+    ))
+
+
+def _trace(xs, ys):
+    """Pixel-spaced points along the polyline through ``xs``, ``ys``."""
+    if len(xs) == 1:
+        return xs, ys
+    dx, dy = np.diff(xs), np.diff(ys)
+    steps = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(np.int64) + 1
+    segment = np.repeat(np.arange(len(dx)), steps)
+    offset = np.arange(len(segment)) - np.repeat(np.cumsum(steps) - steps, steps)
+    t = offset / np.repeat(np.maximum(steps - 1, 1), steps)
+    return xs[segment] + dx[segment] * t, ys[segment] + dy[segment] * t
+
+
+def _set(mask, xs, ys):
+    xs, ys = np.round(xs).astype(np.int64), np.round(ys).astype(np.int64)
+    inside = (xs >= 0) & (xs < mask.shape[1]) & (ys >= 0) & (ys < mask.shape[0])
+    mask[ys[inside], xs[inside]] = True
+
+
+def _blend(canvas, mask, rgb, alpha):
+    """Paint ``rgb`` at ``alpha`` over the ``mask`` pixels of an RGBA canvas."""
+    under = canvas[mask].astype(np.float64) / 255
+    out_alpha = alpha + under[:, 3] * (1 - alpha)
+    color = (np.array(rgb) / 255 * alpha + under[:, :3] * under[:, 3:] * (1 - alpha)) / np.maximum(out_alpha, 1e-9)[:, None]
+    canvas[mask] = np.round(np.column_stack((color, out_alpha)) * 255).astype(np.uint8)
+
+
+def _rgb(color):
+    digits = color[1:]
+    if len(digits) == 3:
+        digits = ''.join(digit * 2 for digit in digits)
+    return tuple(int(digits[position:position + 2], 16) for position in (0, 2, 4))
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
@@ -0,0 +1,134 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/timeparse.py
+import re
+
+import numpy as np
+
+# int64 value of NaT; stored for null cells in datetime columns
+NULL_TIME = np.iinfo(np.int64).min
+
+# Number of non-null cells inspected when guessing a column's format
+GUESS_SAMPLE = 50
+
+# Maps every digit to 0, leaving a cell's shape
+_DIGITS = str.maketrans('0123456789', '0000000000')
+
+# Units accepted by bucket(); quarter is derived from months
+BUCKET_UNITS = {
+    'year': 'Y',
+    'quarter': 'M',
+    'month': 'M',
+    'day': 'D',
+    'hour': 'h',
+    'minute': 'm',
+    'second': 's',
+}
+
+# numpy datetime_as_string unit used to render each granularity
+_DISPLAY_UNITS = {
+    'month': 'M',
+    'day': 'D',
+    'minute': 'm',
+    'second': 's',
+}
+
+
+class TimeFormat:
+    """A recognised date layout and how to turn it into ISO 8601 text."""
+
+    def __init__(self, name, pattern, granularity, order=None, separator=None):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.granularity = granularity
+        # For day/month/year layouts: which part holds ('month', 'day', 'year')
+        self.order = order
+        self.separator = separator
+
+    def matches(self, sample):
+        return all(self.pattern.match(value) for value in sample)
+
+    def to_iso(self, text):
+        """Vectorised rewrite of a numpy str array into ISO 8601."""
+        if self.order is None:
+            return text
+        first, _, rest = _split(text, self.separator)
+        second, _, third = _split(rest, self.separator)
+        parts = dict(zip(self.order, (first, second, third)))
+        return _join(parts['year'], '-', np.char.zfill(parts['month'], 2), '-', np.char.zfill(parts['day'], 2))
+
+    def parse(self, text):
+        """Parse a numpy str array of non-null cells to int64 epoch milliseconds.
+
+        Raises ``ValueError`` if any cell does not fit the format.
+        """
+        if len(text) == 0:
+            return np.array([], dtype=np.int64)
+        # The patterns treat every digit alike, so checking each distinct
+        # digit-masked shape checks every cell; numpy would otherwise read
+        # 'today' or a finer timestamp without complaint
+        for shape in np.unique(np.char.translate(text, _DIGITS)).tolist():
+            if not self.pattern.fullmatch(shape):
+                raise ValueError(shape)
+        iso = self.to_iso(text)
+        return iso.astype('datetime64[ms]').astype(np.int64)
+
+
+# Checked in order; the first format matching every sampled cell wins
+FORMATS = (
+    TimeFormat('iso-month', r'^\d{4}-\d{2}$', 'month'),
+    TimeFormat('iso-date', r'^\d{4}-\d{2}-\d{2}$', 'day'),
+    TimeFormat('iso-minute', r'^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}$', 'minute'),
+    TimeFormat('iso-second', r'^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d{1,6})?$', 'second'),
+    TimeFormat('us-date', r'^\d{1,2}/\d{1,2}/\d{4}$', 'day', ('month', 'day', 'year'), '/'),
+    TimeFormat('eu-date', r'^\d{1,2}\.\d{1,2}\.\d{4}$', 'day', ('day', 'month', 'year'), '.'),
+)
+
+FORMATS_BY_NAME = {time_format.name: time_format for time_format in FORMATS}
+
+
+def guess_format(text):
+    """Pick the format of a numpy str array of non-null cells, or None."""
+    sample = [str(value) for value in text[:GUESS_SAMPLE]]
+    if not sample:
+        return None
+    for time_format in FORMATS:
+        if time_format.matches(sample):
+            return time_format
+    return None
+
+
+def format_times(values, granularity):
+    """ISO text for int64 epoch-ms values at ``granularity`` (None for nulls)."""
+    nulls = values == NULL_TIME
+    text = np.datetime_as_string(values.astype('datetime64[ms]'), unit=_DISPLAY_UNITS[granularity])
+    out = text.astype(object)
+    out[nulls] = None
+    return out
+
+
+def advance(epoch_ms, granularity, steps):
+    """Epoch-ms times ``steps`` (int array) whole ``granularity`` units after ``epoch_ms``."""
+    start = np.datetime64(int(epoch_ms), 'ms').astype(f'datetime64[{_DISPLAY_UNITS[granularity]}]')
+    return (start + steps).astype('datetime64[ms]').astype(np.int64)
+
+
+def bucket(values, unit):
+    """Floor non-null epoch-ms values to ``unit``; returns datetime64 buckets."""
+    if unit not in BUCKET_UNITS:
+        raise ValueError(unit)
+    floored = values.astype('datetime64[ms]').astype(f'datetime64[{BUCKET_UNITS[unit]}]')
+    if unit == 'quarter':
+        months = floored.astype(np.int64)
+        floored = (months - months % 3).astype('datetime64[M]')
+    return floored
+
+
+def _split(text, separator):
+    parts = np.char.partition(text, separator)
+    return parts[:, 0], parts[:, 1], parts[:, 2]
+
+
+def _join(*parts):
+    result = parts[0]
+    for part in parts[1:]:
+        result = np.char.add(result, part)
+    return result
@@ -0,0 +1,220 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/transforms.py
+"""Vectorised versions of the series transforms in useChartData.
+
+They take float64 arrays with NaN for nulls and keep nulls in place, just as
+the frontend leaves non-numeric cells untouched.  Scans of long series (the
+min/max, totals, running sums and windows) are split across the process
+pool; the element-wise scaling that follows them is left to numpy.
+"""
+import numpy as np
+
+from .errors import DatasetError
+from .parallel import pool
+
+# Same shape and defaults as the `transforms` state in useChartData
+DEFAULT_TRANSFORMS = {
+    'normalize': False,
+    'cumulative': False,
+    'percentage': False,
+    'movingAverage': {'enabled': False, 'window': 3},
+}
+
+
+def normalize(values, stats=None):
+    """Scale to 0..1; ``stats`` (covering exactly these values) skips the min/max scan."""
+    if stats is not None:
+        low, high = stats.min, stats.max
+    else:
+        low, high = _extremes(values)
+    if low is None:
+        return values.copy()
+    if high == low:
+        return np.where(np.isnan(values), np.nan, 0.0)
+    return (values - low) / (high - low)
+
+
+def cumulative(values):
+    """Running total; null cells stay null and do not add to the total."""
+    if not pool.engaged(len(values)):
+        return _cumulative_chunk(0, values, 0.0)
+    # Each chunk starts from the total of the chunks before it
+    totals = pool.reduce(_chunk_sum, [values])
+    offsets = np.concatenate(([0.0], np.cumsum(totals)[:-1]))
+    return pool.transform(_cumulative_chunk, [values], chunk_args=[(offset,) for offset in offsets])
+
+
+def percentage(values, stats=None):
+    """Each value as a percentage of the column total."""
+    if stats is not None:
+        total = stats.sum
+    elif pool.engaged(len(values)):
+        total = sum(pool.reduce(_chunk_sum, [values]))
+    else:
+        total = np.nansum(values)
+    if not total:
+        return np.where(np.isnan(values), np.nan, 0.0)
+    return values / total * 100
+
+
+def moving_average(values, window):
+    """Trailing mean over ``window`` rows (nulls count as 0), None before it fills.
+
+    Returns None when the window is too small or the series too short,
+    matching movingAverageData.
+    """
+    if window < 2 or len(values) < window:
+        return None
+    if pool.engaged(len(values)):
+        # Every chunk reads the window - 1 rows before it as a halo
+        return pool.transform(_moving_chunk, [values], window, halo=window - 1)
+    sums = np.cumsum(np.nan_to_num(values), dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    result[window - 1:] = sums[window - 1:]
+    result[window:] -= sums[:-window]
+    return result / window
+
+
+def apply_transforms(values, transforms=None, stats=None):
+    """Apply a useChartData-style ``transforms`` object in the frontend's order.
+
+    ``stats`` may be passed when ``values`` is the whole column, letting
+    normalize and percentage read the ingest-time profile instead of
+    rescanning.  Returns ``(values, moving_average_or_None)``.
+    """
+    transforms, window = resolve_transforms(transforms)
+
+    if transforms['normalize']:
+        values = normalize(values, stats)
+        stats = None
+    if transforms['cumulative']:
+        values = cumulative(values)
+        stats = None
+    if transforms['percentage']:
+        values = percentage(values, stats)
+
+    averages = None
+    if window is not None:
+        averages = moving_average(values, window)
+    return values, averages
+
+
+def stream_transforms(batches, transforms=None, length=None):
+    """apply_transforms over a series read as consecutive batches.
+
+    ``batches`` is a callable returning a fresh iterator of float64 arrays;
+    it is read once more for normalize's min/max and once more for
+    percentage's total, never all at once.  ``length`` is the series length.
+    Yields ``(values, moving_average_or_None)`` per batch; results match
+    apply_transforms on the concatenated series.
+    """
+    transforms, window = resolve_transforms(transforms)
+    if window is not None and (window < 2 or length is None or length < window):
+        window = None
+
+    bounds = None
+    if transforms['normalize']:
+        low = high = None
+        for values in batches():
+            if len(values) and not np.isnan(values).all():
+                low = np.nanmin(values) if low is None else min(low, np.nanmin(values))
+                high = np.nanmax(values) if high is None else max(high, np.nanmax(values))
+        bounds = (low, high)
+
+    total = None
+    if transforms['percentage']:
+        total = 0.0
+        running = [0.0]
+        for values in batches():
+            total += float(np.nansum(_stream_step(values, transforms, bounds, None, running)))
+
+    running = [0.0]
+    recent = np.empty(0)
+    seen = 0
+    for values in batches():
+        values = _stream_step(values, transforms, bounds, total, running)
+        averages = None
+        if window is not None:
+            # Trailing window over the previous window - 1 values plus this batch
+            joined = np.concatenate((recent, np.nan_to_num(values)))
+            sums = np.concatenate(([0.0], np.cumsum(joined)))
+            ends = np.arange(len(recent), len(joined)) + 1
+            averages = np.full(len(values), np.nan)
+            full = seen + np.arange(len(values)) >= window - 1
+            averages[full] = (sums[ends[full]] - sums[ends[full] - window]) / window
+            recent = joined[-(window - 1):]
+        seen += len(values)
+        yield values, averages
+
+
+def _stream_step(values, transforms, bounds, total, running):
+    """One batch through normalize, cumulative and (given ``total``) percentage."""
+    if transforms['normalize']:
+        low, high = bounds
+        if low is None:
+            values = values.copy()
+        elif high == low:
+            values = np.where(np.isnan(values), np.nan, 0.0)
+        else:
+            values = (values - low) / (high - low)
+    if transforms['cumulative']:
+        sums = np.nancumsum(values) + running[0]
+        if len(sums):
+            running[0] = sums[-1]
+        sums[np.isnan(values)] = np.nan
+        values = sums
+    if transforms['percentage'] and total is not None:
+        values = np.where(np.isnan(values), np.nan, 0.0) if not total else values / total * 100
+    return values
+
+
+def _extremes(values):
+    """(nanmin, nanmax) of ``values``, or (None, None) if all are null."""
+    if pool.engaged(len(values)):
+        parts = [part for part in pool.reduce(_chunk_extremes, [values]) if part[0] is not None]
+        if not parts:
+            return None, None
+        return min(low for low, _ in parts), max(high for _, high in parts)
+    return _chunk_extremes(values)
+
+
+def _chunk_extremes(values):
+    if not len(values) or np.isnan(values).all():
+        return None, None
+    return np.nanmin(values), np.nanmax(values)
+
+
+def _chunk_sum(values):
+    return float(np.nansum(values))
+
+
+def _cumulative_chunk(lead, values, offset):
+    result = np.nancumsum(values) + offset
+    result[np.isnan(values)] = np.nan
+    return result
+
+
+def _moving_chunk(lead, values, window):
+    """Trailing means of the rows after the ``lead`` halo rows of ``values``."""
+    sums = np.concatenate(([0.0], np.cumsum(np.nan_to_num(values))))
+    ends = np.arange(lead, len(values)) + 1
+    result = np.full(len(ends), np.nan)
+    # Only the first chunk has rows before the window fills (its lead is 0)
+    full = ends >= window
+    result[full] = (sums[ends[full]] - sums[ends[full] - window]) / window
+    return result
+
+
+def resolve_transforms(transforms):
+    """Merged transforms and the moving-average window (None when disabled)."""
+    if transforms is not None and not isinstance(transforms, dict):
+        raise DatasetError("'transforms' must be an object")
+    transforms = {**DEFAULT_TRANSFORMS, **(transforms or {})}
+    if not isinstance(transforms['movingAverage'], dict):
+        raise DatasetError("'movingAverage' must be an object with 'enabled' and 'window'")
+    window = None
+    if transforms['movingAverage'].get('enabled'):
+        try:
+            window = int(transforms['movingAverage'].get('window', 3))
+        except (TypeError, ValueError):
+            raise DatasetError("Moving average 'window' must be a number") from None
+    return transforms, window
@@ -0,0 +1,300 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/versions.py
+"""Undo, redo and version comparison for dataset edits.
+
+The live column arrays are always the current version; older and undone
+versions share every chunk of CHUNK_ROWS rows they have in common with it.
+Each edit is recorded as a Step holding only what it changed, as it was
+before: images of the touched chunks, column objects it replaced (a text
+conversion, an added or removed computed column) and the stats of the
+columns involved.  Undo swaps a step's images with the live chunks, so the
+step then holds what it undid and redo swaps them back; both cost
+O(changed chunks), as does comparing with any version still in the history.
+
+Versions keep increasing through undo and redo, so caches keyed on
+``(dataset.id, dataset.version)`` never serve a result of a different state.
+"""
+import contextlib
+import copy
+
+import numpy as np
+
+from .column import NULL_CODE, float_list
+from .errors import DatasetError
+from .timeparse import format_times
+
+# Rows per chunk; an edited cell costs one chunk image of this many cells
+CHUNK_ROWS = 4096
+
+# Undo steps kept per dataset; the oldest are forgotten first
+MAX_UNDO_STEPS = 100
+
+# Bytes of chunk images kept per dataset before the oldest steps are forgotten
+MAX_HISTORY_BYTES = 64 * 1024 * 1024
+
+# Changed cells listed by compare; the count beyond it is still exact
+MAX_COMPARE_CELLS = 1000
+
+
+class Step:
+    """The other side of one edit: what it changed, before it (or after, once undone)."""
+
+    def __init__(self, label, row_count, order):
+        self.label = label
+        self.row_count = row_count
+        self.order = order
+        # (column name, chunk index) -> copy of the chunk's cells
+        self.chunks = {}
+        # Column name -> column object (None: the column did not exist)
+        self.columns = {}
+        # Column name -> ColumnStats
+        self.stats = {}
+        # Dataset version this step produced
+        self.version = None
+
+    @property
+    def nbytes(self):
+        return sum(image.nbytes for image in self.chunks.values())
+
+    def __bool__(self):
+        return bool(self.chunks or self.columns or self.stats)
+
+
+class VersionHistory:
+    """Undo and redo stacks of one dataset; used under ``dataset.lock``."""
+
+    def __init__(self, dataset):
+        self._dataset = dataset
+        self._steps = []
+        # Position of the state before _steps[0]; position p means the
+        # first p steps (counted from the start of history) are applied
+        self._first = 0
+        self._position = 0
+        # Dataset version -> position of the state it names
+        self._versions = {dataset.version: 0}
+        self._open = None
+
+    @property
+    def nbytes(self):
+        return sum(step.nbytes for step in self._steps)
+
+    @property
+    def can_undo(self):
+        return self._position > self._first
+
+    @property
+    def can_redo(self):
+        return self._position < self._first + len(self._steps)
+
+    @contextlib.contextmanager
+    def step(self, label):
+        """Record the edits made inside as one undo step; nested steps join the outer one."""
+        if self._open is not None:
+            yield
+            return
+        dataset = self._dataset
+        self._open = Step(label, dataset.row_count, list(dataset.columns))
+        try:
+            yield
+        finally:
+            step, self._open = self._open, None
+            if step or step.row_count != dataset.row_count:
+                self._commit(step)
+
+    def save_cells(self, column, start, end):
+        """Keep the chunks of ``column`` covering rows ``start:end`` as they are now."""
+        step = self._open
+        if step is None or column.expression is not None or column.name in step.columns:
+            return
+        cells = getattr(column, column._cells)
+        for index in range(start // CHUNK_ROWS, (max(end, start + 1) - 1) // CHUNK_ROWS + 1):
+            key = (column.name, index)
+            if key not in step.chunks:
+                step.chunks[key] = np.array(cells[index * CHUNK_ROWS:(index + 1) * CHUNK_ROWS])
+        self.save_stats(column)
+
+    def save_stats(self, column):
+        step = self._open
+        if step is not None and column.expression is None and column.name not in step.stats:
+            step.stats[column.name] = copy.deepcopy(column._stats)
+
+    def save_column(self, name):
+        """Keep column ``name`` (or its absence) before it is replaced, added or removed."""
+        step = self._open
+        if step is not None and name not in step.columns:
+            step.columns[name] = self._dataset.columns.get(name)
+
+    def undo(self):
+        if not self.can_undo:
+            raise DatasetError('Nothing to undo')
+        self._position -= 1
+        self._swap(self._steps[self._position - self._first])
+        self._versions[self._dataset.version] = self._position
+
+    def redo(self):
+        if not self.can_redo:
+            raise DatasetError('Nothing to redo')
+        self._swap(self._steps[self._position - self._first])
+        self._position += 1
+        self._versions[self._dataset.version] = self._position
+
+    def to_dict(self):
+        """Versions still reachable, oldest first, with the current one marked."""
+        dataset = self._dataset
+        names = {}
+        for version, position in self._versions.items():
+            names.setdefault(position, []).append(version)
+        states = []
+        for position in range(self._first, self._first + len(self._steps) + 1):
+            step = self._steps[position - self._first - 1] if position > self._first else None
+            states.append({
+                'versions': sorted(names.get(position, [])),
+                'label': None if step is None else step.label,
+                'current': position == self._position,
+                'undone': position > self._position,
+            })
+        return {
+            'version': dataset.version,
+            'canUndo': self.can_undo,
+            'canRedo': self.can_redo,
+            'states': states,
+        }
+
+    def compare(self, version, limit=MAX_COMPARE_CELLS):
+        """Differences between the state named ``version`` and the current one."""
+        dataset = self._dataset
+        position = self._versions.get(version)
+        if position is None:
+            raise DatasetError(f'Version {version} is not in the undo history')
+        if position <= self._position:
+            # Applied steps hold what came before them: the earliest image wins
+            steps = self._steps[position - self._first:self._position - self._first]
+        else:
+            # Undone steps hold what they had done: the latest image wins
+            steps = self._steps[self._position - self._first:position - self._first][::-1]
+        chunks, columns = {}, {}
+        for step in steps:
+            for key, image in step.chunks.items():
+                chunks.setdefault(key, image)
+            for name, column in step.columns.items():
+                columns.setdefault(name, column)
+        rows_then = steps[0].row_count if steps else dataset.row_count
+        changed_columns = []
+        for name, then in columns.items():
+            now = dataset.columns.get(name)
+            if then is now:
+                continue
+            change = 'added' if then is None else 'removed' if now is None else 'replaced'
+            changed_columns.append({'name': name, 'change': change})
+        skipped = set(columns) | {name for name, column in dataset.columns.items() if column.expression is not None}
+
+        cells = []
+        total = 0
+        for (name, index), image in sorted(chunks.items()):
+            column = dataset.columns.get(name)
+            if name in skipped or column is None:
+                continue
+            start = index * CHUNK_ROWS
+            current = getattr(column, column._cells)[start:min(start + CHUNK_ROWS, dataset.row_count)]
+            length = min(len(image), len(current), max(rows_then - start, 0))
+            then, now = image[:length], current[:length]
+            differs = then != now
+            if then.dtype.kind == 'f':
+                differs &= ~(np.isnan(then) & np.isnan(now))
+            offsets = np.flatnonzero(differs)
+            total += len(offsets)
+            room = max(limit - len(cells), 0)
+            if not room:
+                continue
+            offsets = offsets[:room]
+            for row, before, after in zip((start + offsets).tolist(), _render(column, then[offsets]), _render(column, now[offsets])):
+                cells.append({'row': row, 'column': name, 'then': before, 'now': after})
+        cells.sort(key=lambda cell: (cell['row'], cell['column']))
+        return {
+            'version': version,
+            'current': dataset.version,
+            'rows': {'then': rows_then, 'now': dataset.row_count},
+            'columns': changed_columns,
+            'changedCells': total,
+            'cells': cells,
+            'truncated': total > len(cells),
+        }
+
+    def _commit(self, step):
+        dataset = self._dataset
+        # A new edit after undos drops the undone steps and their versions
+        del self._steps[self._position - self._first:]
+        self._versions = {version: position for version, position in self._versions.items() if position <= self._position}
+        step.version = dataset.version
+        self._steps.append(step)
+        self._position += 1
+        self._versions[dataset.version] = self._position
+        while self._steps and (len(self._steps) > MAX_UNDO_STEPS or self.nbytes > MAX_HISTORY_BYTES):
+            self._steps.pop(0)
+            self._first += 1
+            self._versions = {version: position for version, position in self._versions.items() if position >= self._first}
+
+    def _swap(self, step):
+        """Exchange the state ``step`` holds with the live one."""
+        dataset = self._dataset
+        rows, order = dataset.row_count, list(dataset.columns)
+        # Rows only the live side has go with it, so a later swap can put them back
+        if step.row_count < rows:
+            for name, column in dataset.columns.items():
+                if column.expression is None and name not in step.columns:
+                    for index in range(step.row_count // CHUNK_ROWS, (rows - 1) // CHUNK_ROWS + 1):
+                        step.chunks.setdefault((name, index), np.empty(0, dtype=getattr(column, column._cells).dtype))
+
+        chunks = {}
+        for (name, index), image in step.chunks.items():
+            column = dataset.columns.get(name)
+            if column is not None:
+                chunks[name, index] = np.array(getattr(column, column._cells)[index * CHUNK_ROWS:(index + 1) * CHUNK_ROWS])
+        stats = {name: dataset.columns[name]._stats for name in step.stats if name in dataset.columns}
+        columns = {name: dataset.columns.get(name) for name in step.columns}
+
+        swapped = {name: dataset.columns.get(name) for name in step.order}
+        swapped.update(step.columns)
+        dataset.columns = {name: swapped[name] for name in step.order if swapped.get(name) is not None}
+        for (name, index), image in step.chunks.items():
+            column = dataset.columns.get(name)
+            if column is not None and column.expression is None:
+                _write(column, index * CHUNK_ROWS, image)
+        for name, saved in step.stats.items():
+            if name in dataset.columns:
+                dataset.columns[name]._stats = saved
+        if step.row_count != rows:
+            for column in dataset.columns.values():
+                if column.expression is None:
+                    setattr(column, column._cells, column._buffer[:step.row_count])
+
+        dataset.row_count = step.row_count
+        dataset.version += 1
+        for name, index in step.chunks:
+            dataset._invalidate_computed(name, index * CHUNK_ROWS, (index + 1) * CHUNK_ROWS)
+        for name in step.columns:
+            column = dataset.columns.get(name)
+            if column is not None and column.expression is not None:
+                column.invalidate(0, dataset.row_count)
+            dataset._invalidate_computed(name, 0, dataset.row_count)
+        step.row_count, step.order, step.chunks, step.stats, step.columns = rows, order, chunks, stats, columns
+
+
+def _write(column, start, image):
+    """Put ``image`` into ``column``'s storage at row ``start``, growing it if needed."""
+    buffer = column._buffer
+    end = start + len(image)
+    if end > len(buffer):
+        grown = np.empty(end, dtype=buffer.dtype)
+        grown[:len(buffer)] = buffer
+        buffer = column._buffer = grown
+    buffer[start:end] = image
+
+
+def _render(column, cells):
+    """JSON-friendly values of raw ``cells`` of ``column``'s storage type."""
+    if column.kind == 'number':
+        return float_list(cells)
+    if column.kind == 'datetime':
+        return format_times(cells, column.granularity).tolist()
+    table = np.array(column.dictionary + [None], dtype=object)
+    return table[np.where(cells == NULL_CODE, len(column.dictionary), cells)].tolist()
@@ -0,0 +1,185 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/datastore/xlsx.py
+"""Minimal write-only XLSX writer that streams.
+
+An .xlsx file is a zip of XML parts.  Rows are written into the worksheet
+part as they are produced and the zip bytes are handed out as they are
+compressed, so a download starts at once and memory stays flat however
+many rows follow.  Only what an export needs is supported: numbers,
+inline strings, one number format and a new sheet every MAX_SHEET_ROWS.
+"""
+import math
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+# Excel's per-sheet row limit (the header row included)
+MAX_SHEET_ROWS = 1_048_576
+
+# Characters XML 1.0 cannot carry, even escaped
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '{sheets}</Types>'
+)
+_SHEET_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet{index}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets></workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rIdStyles" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '{sheets}</Relationships>'
+)
+_SHEET_REL = (
+    '<Relationship Id="rId{index}" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet{index}.xml"/>'
+)
+# Style 0 is the default, style 1 applies the export's number format
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="{number_format}"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+    '<borders count="1"><border/></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = '</sheetData></worksheet>'
+
+
+class _Sink:
+    """Write-only file object collecting what zipfile writes until drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_xlsx(header, batches, row_count, number_format='General'):
+    """Yield the bytes of an .xlsx workbook.
+
+    ``header`` is a list of ``(name, formatted)``; numeric cells of
+    ``formatted`` columns get the ``number_format`` code.  ``batches`` yields
+    lists of equally long columns, ``row_count`` rows in total: float64
+    arrays, or lists of floats, strings and None.
+    """
+    per_sheet = MAX_SHEET_ROWS - 1
+    sheet_count = max(1, -(-row_count // per_sheet))
+    sink = _Sink()
+    header_xml = '<row>' + ''.join(_cell(name, False) for name, _ in header) + '</row>'
+    styles = [formatted for _, formatted in header]
+
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        indexes = range(1, sheet_count + 1)
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES.format(
+            sheets=''.join(_SHEET_TYPE.format(index=index) for index in indexes)))
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK.format(sheets=''.join(
+            f'<sheet name="{_sheet_name(index)}" sheetId="{index}" r:id="rId{index}"/>' for index in indexes)))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS.format(
+            sheets=''.join(_SHEET_REL.format(index=index) for index in indexes)))
+        archive.writestr('xl/styles.xml', _STYLES.format(number_format=escape(number_format, {'"': '&quot;'})))
+        yield sink.drain()
+
+        rows = _rows(batches, styles)
+        for index in indexes:
+            with archive.open(f'xl/worksheets/sheet{index}.xml', 'w', force_zip64=True) as part:
+                part.write((_SHEET_START + header_xml).encode())
+                written = 0
+                while written < per_sheet:
+                    chunk = next(rows, None)
+                    if chunk is None:
+                        break
+                    # A batch straddling the sheet limit is split across sheets
+                    chunk, rest = chunk[:per_sheet - written], chunk[per_sheet - written:]
+                    if rest:
+                        rows = _prepend(rest, rows)
+                    part.write(''.join(chunk).encode())
+                    written += len(chunk)
+                    yield sink.drain()
+                part.write(_SHEET_END.encode())
+    yield sink.drain()
+
+
+def _rows(batches, styles):
+    """Row XML strings, a list per batch."""
+    for columns in batches:
+        cells = [
+            _number_cells(column, formatted) if isinstance(column, np.ndarray) else
+            [_cell(value, formatted) for value in column]
+            for column, formatted in zip(columns, styles)
+        ]
+        yield ['<row>' + ''.join(row) + '</row>' for row in zip(*cells)]
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def _number_cells(values, formatted):
+    start = '<c s="1"><v>' if formatted else '<c><v>'
+    return [
+        '<c/>' if not math.isfinite(value) else f'{start}{value!r}</v></c>'
+        for value in values.tolist()
+    ]
+
+
+def _cell(value, formatted):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return '<c/>'
+        return f'<c s="1"><v>{value!r}</v></c>' if formatted else f'<c><v>{value!r}</v></c>'
+    text = escape(_INVALID_XML.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _sheet_name(index):
+    return 'Data' if index == 1 else f'Data {index}'
@@ -0,0 +1,22 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/gunicorn.conf.py
+# Usage (from the backend directory):
+#   gunicorn -c gunicorn.conf.py app:app
+# Set BIZCHARTS_PRELOAD=1 to load and warm the app once in the master, then fork.
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+# Threaded workers so long-lived /stream connections don't block a whole worker
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 8))
+
+preload_app = os.environ.get('BIZCHARTS_PRELOAD', '').lower() in ('1', 'true', 'yes')
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before workers are forked
+    if preload_app:
+        from app import STARTUP, warm
+        warm()
+        server.log.info("Warmed app before fork in %sms (load %sms)", STARTUP["warmMs"], STARTUP["loadMs"])
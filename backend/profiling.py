@@ -0,0 +1,263 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/profiling.py
+"""On-demand profiling of single requests in a running server.
+
+Disabled unless BIZCHARTS_PROFILE_TOKEN is set.  A request carrying that
+token in ``X-Profile-Token`` (or ``?_profile_token=``) and asking for a
+profile with ``X-Profile: cprofile|sample`` (or ``?_profile=``) runs under
+the chosen profiler, response streaming included:
+
+- ``cprofile``: deterministic per-function timings, downloadable as a pstats
+  file (``python -m pstats``, snakeviz) or as a text summary.
+- ``sample``: a background thread records the request thread's stack every
+  SAMPLE_INTERVAL seconds, producing collapsed stacks for flame graphs
+  (flamegraph.pl, speedscope).  Much lower overhead than cprofile.
+
+The response carries ``X-Profile-Id``; results are kept in memory (the last
+KEEP_PROFILES) and served by the /api/debug routes.  One request is profiled
+at a time per worker; concurrent asks get ``X-Profile: busy``.
+"""
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from urllib.parse import parse_qsl, urlencode
+
+# Shared secret enabling profiling; unset means profiling is off
+PROFILE_TOKEN = os.environ.get('BIZCHARTS_PROFILE_TOKEN') or None
+
+# Seconds between stack samples in 'sample' mode
+SAMPLE_INTERVAL = 0.001
+
+# Finished profiles kept per worker; the oldest are dropped first
+KEEP_PROFILES = 20
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+# Query parameters that control profiling (never stored with the request)
+_PROFILE_PARAMS = ('_profile', '_profile_token')
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def token_matches(candidate):
+    """True if profiling is enabled and ``candidate`` is its token."""
+    return PROFILE_TOKEN is not None and candidate is not None and hmac.compare_digest(candidate, PROFILE_TOKEN)
+
+
+class Profile:
+    """One finished request profile."""
+
+    def __init__(self, mode, method, path, query):
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.method = method
+        self.path = path
+        self.query = query
+        self.status = None
+        self.created_at = time.time()
+        self.duration_ms = None
+        self.samples = None
+        # cProfile.Profile in 'cprofile' mode, Counter of stacks in 'sample' mode
+        self.data = None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'mode': self.mode,
+            'method': self.method,
+            'path': self.path,
+            'query': self.query,
+            'status': self.status,
+            'createdAt': self.created_at,
+            'durationMs': self.duration_ms,
+            'samples': self.samples,
+        }
+
+    def pstats_bytes(self):
+        """Marshalled stats, the format ``pstats.Stats(filename)`` loads."""
+        self.data.create_stats()
+        return marshal.dumps(self.data.stats)
+
+    def summary(self, sort='cumulative', limit=60):
+        """pstats text report of the top ``limit`` functions."""
+        stream = io.StringIO()
+        stats = pstats.Stats(self.data, stream=stream)
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def collapsed(self):
+        """Collapsed stacks: ``root;caller;callee count`` per line."""
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in self.data.most_common())
+
+
+class ProfileStore:
+    """Thread-safe store of the most recent profiles."""
+
+    def __init__(self, keep=KEEP_PROFILES):
+        self._profiles = OrderedDict()
+        self._keep = keep
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > self._keep:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self):
+        with self._lock:
+            return list(reversed(self._profiles.values()))
+
+
+class _Sampler(threading.Thread):
+    """Counts the stacks of one thread at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._labels = {}
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self._stack(frame)] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def _stack(self, frame):
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+            labels.append(label)
+            frame = frame.f_back
+        return tuple(reversed(labels))
+
+
+class _ProfiledBody:
+    """Response iterable that finishes the profile once the body is sent.
+
+    That is when iteration ends or, if the client went away, on close().
+    """
+
+    def __init__(self, body, finish):
+        self._body = body
+        self._finish = finish
+        self._finished = False
+
+    def __iter__(self):
+        yield from self._body
+        self._done()
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            self._done()
+
+    def _done(self):
+        if not self._finished:
+            self._finished = True
+            self._finish()
+
+
+class ProfilingMiddleware:
+    """WSGI middleware profiling the requests that ask for it (see module docs)."""
+
+    def __init__(self, wsgi_app, store):
+        self.wsgi_app = wsgi_app
+        self.store = store
+        self._busy = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if PROFILE_TOKEN is None:
+            return self.wsgi_app(environ, start_response)
+        query = environ.get('QUERY_STRING', '')
+        params = dict(parse_qsl(query)) if '_profile' in query else {}
+        mode = environ.get('HTTP_X_PROFILE') or params.get('_profile')
+        if mode not in PROFILE_MODES or not token_matches(environ.get('HTTP_X_PROFILE_TOKEN') or params.get('_profile_token')):
+            return self.wsgi_app(environ, start_response)
+        if not self._busy.acquire(blocking=False):
+            return self.wsgi_app(environ, _with_headers(start_response, [('X-Profile', 'busy')]))
+
+        profile = Profile(
+            mode,
+            environ.get('REQUEST_METHOD'),
+            environ.get('PATH_INFO'),
+            urlencode([(key, value) for key, value in parse_qsl(query, keep_blank_values=True) if key not in _PROFILE_PARAMS]),
+        )
+        started = time.perf_counter()
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler (a debugger, coverage) already owns the hook
+                self._busy.release()
+                return self.wsgi_app(environ, _with_headers(start_response, [('X-Profile', 'busy')]))
+        else:
+            profiler = _Sampler(threading.get_ident(), SAMPLE_INTERVAL)
+            profiler.start()
+
+        def record_status(status, headers, exc_info=None):
+            profile.status = int(status.split(' ', 1)[0])
+            return start_response(status, headers + [('X-Profile-Id', profile.id)], exc_info)
+
+        def finish():
+            try:
+                if mode == 'cprofile':
+                    profiler.disable()
+                    profile.data = profiler
+                else:
+                    profiler.stop()
+                    profile.data = profiler.stacks
+                    profile.samples = sum(profiler.stacks.values())
+                profile.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+                self.store.add(profile)
+            finally:
+                self._busy.release()
+
+        try:
+            body = self.wsgi_app(environ, record_status)
+        except BaseException:
+            finish()
+            raise
+        return _ProfiledBody(body, finish)
+
+
+def _with_headers(start_response, extra):
+    def wrapped(status, headers, exc_info=None):
+        return start_response(status, headers + extra, exc_info)
+    return wrapped
+
+
+def _short_path(filename):
+    """Path relative to the backend or to site-packages, for readable frames."""
+    if filename.startswith(_BACKEND_DIR + os.sep):
+        return filename[len(_BACKEND_DIR) + 1:]
+    head, marker, tail = filename.rpartition('site-packages' + os.sep)
+    return tail if marker else filename
+
+
+# Profiles recorded by this worker
+profiles = ProfileStore()
@@ -0,0 +1,196 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/static_assets.py
+"""Production serving of the built React app (frontend/build).
+
+The build directory is scanned once at startup into an in-memory manifest:
+content, ETag, a gzip variant (and brotli when the ``brotli`` package is
+installed) for every compressible file.  ``.gz``/``.br`` files already
+produced by the build are used as-is.  Requests are then answered from
+memory -- including 304s for conditional requests -- without touching disk.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import time
+
+from flask import Response, request
+from werkzeug.http import http_date, parse_date
+
+try:
+    import brotli
+except ImportError:  # optional: gzip alone is fine
+    brotli = None
+
+# CRA build names: main.1a2b3c4d.js, 787.9e3f0c1a.chunk.css, logo.6ce24c58023cc2f8.svg
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{8,}(\.chunk)?\.[A-Za-z0-9]+$')
+
+# Last path segment with an extension: a request for a file, not a client-side route
+MISSING_FILE = re.compile(r'\.[A-Za-z0-9]+$')
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/manifest+json')
+
+# Files smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+# Files larger than this stay on disk and are streamed by send_file
+MAX_MEMORY_BYTES = 8 * 1024 * 1024
+
+# Preferred order when a client accepts several encodings
+ENCODINGS = ('br', 'gzip')
+_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+class Asset:
+    """One servable file with its precomputed representations."""
+
+    def __init__(self, path, url_path):
+        stat = os.stat(path)
+        self.path = path
+        self.mimetype = mimetypes.guess_type(url_path)[0] or 'application/octet-stream'
+        self.last_modified = int(stat.st_mtime)
+        self.cache_control = IMMUTABLE_CACHE if FINGERPRINTED.search(url_path) else REVALIDATE_CACHE
+        self.size = stat.st_size
+        self.data = None
+        self.variants = {}
+
+        with open(path, 'rb') as source:
+            digest = hashlib.sha1()
+            if self.size <= MAX_MEMORY_BYTES:
+                self.data = source.read()
+                digest.update(self.data)
+            else:
+                for block in iter(lambda: source.read(1 << 20), b''):
+                    digest.update(block)
+        self.etag = digest.hexdigest()[:20]
+
+        for encoding in ENCODINGS:
+            precompressed = path + _SUFFIXES[encoding]
+            if os.path.isfile(precompressed) and os.path.getsize(precompressed) <= MAX_MEMORY_BYTES:
+                with open(precompressed, 'rb') as source:
+                    self.variants[encoding] = source.read()
+        if self.data is not None and self._compressible():
+            if 'gzip' not in self.variants:
+                self.variants['gzip'] = gzip.compress(self.data, compresslevel=9, mtime=0)
+            if 'br' not in self.variants and brotli is not None:
+                self.variants['br'] = brotli.compress(self.data)
+        # Only keep variants that actually save bytes
+        self.variants = {
+            encoding: body for encoding, body in self.variants.items()
+            if len(body) < self.size
+        }
+
+    def _compressible(self):
+        return self.size >= MIN_COMPRESS_BYTES and self.mimetype.startswith(COMPRESSIBLE_TYPES)
+
+    def pick_encoding(self, accept_encoding):
+        accepted = _accepted_codings(accept_encoding)
+        for encoding in ENCODINGS:
+            if encoding in self.variants and accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return None
+
+    def response(self):
+        """Serve this asset for the current request."""
+        encoding = self.pick_encoding(request.headers.get('Accept-Encoding', ''))
+        # Each representation needs its own strong validator
+        etag = self.etag if encoding is None else f'{self.etag}-{encoding}'
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': self.cache_control,
+            'Last-Modified': http_date(self.last_modified),
+        }
+        if self.variants:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if self._not_modified(etag):
+            return Response(status=304, headers=headers)
+
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+            return Response(self.variants[encoding], mimetype=self.mimetype, headers=headers)
+        if self.data is not None:
+            return Response(self.data, mimetype=self.mimetype, headers=headers)
+
+        from flask import send_file
+        response = send_file(self.path, mimetype=self.mimetype, conditional=False, etag=False)
+        response.headers.update(headers)
+        return response
+
+    def _not_modified(self, etag):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix('W/').strip('"') for tag in if_none_match.split(',')}
+            return etag in tags or '*' in tags
+        since = parse_date(request.headers.get('If-Modified-Since'))
+        return since is not None and self.last_modified <= since.timestamp()
+
+
+class StaticManifest:
+    """All assets of a build directory, keyed by URL path."""
+
+    def __init__(self, build_dir):
+        started = time.perf_counter()
+        self.build_dir = os.path.abspath(build_dir)
+        self.assets = {}
+        for root, _, files in os.walk(self.build_dir):
+            for filename in files:
+                if filename.endswith(('.gz', '.br')) and os.path.isfile(os.path.join(root, filename[:-3])):
+                    continue  # a precompressed variant, attached to its source file
+                path = os.path.join(root, filename)
+                url_path = os.path.relpath(path, self.build_dir).replace(os.sep, '/')
+                self.assets[url_path] = Asset(path, url_path)
+        self.index = self.assets.get('index.html')
+        self.build_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def serve(self, path):
+        """Response for ``path``; unknown routes get index.html for client-side routing.
+
+        Missing files -- anything under ``static/`` or with an extension -- are
+        404s, so a stale fingerprinted URL is not answered with HTML.
+        """
+        asset = self.assets.get(path)
+        if asset is None and (path.startswith('static/') or MISSING_FILE.search(path)):
+            return Response('Not found', status=404)
+        asset = asset or self.index
+        if asset is None:
+            return Response('Frontend build has no index.html', status=404)
+        return asset.response()
+
+    def summary(self):
+        return {
+            "files": len(self.assets),
+            "bytes": sum(asset.size for asset in self.assets.values()),
+            "compressed": sum(1 for asset in self.assets.values() if asset.variants),
+            "buildMs": self.build_ms,
+        }
+
+
+def _accepted_codings(accept_encoding):
+    """Content-codings of an Accept-Encoding header mapped to their q-values."""
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def load_manifest(build_dir):
+    """Manifest for ``build_dir``, or None when the frontend has not been built."""
+    if not os.path.isfile(os.path.join(build_dir, 'index.html')):
+        return None
+    return StaticManifest(build_dir)
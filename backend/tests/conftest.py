@@ -0,0 +1,6 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/tests/conftest.py
+"""Run the tests against the backend's flat imports, as app.py does."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,88 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/tests/test_blocks.py
+"""Block files give back every cell they were written with."""
+import numpy as np
+import pytest
+
+from datastore import blocks
+from datastore.timeparse import NULL_TIME
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    # Several blocks per column, and a short last one
+    monkeypatch.setattr(blocks, 'BLOCK_ROWS', 1000)
+
+
+def _round_trip(tmp_path, cells, null=None):
+    block_file = blocks.write(str(tmp_path / 'cells.bzb'), cells, null)
+    decoded = block_file.read()
+    assert decoded.dtype == cells.dtype
+    np.testing.assert_array_equal(decoded, cells)
+    return block_file
+
+
+def _encodings(block_file):
+    return set(block_file.index['encoding'].tolist())
+
+
+def test_raw_floats(tmp_path):
+    cells = np.random.default_rng(1).normal(size=4500)
+    assert _encodings(_round_trip(tmp_path, cells)) == {blocks._RAW}
+
+
+def test_run_length(tmp_path):
+    cells = np.repeat([3.0, np.nan, -1.5, np.nan, np.nan], 900)
+    assert _encodings(_round_trip(tmp_path, cells)) == {blocks._RLE}
+
+
+def test_amounts_in_cents(tmp_path):
+    cells = np.round(np.random.default_rng(2).uniform(0, 500, size=3000), 2)
+    cells[::7] = np.nan
+    block_file = _round_trip(tmp_path, cells)
+    assert _encodings(block_file) <= {blocks._DELTA, blocks._DELTA2}
+    assert set(block_file.index['decimals'].tolist()) == {2}
+
+
+def test_float_values_not_whole_in_cents(tmp_path):
+    cells = np.round(np.random.default_rng(3).uniform(0, 1, size=2000), 3)
+    assert _encodings(_round_trip(tmp_path, cells)) == {blocks._RAW}
+
+
+def test_sorted_timestamps_with_null_sentinel(tmp_path):
+    cells = 1_700_000_000_000 + np.arange(2500, dtype=np.int64) * 60_000
+    cells[[0, 10, 2499]] = NULL_TIME
+    block_file = _round_trip(tmp_path, cells, NULL_TIME)
+    # A null inside a block breaks the constant step; one without nulls keeps it
+    assert _encodings(block_file) <= {blocks._DELTA, blocks._DELTA2}
+    assert block_file.index['encoding'][1] == blocks._DELTA2
+    assert block_file.index['nulls'].sum() == 3
+    assert block_file.index['min'][0] == cells[1]
+
+
+def test_large_deltas_keep_their_width(tmp_path):
+    cells = np.cumsum(np.random.default_rng(4).integers(-2 ** 40, 2 ** 40, size=1500))
+    _round_trip(tmp_path, cells)
+
+
+def test_all_null_block(tmp_path):
+    cells = np.full(1200, np.nan)
+    cells[1100:] = 5.0
+    block_file = _round_trip(tmp_path, cells)
+    assert np.isnan(block_file.index['min'][0])
+
+
+def test_empty(tmp_path):
+    block_file = _round_trip(tmp_path, np.array([], dtype=np.float64))
+    assert len(block_file.index) == 0
+
+
+@pytest.mark.parametrize('op', ['=', '!=', '<', '<=', '>', '>='])
+def test_select_matches_a_full_scan(tmp_path, op):
+    cells = np.concatenate([np.arange(1000.0), np.full(1000, 7.0), np.arange(1000.0)[::-1]])
+    cells[1500] = np.nan
+    block_file = blocks.write(str(tmp_path / 'cells.bzb'), cells)
+    compare = {'=': np.equal, '!=': np.not_equal, '<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal}[op]
+
+    for value in (-1.0, 7.0, 500.0, 2000.0):
+        expected = compare(cells, value) & ~np.isnan(cells)
+        assert np.array_equal(block_file.select(op, value, lambda values: compare(values, value) & ~np.isnan(values)), expected)
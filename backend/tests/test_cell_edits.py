@@ -0,0 +1,74 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/tests/test_cell_edits.py
+"""A PATCH of cell edits is applied whole or not at all."""
+import pytest
+
+from app import app
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def dataset(client):
+    response = client.post('/api/datasets', json={'name': 'sales', 'rows': [
+        {'region': 'EU', 'revenue': 10},
+        {'region': 'US', 'revenue': 20},
+    ]})
+    created = response.get_json()
+    yield created
+    client.delete(f"/api/datasets/{created['id']}")
+
+
+def _state(client, dataset_id):
+    described = client.get(f'/api/datasets/{dataset_id}').get_json()
+    rows = client.get(f'/api/datasets/{dataset_id}/rows').get_json()
+    history = client.get(f'/api/datasets/{dataset_id}/versions').get_json()
+    return described['version'], rows, history
+
+
+@pytest.mark.parametrize('bad', [
+    {'row': 5, 'column': 'revenue', 'value': 1},
+    {'row': -1, 'column': 'revenue', 'value': 1},
+    {'row': 0, 'column': 'profit', 'value': 1},
+    {'row': 0, 'column': ['revenue'], 'value': 1},
+    {'row': 'first', 'column': 'revenue', 'value': 1},
+    {'column': 'revenue', 'value': 1},
+    'revenue',
+])
+def test_a_bad_edit_leaves_everything_unchanged(client, dataset, bad):
+    before = _state(client, dataset['id'])
+    response = client.patch(f"/api/datasets/{dataset['id']}/cells", json={'edits': [
+        {'row': 0, 'column': 'revenue', 'value': 11},
+        {'row': 1, 'column': 'region', 'value': 'APAC'},
+        bad,
+    ]})
+    assert response.status_code in (400, 404)
+    assert _state(client, dataset['id']) == before
+    assert client.post(f"/api/datasets/{dataset['id']}/undo").status_code == 400
+
+
+def test_computed_columns_cannot_be_edited(client, dataset):
+    assert client.post(f"/api/datasets/{dataset['id']}/columns", json={'name': 'twice', 'expression': 'revenue * 2'}).status_code == 201
+    before = _state(client, dataset['id'])
+    response = client.patch(f"/api/datasets/{dataset['id']}/cells", json={'edits': [
+        {'row': 0, 'column': 'revenue', 'value': 11},
+        {'row': 0, 'column': 'twice', 'value': 1},
+    ]})
+    assert response.status_code == 400
+    assert _state(client, dataset['id']) == before
+
+
+def test_good_edits_are_one_undo_step(client, dataset):
+    before = _state(client, dataset['id'])
+    response = client.patch(f"/api/datasets/{dataset['id']}/cells", json={'edits': [
+        {'row': 0, 'column': 'revenue', 'value': 11},
+        {'row': 1, 'column': 'region', 'value': 'APAC'},
+    ]})
+    assert response.status_code == 200
+    assert response.get_json()['canUndo']
+    client.post(f"/api/datasets/{dataset['id']}/undo")
+    version, rows, _ = _state(client, dataset['id'])
+    assert rows['data'] == before[1]['data']
+    assert version > before[0]
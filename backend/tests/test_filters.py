@@ -0,0 +1,68 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/tests/test_filters.py
+"""Null handling of filter expressions."""
+import pytest
+
+from datastore.filters import FilterError, compile_filter, filter_mask
+from datastore.ingest import read_records
+
+
+@pytest.fixture
+def dataset():
+    return read_records([
+        {'amount': 1, 'region': 'EU', 'day': '2023-05-01'},
+        {'amount': None, 'region': None, 'day': None},
+        {'amount': 3, 'region': 'US', 'day': '2023-05-03'},
+        {'amount': 4, 'region': 'APAC', 'day': '2023-05-04'},
+    ], 'sales')
+
+
+def _rows(dataset, text):
+    return [row for row, selected in enumerate(filter_mask(dataset, text).tolist()) if selected]
+
+
+@pytest.mark.parametrize('column, listed', [
+    ('amount', '(1, 4)'),
+    ('region', "('EU', 'APAC')"),
+    ('day', "('2023-05-01', '2023-05-04')"),
+])
+def test_in_and_not_in_leave_out_nulls(dataset, column, listed):
+    assert _rows(dataset, f'{column} IN {listed}') == [0, 3]
+    assert _rows(dataset, f'{column} NOT IN {listed}') == [2]
+    assert _rows(dataset, f'{column} IS NULL') == [1]
+    assert _rows(dataset, f'{column} IS NOT NULL') == [0, 2, 3]
+
+
+@pytest.mark.parametrize('column, value', [('amount', '3'), ('region', "'US'"), ('day', "'2023-05-03'")])
+def test_not_equal_leaves_out_nulls(dataset, column, value):
+    assert _rows(dataset, f'{column} != {value}') == [0, 3]
+    assert _rows(dataset, f'{column} <> {value}') == [0, 3]
+
+
+def test_not_negates_the_whole_mask(dataset):
+    # NOT is plain negation: the null row matches neither IN nor NOT IN, so NOT (IN) selects it
+    assert _rows(dataset, 'NOT (amount IN (1, 4))') == [1, 2]
+    assert _rows(dataset, 'NOT amount IS NULL') == [0, 2, 3]
+
+
+def test_not_in_an_absent_label(dataset):
+    assert _rows(dataset, "region NOT IN ('LATAM')") == [0, 2, 3]
+
+
+def test_keys_tell_not_in_from_negated_in():
+    assert compile_filter('amount NOT IN (1)').key != compile_filter('NOT amount IN (1)').key
+    assert compile_filter('amount not in (4, 1, 1)').key == compile_filter('amount NOT IN (1, 4)').key
+
+
+def test_edits_change_the_cached_mask(dataset):
+    assert _rows(dataset, 'amount NOT IN (1)') == [2, 3]
+    dataset.set_cell(1, 'amount', 9)
+    assert _rows(dataset, 'amount NOT IN (1)') == [1, 2, 3]
+    dataset.set_cell(2, 'amount', None)
+    assert _rows(dataset, 'amount NOT IN (1)') == [1, 3]
+    assert _rows(dataset, 'amount IS NULL') == [2]
+
+
+@pytest.mark.parametrize('text', ['amount NOT (1)', 'amount NOT IN 1', 'amount IS NOT', 'amount IN ()'])
+def test_malformed(text):
+    with pytest.raises(FilterError):
+        compile_filter(text)
@@ -0,0 +1,36 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/tests/test_ingest.py
+"""An upload extending an earlier one reads as if parsed whole."""
+import io
+
+import pytest
+
+from datastore.ingest import import_csv, read_csv
+from datastore.registry import DatasetStore
+
+BASE = b'day,region,revenue\n' + b''.join(b'2023-01-%02d,EU,%d\n' % (day, day * 10) for day in range(1, 29))
+
+
+@pytest.mark.parametrize('tail, reused', [
+    (b'2023-02-01,US,5\n', 'prefix'),
+    (b'n/a,,\n2023-02-02,APAC,7.5\n', 'prefix'),
+    (b'2023-02-01,US,lots\n', None),
+    # Dates in another layout: a full parse keeps the column as text
+    (b'2023-02-01T10:11,US,5\n', None),
+    (b'2023-02,US,5\n', None),
+    (b'today,US,5\n', None),
+])
+def test_prefix_reuse_matches_a_full_parse(tail, reused):
+    store = DatasetStore()
+    import_csv(store, io.BytesIO(BASE), 'base')
+    dataset, how = import_csv(store, io.BytesIO(BASE + tail), 'extended')
+    full = read_csv(io.BytesIO(BASE + tail), 'full')
+    assert how == reused
+    assert {name: column.kind for name, column in dataset.columns.items()} == {name: column.kind for name, column in full.columns.items()}
+    assert dataset.rows() == full.rows()
+    assert not dataset.history.can_undo
+
+
+def test_identical_upload_is_reused():
+    store = DatasetStore()
+    first, _ = import_csv(store, io.BytesIO(BASE), 'base')
+    assert import_csv(store, io.BytesIO(BASE), 'again') == (first, 'content')
@@ -0,0 +1,43 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/tests/test_live.py
+"""Live subscriptions start late but carry the running state of every row."""
+import numpy as np
+import pytest
+
+from datastore.ingest import read_records
+from datastore.live import Subscription
+
+
+@pytest.fixture
+def dataset():
+    return read_records([{'day': index, 'revenue': float(index)} for index in range(20)], 'sales')
+
+
+def test_new_subscribers_wait_for_appends(dataset):
+    subscription = Subscription(dataset, ['revenue'])
+    assert subscription.next_event() is None
+    dataset.append_rows([{'day': 20, 'revenue': 20.0}])
+    assert subscription.next_event()['start'] == 20
+
+
+@pytest.mark.parametrize('tail', [0, 5, 20, 500])
+def test_tail_sends_only_the_last_rows(dataset, tail):
+    subscription = Subscription(dataset, ['revenue'], tail=tail, cumulative=True, window=3)
+    event = subscription.next_event()
+    if tail == 0:
+        assert event is None
+        return
+    start = max(20 - tail, 0)
+    assert (event['start'], event['end']) == (start, 20)
+    totals = np.cumsum(np.arange(20.0))
+    assert event['series']['revenue']['values'] == totals[start:].tolist()
+    averages = (totals[2:] + totals[1:-1] + totals[:-2]) / 3
+    expected = [None, None] + averages.tolist()
+    np.testing.assert_allclose(
+        [np.nan if value is None else value for value in event['series']['revenue']['movingAverage']],
+        [np.nan if value is None else value for value in expected[start:]],
+    )
+
+
+def test_since_wins_over_tail(dataset):
+    subscription = Subscription(dataset, ['revenue'], since=18, tail=10)
+    assert subscription.next_event()['start'] == 18
@@ -0,0 +1,74 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/tests/test_parallel.py
+"""Work split across the process pool gives the in-process results."""
+import numpy as np
+import pytest
+
+from datastore import aggregate, transforms
+from datastore.parallel import ProcessPool
+
+
+@pytest.fixture(scope='module')
+def workers():
+    # Engaged for any input, with chunks that do not divide it evenly
+    pool = ProcessPool(workers=3, min_rows=0)
+    yield pool
+    # The tests really did go through worker processes
+    assert pool._executor is not None
+    pool.shutdown()
+
+
+def _run(monkeypatch, pool, function, *args):
+    monkeypatch.setattr(aggregate, 'pool', pool)
+    monkeypatch.setattr(transforms, 'pool', pool)
+    return function(*args)
+
+
+def _both(monkeypatch, workers, function, *args):
+    serial = _run(monkeypatch, ProcessPool(workers=1), function, *args)
+    parallel = _run(monkeypatch, workers, function, *args)
+    return serial, parallel
+
+
+@pytest.fixture
+def series():
+    generator = np.random.default_rng(7)
+    values = generator.normal(100, 30, size=10_001)
+    values[generator.random(len(values)) < 0.05] = np.nan
+    return values
+
+
+@pytest.mark.parametrize('how', aggregate.AGGREGATES)
+def test_reduce_groups(monkeypatch, workers, series, how):
+    codes = np.random.default_rng(8).integers(0, 40, size=len(series))
+    # Group 39 only has rows in the last chunk, group 40 has none
+    codes[codes == 39] = 0
+    codes[-5:] = 39
+    weights = None if how == 'count' else np.nan_to_num(series)
+    (serial, serial_counts), (parallel, parallel_counts) = _both(monkeypatch, workers, aggregate.reduce_groups, codes, 41, how, weights)
+    np.testing.assert_array_equal(parallel_counts, serial_counts)
+    np.testing.assert_allclose(parallel, serial, rtol=1e-12, equal_nan=True)
+    assert np.isnan(parallel[40]) if how != 'count' else parallel[40] == 0
+
+
+def test_too_many_groups_stay_in_process(monkeypatch, workers):
+    codes = np.arange(30)
+    result, counts = _run(monkeypatch, workers, aggregate.reduce_groups, codes, 30, 'sum', np.ones(30))
+    np.testing.assert_array_equal(result, np.ones(30))
+    np.testing.assert_array_equal(counts, np.ones(30))
+
+
+@pytest.mark.parametrize('function, args', [
+    (transforms.normalize, ()),
+    (transforms.cumulative, ()),
+    (transforms.percentage, ()),
+    (transforms.moving_average, (7,)),
+])
+def test_transforms(monkeypatch, workers, series, function, args):
+    serial, parallel = _both(monkeypatch, workers, function, series, *args)
+    np.testing.assert_allclose(parallel, serial, rtol=1e-9, equal_nan=True)
+
+
+def test_all_null_series(monkeypatch, workers):
+    values = np.full(100, np.nan)
+    serial, parallel = _both(monkeypatch, workers, transforms.normalize, values)
+    np.testing.assert_array_equal(parallel, serial)
@@ -0,0 +1,28 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/tests/test_query.py
+"""Batched series match the transforms applied to exactly the selected rows."""
+import numpy as np
+import pytest
+
+from datastore.ingest import read_records
+from datastore.query import run_batch
+from datastore.registry import DatasetStore
+from datastore.transforms import apply_transforms
+
+
+@pytest.fixture
+def store():
+    store = DatasetStore()
+    store.add(read_records([{'month': index, 'revenue': float(index * index)} for index in range(100)], 'sales'))
+    return store
+
+
+@pytest.mark.parametrize('transform', ['normalize', 'percentage'])
+@pytest.mark.parametrize('start, end', [(0, None), (-50, None), (-60, -10), (10, 40), (0, 500), (-500, None)])
+def test_ranges_use_their_own_rows(store, transform, start, end):
+    dataset = store.list()[0]
+    spec = {'dataset': dataset.id, 'column': 'revenue', 'transforms': {transform: True}, 'start': start}
+    if end is not None:
+        spec['end'] = end
+    result = run_batch(store, [spec], align='index')
+    expected, _ = apply_transforms(dataset.columns['revenue'].values[start:end], {transform: True})
+    np.testing.assert_allclose(result['series'][0]['values'], expected)
@@ -0,0 +1,64 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/tests/test_timeparse.py
+"""Date columns are only recognised when every cell fits one format."""
+import numpy as np
+import pytest
+
+from datastore.column import Column
+from datastore.timeparse import FORMATS_BY_NAME, GUESS_SAMPLE, NULL_TIME, format_times, guess_format
+
+
+def _text(cells):
+    return np.array(cells, dtype=str)
+
+
+@pytest.mark.parametrize('name, cells, expected', [
+    ('iso-date', ['2023-05-01', '2024-02-29'], ['2023-05-01', '2024-02-29']),
+    ('iso-month', ['2023-05', '1999-12'], ['2023-05', '1999-12']),
+    ('iso-minute', ['2023-05-01T10:11', '2023-05-01 23:59'], ['2023-05-01T10:11', '2023-05-01T23:59']),
+    ('us-date', ['5/1/2023', '12/31/2023'], ['2023-05-01', '2023-12-31']),
+    ('eu-date', ['1.5.2023', '31.12.2023'], ['2023-05-01', '2023-12-31']),
+])
+def test_parse_round_trip(name, cells, expected):
+    time_format = FORMATS_BY_NAME[name]
+    assert guess_format(_text(cells)) is time_format
+    values = time_format.parse(_text(cells))
+    assert values.dtype == np.int64
+    assert format_times(values, time_format.granularity).tolist() == expected
+
+
+@pytest.mark.parametrize('name, cells, odd', [
+    ('iso-date', ['2023-05-01', '2023-05-02'], 'today'),
+    ('iso-date', ['2023-05-01', '2023-05-02'], '2023-05-01T10:11'),
+    ('iso-date', ['2023-05-01', '2023-05-02'], '2023-05'),
+    ('iso-month', ['2023-05', '2023-06'], '2023-05-01'),
+    ('us-date', ['5/1/2023', '5/2/2023'], '2023-05-01'),
+    ('eu-date', ['1.5.2023', '2.5.2023'], '1/5/2023'),
+])
+def test_parse_rejects_a_cell_of_another_shape(name, cells, odd):
+    with pytest.raises(ValueError):
+        FORMATS_BY_NAME[name].parse(_text(cells + [odd]))
+
+
+def test_parse_rejects_impossible_dates():
+    with pytest.raises(ValueError):
+        FORMATS_BY_NAME['iso-date'].parse(_text(['2023-05-01', '2023-02-30']))
+
+
+def test_parse_empty():
+    assert FORMATS_BY_NAME['iso-date'].parse(_text([])).tolist() == []
+
+
+@pytest.mark.parametrize('odd', ['today', '2023-05-01T10:11', '2023/05/01'])
+def test_odd_cell_past_the_sample_keeps_the_column_as_text(odd):
+    # The guess only looks at the first GUESS_SAMPLE cells
+    cells = [f'2023-01-{day % 28 + 1:02d}' for day in range(GUESS_SAMPLE * 2)] + [odd]
+    column = Column.from_values('day', cells)
+    assert column.kind == 'string'
+    assert column.to_list()[-1] == odd
+
+
+def test_nulls_among_dates():
+    column = Column.from_values('day', ['2023-05-01', None, 'n/a', '2023-05-03'])
+    assert column.kind == 'datetime'
+    assert column.values[1] == column.values[2] == NULL_TIME
+    assert column.to_list() == ['2023-05-01', None, None, '2023-05-03']
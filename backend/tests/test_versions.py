@@ -0,0 +1,127 @@
+# FILE: ~/Downloads/my work/bizcharts/backend/tests/test_versions.py
+"""Undo, redo and compare agree with replaying the edits on a fresh copy."""
+import random
+
+import pytest
+
+from datastore import versions
+from datastore.errors import DatasetError
+from datastore.ingest import read_records
+
+ROWS = 30
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # Edits land in several chunks, and appends cross chunk boundaries
+    monkeypatch.setattr(versions, 'CHUNK_ROWS', 8)
+
+
+def _records():
+    return [
+        {'day': f'2023-01-{row % 28 + 1:02d}', 'region': 'EU' if row % 3 else 'US', 'revenue': float(row * 10)}
+        for row in range(ROWS)
+    ]
+
+
+def _edits(seed, count):
+    generator = random.Random(seed)
+    edits = []
+    for _ in range(count):
+        kind = generator.choice(['number', 'number', 'text', 'null', 'append', 'computed'])
+        if kind == 'append':
+            edits.append(('append', [{'revenue': generator.randint(0, 99), 'region': 'APAC'} for _ in range(generator.randint(1, 12))]))
+        elif kind == 'computed':
+            edits.append(('computed', None))
+        else:
+            value = {'number': generator.uniform(-5, 5), 'text': 'n/a', 'null': None}[kind]
+            edits.append(('cell', (generator.randrange(ROWS), generator.choice(['revenue', 'region', 'day']), value)))
+    return edits
+
+
+def _apply(dataset, edit):
+    kind, payload = edit
+    if kind == 'append':
+        dataset.append_rows(payload)
+    elif kind == 'computed':
+        if 'double' in dataset.columns:
+            dataset.remove_computed('double')
+        elif dataset.columns['revenue'].kind == 'number':
+            dataset.add_computed('double', 'revenue * 2')
+    else:
+        row, column, value = payload
+        if column == 'day' and value == 'n/a':
+            value = '2024-02-29'
+        dataset.set_cell(row, column, value)
+
+
+def _state(dataset):
+    return {
+        'rows': dataset.rows(orient='columns'),
+        'kinds': {name: column.kind for name, column in dataset.columns.items()},
+        'nulls': {name: column.stats.null_count for name, column in dataset.columns.items()},
+    }
+
+
+def _replayed(edits):
+    dataset = read_records(_records(), 'replay')
+    for edit in edits:
+        _apply(dataset, edit)
+    return _state(dataset)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_undo_redo_and_compare_match_a_replay(seed):
+    edits = _edits(seed, 12)
+    dataset = read_records(_records(), 'edited')
+    versions_seen = [dataset.version]
+    for edit in edits:
+        _apply(dataset, edit)
+        versions_seen.append(dataset.version)
+    assert _state(dataset) == _replayed(edits)
+
+    for done in range(len(edits) - 1, -1, -1):
+        dataset.undo()
+        assert _state(dataset) == _replayed(edits[:done])
+    assert not dataset.history.can_undo
+    with pytest.raises(DatasetError):
+        dataset.undo()
+
+    for done in range(1, len(edits) + 1):
+        dataset.redo()
+        assert _state(dataset) == _replayed(edits[:done])
+    assert not dataset.history.can_redo
+
+    # Every named version compares against the state replaying its edits gives
+    now = _state(dataset)
+    for done, version in enumerate(versions_seen):
+        then = _replayed(edits[:done])
+        report = dataset.compare(version)
+        assert report['rows'] == {'then': len(next(iter(then['rows'].values()))), 'now': dataset.row_count}
+        reported = {(cell['row'], cell['column']): (cell['then'], cell['now']) for cell in report['cells']}
+        for (row, column), (before, after) in reported.items():
+            assert then['rows'][column][row] == before
+            assert now['rows'][column][row] == after
+        # Columns that were replaced, added or removed are reported whole
+        whole = {change['name'] for change in report['columns']}
+        differing = {
+            (row, name)
+            for name, kind in now['kinds'].items()
+            if name not in whole and kind == then['kinds'].get(name) and dataset.columns[name].expression is None
+            for row, (before, after) in enumerate(zip(then['rows'][name], now['rows'][name]))
+            if before != after
+        }
+        assert set(reported) == differing
+        assert report['changedCells'] == len(differing)
+
+
+def test_a_new_edit_drops_the_undone_steps():
+    dataset = read_records(_records(), 'edited')
+    dataset.set_cell(0, 'revenue', 1.0)
+    undone = dataset.version
+    dataset.set_cell(1, 'revenue', 2.0)
+    dataset.undo()
+    dataset.set_cell(2, 'revenue', 3.0)
+    assert not dataset.history.can_redo
+    assert _state(dataset) == _replayed([('cell', (0, 'revenue', 1.0)), ('cell', (2, 'revenue', 3.0))])
+    assert dataset.compare(undone)['changedCells'] == 1
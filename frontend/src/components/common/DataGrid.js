@@ -186,11 +186,43 @@ const DataGrid = () => {
     document.body.removeChild(link);
   };
 
+  // Import Parquet or Excel through the backend, which parses them columnar
+  const importOnServer = async (file) => {
+    try {
+      const form = new FormData();
+      form.append('file', file);
+      const upload = await fetch('/api/datasets', { method: 'POST', body: form });
+      const dataset = await upload.json();
+      if (!upload.ok) throw new Error(dataset.error);
+
+      const response = await fetch(`/api/datasets/${dataset.id}/rows`);
+      const { data } = await response.json();
+      if (data && data.length > 0) {
+        setChartData(data);
+        setXAxisKey(dataset.xAxisKey);
+        if (dataset.yAxisKeys.length > 0) {
+          setYAxisKeys(dataset.yAxisKeys);
+        }
+      }
+    } catch (error) {
+      console.error('Error importing file:', error);
+      alert(`Failed to import ${file.name}. ${error.message || ''}`);
+    }
+  };
+
   // Import CSV
   const importCsv = (e) => {
     const file = e.target.files[0];
     if (!file) return;
 
+    if (!file.name.toLowerCase().endsWith('.csv')) {
+      importOnServer(file);
+      if (fileInputRef.current) {
+        fileInputRef.current.value = null;
+      }
+      return;
+    }
+
     const reader = new FileReader();
     reader.onload = (event) => {
       try {
@@ -254,16 +286,16 @@ const DataGrid = () => {
   if (chartData.length === 0) {
     return (
       <div className="data-grid-empty">
-        <p>No data available. Import a CSV file or add data manually.</p>
+        <p>No data available. Import a CSV, Parquet or Excel file or add data manually.</p>
         <div className="data-grid-actions">
           <button onClick={addColumn}>Add Column</button>
           <button onClick={addRow}>Add Row</button>
           <button onClick={renderSampleData}>Use Sample Data</button>
           <label className="csv-import-label">
-            Import CSV
+            Import File
             <input
               type="file"
-              accept=".csv"
+              accept=".csv,.parquet,.xlsx"
               onChange={importCsv}
               style={{ display: 'none' }}
               ref={fileInputRef}
@@ -287,10 +319,10 @@ const DataGrid = () => {
           Export CSV
         </button>
         <label className="csv-import-label">
-          Import CSV
+          Import File
           <input
             type="file"
-            accept=".csv"
+            accept=".csv,.parquet,.xlsx"
             onChange={importCsv}
             style={{ display: 'none' }}
             ref={fileInputRef}
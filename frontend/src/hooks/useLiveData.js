@@ -0,0 +1,132 @@
+// FILE: ~/Downloads/my work/bizcharts/frontend/src/hooks/useLiveData.js
+import { useState, useEffect } from 'react';
+
+// Dataset row number of each live row; a symbol key stays out of the chart data
+const ROW = Symbol('row');
+
+/**
+ * Custom hook for live-appended chart data
+ * Subscribes to a dataset's Server-Sent Events stream and appends only the
+ * new rows, batching bursts into one state update per animation frame.
+ * @param {string} datasetId - Backend dataset ID (nothing happens while empty)
+ * @param {Object} options - Stream options
+ * @returns {Object} - Live rows (chartData shape), running totals and the
+ *   error that stopped the stream, if any
+ */
+const useLiveData = (datasetId, {
+  columns = [],
+  xAxisKey = null,
+  cumulative = false,
+  movingAverageWindow = null,
+  maxRows = 1000
+} = {}) => {
+  const [rows, setRows] = useState([]);
+  const [totals, setTotals] = useState({});
+  const [connected, setConnected] = useState(false);
+  const [error, setError] = useState(null);
+
+  const columnList = columns.join(',');
+
+  useEffect(() => {
+    if (!datasetId) return undefined;
+
+    // Only the rows the chart keeps; the server seeds cumulative sums and
+    // moving averages from the rows before them
+    const params = new URLSearchParams({ tail: String(maxRows) });
+    if (columnList) params.set('columns', columnList);
+    if (xAxisKey) params.set('x', xAxisKey);
+    if (cumulative) params.set('cumulative', 'true');
+    if (movingAverageWindow) params.set('window', String(movingAverageWindow));
+
+    const source = new EventSource(`/api/datasets/${datasetId}/stream?${params}`);
+    let pending = [];
+    let latestTotals = null;
+    let truncateAt = null;
+    let frame = null;
+
+    const flush = () => {
+      frame = null;
+      const batch = pending;
+      const cut = truncateAt;
+      pending = [];
+      truncateAt = null;
+
+      // Keep at most maxRows so rendering cost stays flat as the feed runs
+      setRows(prev => {
+        const kept = cut === null ? prev : prev.filter(row => row[ROW] < cut);
+        const next = kept.concat(batch);
+        return next.length > maxRows ? next.slice(next.length - maxRows) : next;
+      });
+
+      if (latestTotals) {
+        setTotals(latestTotals);
+        latestTotals = null;
+      }
+    };
+
+    source.onopen = () => setConnected(true);
+    source.onerror = () => setConnected(false);
+
+    // The server ends the feed when an edit turns a streamed column into text
+    source.addEventListener('stopped', (event) => {
+      source.close();
+      setConnected(false);
+      setError(JSON.parse(event.data).error);
+    });
+
+    source.addEventListener('rows', (event) => {
+      const payload = JSON.parse(event.data);
+
+      if (payload.truncated) {
+        // Appended rows were undone: drop everything from payload.start on
+        truncateAt = truncateAt === null ? payload.start : Math.min(truncateAt, payload.start);
+        pending = pending.filter(row => row[ROW] < payload.start);
+        latestTotals = payload.totals;
+        if (frame === null) {
+          frame = requestAnimationFrame(flush);
+        }
+        return;
+      }
+
+      const count = payload.end - payload.start;
+
+      for (let i = 0; i < count; i++) {
+        const row = { [ROW]: payload.start + i };
+        if (payload.x) {
+          row[xAxisKey || 'x'] = payload.x[i];
+        }
+        Object.entries(payload.series).forEach(([key, series]) => {
+          row[key] = series.values[i];
+          if (series.movingAverage) {
+            row[`${key}_MA`] = series.movingAverage[i];
+          }
+        });
+        pending.push(row);
+      }
+
+      latestTotals = payload.totals;
+      if (frame === null) {
+        frame = requestAnimationFrame(flush);
+      }
+    });
+
+    return () => {
+      source.close();
+      if (frame !== null) {
+        cancelAnimationFrame(frame);
+      }
+      setRows([]);
+      setConnected(false);
+      setError(null);
+    };
+  }, [datasetId, columnList, xAxisKey, cumulative, movingAverageWindow, maxRows]);
+
+  return {
+    rows,
+    totals,
+    connected,
+    error
+  };
+};
+
+export default useLiveData;
@@ -212,6 +212,48 @@ export const exportToCSV = (options) => {
   return true;
 };
 
+/**
+ * Export a backend dataset as CSV or XLSX, streamed by the server
+ * The browser writes the download straight to disk, so large datasets never
+ * have to fit in page memory.
+ * @param {Object} options - Export options
+ * @param {string} options.datasetId - Backend dataset ID
+ * @param {string} options.format - 'csv' or 'xlsx'
+ * @param {string} options.chartTitle - Chart title for filename
+ * @param {Array} options.yAxisKeys - Series columns that transforms and formatting apply to
+ * @param {Object} options.transforms - Same shape as the useChartData transforms state
+ * @param {Object} options.formatOptions - Same shape as the ChartContext formatOptions state
+ * @param {string} options.filter - Filter expression, e.g. "revenue > 50000"
+ * @param {string} options.sortBy - Column to sort by
+ * @param {string} options.sortOrder - 'ascending' or 'descending'
+ */
+export const exportFromServer = (options) => {
+  const {
+    datasetId, format = 'csv', chartTitle, yAxisKeys, transforms, formatOptions, filter, sortBy, sortOrder
+  } = options;
+
+  if (!datasetId) {
+    throw new Error('No dataset to export');
+  }
+
+  const params = new URLSearchParams();
+  if (chartTitle) params.set('filename', chartTitle);
+  if (yAxisKeys && yAxisKeys.length) params.set('y', yAxisKeys.join(','));
+  if (transforms) params.set('transforms', JSON.stringify(transforms));
+  if (formatOptions) params.set('formatOptions', JSON.stringify(formatOptions));
+  if (filter) params.set('filter', filter);
+  if (sortBy) params.set('sort', sortBy);
+  if (sortOrder) params.set('order', sortOrder);
+
+  const link = document.createElement('a');
+  link.href = `/api/datasets/${datasetId}/export.${format}?${params}`;
+  link.style.visibility = 'hidden';
+  document.body.appendChild(link);
+  link.click();
+  document.body.removeChild(link);
+  return true;
+};
+
 /**
  * Generate embed code for the chart
  * @param {Object} options - Export options
@@ -40,6 +40,13 @@ gunicorn==21.2.0
 python-dotenv==1.0.0
 pytest==7.4.0
 requests==2.31.0
+numpy==1.26.4
+# Parquet and Excel uploads (.parquet / .xlsx are refused without them)
+pyarrow==15.0.2
+openpyxl==3.1.2
+# Faster codecs for spilled column blocks (zlib is used without them)
+zstandard==0.22.0
+lz4==4.3.3
 EOF
 echo "Updated requirements.txt created."
 